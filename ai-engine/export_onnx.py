@@ -0,0 +1,246 @@
+import os
+import json
+import argparse
+import torch
+from torch import nn
+from transformers import DonutProcessor, VisionEncoderDecoderModel
+
+# ==============================================================================
+# Donut 영수증 모델 -> ONNX / TorchScript 내보내기
+#
+#   python export_onnx.py --model HYPER-KJY/academy-receipt-model --output ../web-service/model_export
+#   python export_onnx.py --model ../web-service/model_snapshot --format torchscript
+#
+# 결과 폴더
+#   encoder.onnx : pixel_values -> 레이어별 cross-attention K/V (이미지당 한 번만 계산)
+#   decoder.onnx : 토큰 + self-attention KV 캐시 -> 마지막 위치 logits + 갱신된 KV 캐시
+#   tokenizer.json, export_config.json : transformers 없이 전처리/디코딩하기 위한 설정
+# 웹 서비스에서는 settings.INFERENCE_BACKEND = 'onnx' (또는 'torchscript') 로 사용합니다.
+# (web-service/core/onnx_backend.py)
+# ==============================================================================
+MODEL_ID = "HYPER-KJY/academy-receipt-model"
+OUTPUT_DIR = "model_export"
+TASK_PROMPT = "<s_receipt>"
+MAX_LENGTH = 768
+OPSET = 17
+
+def load_model(model_source):
+    # 1. 프로세서 로드 (설정 파일 누락 대비 Fallback)
+    try:
+        processor = DonutProcessor.from_pretrained(model_source)
+    except OSError:
+        print("⚠️ 프로세서 설정이 없어 기본값(donut-base)을 사용합니다.")
+        processor = DonutProcessor.from_pretrained("naver-clova-ix/donut-base")
+        processor.tokenizer.add_tokens([TASK_PROMPT, "</s_receipt>"])
+
+    # 2. 모델 로드
+    model = VisionEncoderDecoderModel.from_pretrained(model_source)
+    model.decoder.resize_token_embeddings(len(processor.tokenizer))
+    model.eval()
+    return model, processor
+
+# ==============================================================================
+# 1. 내보내기용 래퍼 (KV 캐시를 텐서로 직접 주고받음)
+# ==============================================================================
+def _split_heads(x, num_heads):
+    batch, length, dim = x.shape
+    return x.view(batch, length, num_heads, dim // num_heads).transpose(1, 2)
+
+def _attention(query, key, value, scaling, mask=None):
+    weights = torch.matmul(query * scaling, key.transpose(-1, -2))
+    if mask is not None:
+        weights = weights + mask
+    weights = torch.softmax(weights, dim=-1)
+    output = torch.matmul(weights, value)
+    batch, heads, length, head_dim = output.shape
+    return output.transpose(1, 2).reshape(batch, length, heads * head_dim)
+
+class EncoderWrapper(nn.Module):
+    """ 이미지 -> 디코더 레이어별 cross-attention (K, V). 디코딩 스텝마다 다시 계산하지 않도록 미리 뽑아둠 """
+
+    def __init__(self, model):
+        super().__init__()
+        self.encoder = model.encoder
+        self.enc_to_dec_proj = getattr(model, "enc_to_dec_proj", None)
+        self.layers = model.decoder.model.decoder.layers
+        self.num_heads = model.config.decoder.decoder_attention_heads
+
+    def forward(self, pixel_values):
+        hidden = self.encoder(pixel_values=pixel_values).last_hidden_state
+        if self.enc_to_dec_proj is not None:
+            hidden = self.enc_to_dec_proj(hidden)
+        outputs = []
+        for layer in self.layers:
+            outputs.append(_split_heads(layer.encoder_attn.k_proj(hidden), self.num_heads))
+            outputs.append(_split_heads(layer.encoder_attn.v_proj(hidden), self.num_heads))
+        return tuple(outputs)
+
+class DecoderStepWrapper(nn.Module):
+    """
+    MBart 디코더 한 스텝 (transformers Cache 객체 대신 KV 텐서를 그대로 입출력).
+    입력: input_ids (B, T), cross K/V (레이어별), past self K/V (레이어별, 길이 P)
+    출력: 마지막 위치 logits (B, V), present self K/V (레이어별, 길이 P+T)
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        config = model.config.decoder
+        decoder = model.decoder.model.decoder
+        self.embed_tokens = decoder.embed_tokens
+        self.embed_positions = decoder.embed_positions
+        self.layernorm_embedding = decoder.layernorm_embedding
+        self.layers = decoder.layers
+        self.layer_norm = decoder.layer_norm
+        self.lm_head = model.decoder.lm_head
+        self.num_heads = config.decoder_attention_heads
+        self.embed_scale = config.d_model ** 0.5 if config.scale_embedding else 1.0
+        self.scaling = (config.d_model // config.decoder_attention_heads) ** -0.5
+        self.position_offset = getattr(self.embed_positions, "offset", 2)
+
+    def forward(self, input_ids, *caches):
+        num_layers = len(self.layers)
+        cross = caches[:2 * num_layers]
+        past = caches[2 * num_layers:]
+
+        past_length = past[0].shape[2]
+        length = input_ids.shape[1]
+        positions = torch.arange(length, device=input_ids.device) + past_length
+
+        # embed_tokens 가 스케일을 내장한 경우(MBartScaledWordEmbedding)와 아닌 경우 모두 같은 결과가 되도록 weight 를 직접 사용
+        hidden = nn.functional.embedding(input_ids, self.embed_tokens.weight) * self.embed_scale
+        hidden = hidden + nn.functional.embedding(positions + self.position_offset, self.embed_positions.weight)
+        hidden = self.layernorm_embedding(hidden)
+
+        # 프롬프트가 여러 토큰일 때를 위한 causal mask (쿼리 위치 >= 키 위치만 허용)
+        key_positions = torch.arange(past_length + length, device=input_ids.device)
+        mask = (key_positions[None, :] > positions[:, None]).to(hidden.dtype) * torch.finfo(hidden.dtype).min
+
+        presents = []
+        for i, layer in enumerate(self.layers):
+            residual = hidden
+            hidden = layer.self_attn_layer_norm(hidden)
+            key = torch.cat([past[2 * i], _split_heads(layer.self_attn.k_proj(hidden), self.num_heads)], dim=2)
+            value = torch.cat([past[2 * i + 1], _split_heads(layer.self_attn.v_proj(hidden), self.num_heads)], dim=2)
+            presents += [key, value]
+            query = _split_heads(layer.self_attn.q_proj(hidden), self.num_heads)
+            hidden = residual + layer.self_attn.out_proj(_attention(query, key, value, self.scaling, mask))
+
+            residual = hidden
+            hidden = layer.encoder_attn_layer_norm(hidden)
+            query = _split_heads(layer.encoder_attn.q_proj(hidden), self.num_heads)
+            hidden = residual + layer.encoder_attn.out_proj(
+                _attention(query, cross[2 * i], cross[2 * i + 1], self.scaling)
+            )
+
+            residual = hidden
+            hidden = layer.final_layer_norm(hidden)
+            hidden = residual + layer.fc2(layer.activation_fn(layer.fc1(hidden)))
+
+        hidden = self.layer_norm(hidden[:, -1:, :])
+        logits = self.lm_head(hidden)[:, 0, :]
+        return (logits, *presents)
+
+# ==============================================================================
+# 2. 내보내기
+# ==============================================================================
+def _names(prefix, num_layers):
+    names = []
+    for i in range(num_layers):
+        names += [f"{prefix}_key_{i}", f"{prefix}_value_{i}"]
+    return names
+
+def export(model_source, output_dir, export_format="onnx"):
+    print(f"🔥 모델 로드 중... ({model_source})")
+    model, processor = load_model(model_source)
+    os.makedirs(output_dir, exist_ok=True)
+
+    config = model.config.decoder
+    num_layers = config.decoder_layers
+    num_heads = config.decoder_attention_heads
+    head_dim = config.d_model // num_heads
+    size = processor.image_processor.size
+    height, width = size["height"], size["width"]
+
+    encoder = EncoderWrapper(model).eval()
+    decoder = DecoderStepWrapper(model).eval()
+
+    # 예시 입력 (배치 2, 과거 길이 3 -> 동적 축으로 내보냄)
+    pixel_values = torch.randn(2, 3, height, width)
+    with torch.no_grad():
+        cross = encoder(pixel_values)
+    input_ids = torch.ones(2, 1, dtype=torch.long)
+    past = tuple(torch.zeros(2, num_heads, 3, head_dim) for _ in range(2 * num_layers))
+
+    cross_names, past_names, present_names = (
+        _names("cross", num_layers), _names("past", num_layers), _names("present", num_layers)
+    )
+
+    if export_format == "onnx":
+        print("📦 encoder.onnx 내보내는 중...")
+        torch.onnx.export(
+            encoder, (pixel_values,), os.path.join(output_dir, "encoder.onnx"),
+            input_names=["pixel_values"], output_names=cross_names,
+            dynamic_axes={"pixel_values": {0: "batch"}, **{n: {0: "batch"} for n in cross_names}},
+            opset_version=OPSET, dynamo=False,
+        )
+        print("📦 decoder.onnx 내보내는 중...")
+        torch.onnx.export(
+            decoder, (input_ids, *cross, *past), os.path.join(output_dir, "decoder.onnx"),
+            input_names=["input_ids", *cross_names, *past_names],
+            output_names=["logits", *present_names],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "length"},
+                "logits": {0: "batch"},
+                **{n: {0: "batch", 2: "encoder_length"} for n in cross_names},
+                **{n: {0: "batch", 2: "past_length"} for n in past_names},
+                **{n: {0: "batch", 2: "total_length"} for n in present_names},
+            },
+            opset_version=OPSET, dynamo=False,
+        )
+    elif export_format == "torchscript":
+        print("📦 encoder.pt / decoder.pt (TorchScript) 내보내는 중...")
+        with torch.no_grad():
+            torch.jit.trace(encoder, (pixel_values,)).save(os.path.join(output_dir, "encoder.pt"))
+            torch.jit.trace(decoder, (input_ids, *cross, *past)).save(os.path.join(output_dir, "decoder.pt"))
+    else:
+        raise ValueError(f"지원하지 않는 형식입니다: {export_format}")
+
+    # 3. transformers 없이 전처리/디코딩하기 위한 설정
+    tokenizer = processor.tokenizer
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, "tokenizer.json"))
+    image_processor = processor.image_processor
+    export_config = {
+        "format": export_format,
+        "model_id": str(model_source),
+        "image": {
+            "height": height,
+            "width": width,
+            "mean": list(image_processor.image_mean),
+            "std": list(image_processor.image_std),
+            "do_align_long_axis": bool(getattr(image_processor, "do_align_long_axis", False)),
+            "do_thumbnail": bool(getattr(image_processor, "do_thumbnail", True)),
+            "do_pad": bool(getattr(image_processor, "do_pad", True)),
+        },
+        "decoder": {"num_layers": num_layers, "num_heads": num_heads, "head_dim": head_dim},
+        "tokens": {
+            "prompt_ids": tokenizer(TASK_PROMPT, add_special_tokens=False).input_ids,
+            "eos_id": tokenizer.eos_token_id,
+            "pad_id": tokenizer.pad_token_id,
+            "unk_id": tokenizer.unk_token_id,
+            "eos_token": tokenizer.eos_token,
+            "pad_token": tokenizer.pad_token,
+        },
+        "max_length": MAX_LENGTH,
+    }
+    with open(os.path.join(output_dir, "export_config.json"), "w", encoding="utf-8") as f:
+        json.dump(export_config, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ 내보내기 완료: {output_dir}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Donut 영수증 모델 ONNX / TorchScript 내보내기")
+    parser.add_argument("--model", default=MODEL_ID, help="Hub 모델 ID 또는 로컬 스냅샷 폴더")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--format", choices=["onnx", "torchscript"], default="onnx")
+    args = parser.parse_args()
+    export(args.model, args.output, args.format)
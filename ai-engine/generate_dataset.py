@@ -1,35 +1,60 @@
 import os
+import io
 import random
 import json
 import glob
+import time
+import argparse
+import functools
+import multiprocessing
 import numpy as np
 import cv2
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import albumentations as A
 from faker import Faker
 
+import receipt_shards
+
 # 설정
 DATASET_DIR = "dataset/multi_receipt_train"
-os.makedirs(f"{DATASET_DIR}/images", exist_ok=True)
-os.makedirs(f"{DATASET_DIR}/labels", exist_ok=True)
+NUM_IMAGES = 5000
 
 fake = Faker('ko_KR')
 
+def seed_image(seed, index):
+    """
+    영수증마다 (seed, 번호) 로 난수를 다시 맞춥니다.
+    같은 seed 면 워커 수 / 처리 순서와 상관없이 같은 번호의 영수증은 같은 이미지/라벨
+    """
+    state = int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+    random.seed(state)
+    np.random.seed(state)
+    fake.seed_instance(state)
+    # 자체 난수를 쓰는 albumentations 버전(1.4 이후)도 같이 맞춤
+    transform = get_transform()
+    if hasattr(transform, "set_random_seed"):
+        transform.set_random_seed(state)
+
 # 1. 폰트 로드 (폰트가 없으면 에러나니 꼭 fonts 폴더 확인)
 FONT_GOTHIC = "fonts/NanumGothic.ttf"
-HAND_FONTS = glob.glob("fonts/*.ttf")
+HAND_FONTS = sorted(glob.glob("fonts/*.ttf"))  # 순서 고정 (seed 재현성)
 if not HAND_FONTS: HAND_FONTS = [FONT_GOTHIC]
 
-def get_random_font(size):
-    # 손글씨 중에서도 좀 두껍거나 휘갈기는 폰트를 선호하도록 로직 구성 가능
-    font_path = random.choice(HAND_FONTS)
+# 같은 (폰트, 크기)는 TTF 를 다시 열지 않도록 프로세스(워커)마다 캐시
+@functools.lru_cache(maxsize=None)
+def load_font(font_path, size):
     try:
         return ImageFont.truetype(font_path, size)
-    except:
+    except OSError:
         return ImageFont.truetype(FONT_GOTHIC, size)
 
+def get_random_font(size):
+    # 손글씨 중에서도 좀 두껍거나 휘갈기는 폰트를 선호하도록 로직 구성 가능
+    font_path = random.choice(HAND_FONTS)
+    return load_font(font_path, size)
+
 def get_gothic_font(size):
-    return ImageFont.truetype(FONT_GOTHIC, size)
+    return load_font(FONT_GOTHIC, size)
 
 # 금액 표기법 (만원, 콤마 등)
 def format_money(amount):
@@ -140,10 +165,38 @@ def draw_memo_receipt(draw, width):
     return y + 100, {"student": student, "amount": price, "date": f"2025-{m:02d}-{d:02d}", "type": "memo"}
 
 
+# ==============================================================================
+# 증강 파이프라인 (프로세스마다 한 번만 만들어 재사용)
+# ==============================================================================
+_transform = None
+
+def get_transform():
+    global _transform
+    if _transform is None:
+        _transform = A.Compose([
+            # 1. 글자 비틀기 (악필 효과)
+            A.ElasticTransform(alpha=1, sigma=50, alpha_affine=10, p=0.7),
+            
+            # 2. 잉크 번짐/흐림 효과 (Erosion/Dilation/Blur)
+            A.OneOf([
+                A.GaussianBlur(blur_limit=(3, 5), p=1.0),
+                A.MotionBlur(blur_limit=5, p=1.0),
+            ], p=0.5),
+            
+            # 3. 조명/노이즈
+            A.RandomBrightnessContrast(p=0.5),
+            A.GaussNoise(var_limit=(10.0, 50.0), p=0.4),
+            
+            # 4. 회전 (사진 찍을 때 삐뚤어짐)
+            A.Rotate(limit=10, p=1.0, border_mode=cv2.BORDER_REPLICATE)
+        ])
+    return _transform
+
 # ==============================================================================
 # 통합 생성기 (노이즈 강화)
 # ==============================================================================
-def create_receipt_image(index):
+def make_receipt():
+    """ 영수증 한 장 -> (PIL 이미지, 라벨 dict). 저장하지 않음 """
     width = 450
     height = 600 # 넉넉하게
     
@@ -170,38 +223,162 @@ def create_receipt_image(index):
     # --------------------------------------------------------------------------
     # ★ 핵심 기술: 글자 뭉개기 (Realism Augmentation)
     # --------------------------------------------------------------------------
-    img_np = np.array(image)
-    
-    transform = A.Compose([
-        # 1. 글자 비틀기 (악필 효과)
-        A.ElasticTransform(alpha=1, sigma=50, alpha_affine=10, p=0.7),
-        
-        # 2. 잉크 번짐/흐림 효과 (Erosion/Dilation/Blur)
-        A.OneOf([
-            A.GaussianBlur(blur_limit=(3, 5), p=1.0),
-            A.MotionBlur(blur_limit=5, p=1.0),
-        ], p=0.5),
-        
-        # 3. 조명/노이즈
-        A.RandomBrightnessContrast(p=0.5),
-        A.GaussNoise(var_limit=(10.0, 50.0), p=0.4),
-        
-        # 4. 회전 (사진 찍을 때 삐뚤어짐)
-        A.Rotate(limit=10, p=1.0, border_mode=cv2.BORDER_REPLICATE)
-    ])
-    
-    augmented = transform(image=img_np)['image']
-    final_image = Image.fromarray(augmented)
+    augmented = get_transform()(image=np.array(image))['image']
+    return Image.fromarray(augmented), metadata
+
+def receipt_name(index, digits=5):
+    return f"receipt_{index:0{digits}d}"
+
+def render_record(index, digits=5):
+    """ 영수증 한 장 -> (파일명, JPEG 바이트, 라벨). 파일로 저장할 때와 같은 JPEG 바이트 """
+    final_image, metadata = make_receipt()
+    filename = receipt_name(index, digits)
+    buffer = io.BytesIO()
+    final_image.save(buffer, format="JPEG")
+    return filename, buffer.getvalue(), {"file": f"{filename}.jpg", "receipts": [metadata]}
+
+def create_receipt_image(index, out_dir=DATASET_DIR, digits=5):
+    filename, image_bytes, label = render_record(index, digits)
     
-    # 저장
-    filename = f"receipt_{index:05d}"
-    final_image.save(f"{DATASET_DIR}/images/{filename}.jpg")
+    # 저장 (라벨을 나중에 쓰므로 라벨 파일이 있으면 그 영수증은 완성된 것)
+    with open(f"{out_dir}/images/{filename}.jpg", "wb") as f:
+        f.write(image_bytes)
     
-    with open(f"{DATASET_DIR}/labels/{filename}.json", "w", encoding="utf-8") as f:
-        json.dump({"file": f"{filename}.jpg", "receipts": [metadata]}, f, ensure_ascii=False)
+    with open(f"{out_dir}/labels/{filename}.json", "w", encoding="utf-8") as f:
+        json.dump(label, f, ensure_ascii=False)
+
+# ==============================================================================
+# 병렬 생성 (워커 프로세스마다 폰트 캐시 / 증강 파이프라인을 따로 가짐)
+# ==============================================================================
+def _init_worker():
+    # 워커 여러 개가 각자 OpenCV 스레드 풀을 띄우면 코어를 서로 뺏으므로 워커당 1 스레드
+    cv2.setNumThreads(1)
+
+def _generate_chunk(task):
+    seed, indices, out_dir, digits = task
+    for index in indices:
+        seed_image(seed, index)
+        create_receipt_image(index, out_dir, digits)
+    return len(indices)
+
+def _generate_shard(task):
+    """ 샤드 하나 = shard_size 개 연속 번호 (워커 수와 상관없이 같은 샤드에 같은 영수증) """
+    seed, shard_index, indices, out_dir, digits = task
+    writer = receipt_shards.ShardWriter(out_dir, shard_index)
+    for index in indices:
+        seed_image(seed, index)
+        _, image_bytes, label = render_record(index, digits)
+        writer.add(image_bytes, label)
+    return writer.close()
+
+# ==============================================================================
+# 데이터셋 정보 파일 (out_dir/dataset.json: seed, count, 파일명 자릿수)
+# ==============================================================================
+DATASET_INFO = "dataset.json"
+
+def read_dataset_info(out_dir):
+    """ 이전에 만든 데이터셋 정보 (없으면 None) """
+    path = os.path.join(out_dir, DATASET_INFO)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def name_digits(out_dir, count):
+    """
+    파일명 번호 자릿수. 이미 만든 데이터셋이 있으면 그 자릿수를 그대로 씁니다.
+    (--resume / --start 로 count 를 늘려도 기존 파일 이름이 바뀌어 전부 다시 만들지 않도록)
+    """
+    info = read_dataset_info(out_dir)
+    if info is not None:
+        return info["digits"]
+    # dataset.json 이 없는 예전 폴더: 라벨 파일 이름에서 읽음
+    label_dir = os.path.join(out_dir, "labels")
+    if os.path.isdir(label_dir):
+        with os.scandir(label_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith("receipt_") and entry.name.endswith(".json"):
+                    return len(entry.name[len("receipt_"):-len(".json")])
+    # 새 데이터셋: 10만 장 이상이면 파일명 자릿수를 늘려 이름순 = 번호순 유지
+    return max(5, len(str(count - 1)))
+
+def write_dataset_info(out_dir, seed, count, digits, shards):
+    info = {"seed": seed, "count": count, "digits": digits, "format": "shards" if shards else "files"}
+    with open(os.path.join(out_dir, DATASET_INFO), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=1)
+
+def generate(out_dir, count, seed, workers=1, start=0, resume=False, chunk_size=64,
+             shards=False, shard_size=receipt_shards.DEFAULT_SHARD_SIZE):
+    """
+    start ~ count-1 번 영수증을 workers 개 프로세스로 나눠 만듭니다.
+    영수증마다 (seed, 번호) 로 시드를 맞추므로 workers 가 달라도 결과는 같습니다.
+    resume 이면 라벨 파일이 이미 있는 번호는 건너뜁니다. (중간에 끊긴 생성 이어하기)
+    shards 이면 images/ + labels/ 대신 샤드 파일(receipt_shards.py)로 바로 씁니다.
+    (이때 start / resume 은 샤드 단위: start 가 들어 있는 샤드부터, 완성된 샤드는 건너뜀)
+    파일명 자릿수는 out_dir 에 이미 있는 데이터셋을 따르고, 시작할 때 dataset.json 에 기록합니다.
+    """
+    digits = name_digits(out_dir, count)
+
+    if shards:
+        os.makedirs(out_dir, exist_ok=True)
+        tasks = []
+        for shard_index in range(start // shard_size, (count + shard_size - 1) // shard_size):
+            if resume and receipt_shards.is_complete_shard(out_dir, shard_index):
+                continue
+            indices = range(shard_index * shard_size, min((shard_index + 1) * shard_size, count))
+            tasks.append((seed, shard_index, indices, out_dir, digits))
+        worker_fn, total = _generate_shard, sum(len(task[2]) for task in tasks)
+    else:
+        os.makedirs(f"{out_dir}/images", exist_ok=True)
+        os.makedirs(f"{out_dir}/labels", exist_ok=True)
+        indices = range(start, count)
+        if resume:
+            done = {name[:-len(".json")] for name in os.listdir(f"{out_dir}/labels") if name.endswith(".json")}
+            indices = [i for i in indices if receipt_name(i, digits) not in done]
+        indices = list(indices)
+        tasks = [(seed, indices[i:i + chunk_size], out_dir, digits) for i in range(0, len(indices), chunk_size)]
+        worker_fn, total = _generate_chunk, len(indices)
+    write_dataset_info(out_dir, seed, count, digits, shards)
+
+    print(f"🔥 리얼리티 강화 데이터셋 생성 시작 (카드/간이/메모 + 악필효과): "
+          f"{total}장, 워커 {workers}개, seed={seed}")
+    started = time.perf_counter()
+    finished, reported = 0, 0
+    if workers <= 1:
+        _init_worker()
+        results = map(worker_fn, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker)
+        results = pool.imap_unordered(worker_fn, tasks)
+    try:
+        for count_done in results:
+            finished += count_done
+            if finished - reported >= 500 or finished == total:
+                reported = finished
+                elapsed = time.perf_counter() - started
+                print(f"{finished}/{total}장 완료... ({finished / elapsed:.0f}장/초)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if shards:
+        manifest = receipt_shards.write_manifest(out_dir, (count + shard_size - 1) // shard_size)
+        print(f"📦 샤드 {len(manifest['shards'])}개, 영수증 {manifest['total']}장 -> {out_dir}")
 
 if __name__ == "__main__":
-    print("🔥 리얼리티 강화 데이터셋 생성 시작 (카드/간이/메모 + 악필효과)...")
-    for i in range(5000): 
-        create_receipt_image(i)
-        if (i+1) % 500 == 0: print(f"{i+1}장 완료...")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="합성 영수증 데이터셋 생성 (fonts/ 가 있는 ai-engine 폴더에서 실행)")
+    parser.add_argument("--out", default=DATASET_DIR, help="images/, labels/ (또는 샤드)를 만들 폴더")
+    parser.add_argument("--count", type=int, default=NUM_IMAGES, help="만들 영수증 수 (번호 0 ~ count-1)")
+    parser.add_argument("--seed", type=int, default=None, help="같은 seed 면 같은 데이터셋 (생략하면 무작위로 정하고 출력)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="생성 프로세스 수")
+    parser.add_argument("--start", type=int, default=0, help="이 번호부터 생성 (이어서 만들기)")
+    parser.add_argument("--resume", action="store_true", help="라벨 파일(샤드)이 이미 있는 영수증은 건너뜀")
+    parser.add_argument("--shards", action="store_true", help="영수증별 파일 대신 샤드 파일로 저장 (10만 장 이상 권장)")
+    parser.add_argument("--shard-size", type=int, default=receipt_shards.DEFAULT_SHARD_SIZE, help="샤드 하나의 영수증 수")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2 ** 31)
+    generate(args.out, args.count, seed, workers=args.workers, start=args.start, resume=args.resume,
+             shards=args.shards, shard_size=args.shard_size)
@@ -0,0 +1,164 @@
+import os
+import io
+import json
+import mmap
+import glob
+import bisect
+import argparse
+import numpy as np
+
+# ==============================================================================
+# 샤드 데이터셋 형식 (영수증 10만 장 이상용)
+#
+# 영수증마다 jpg + json 파일 두 개를 쓰면 작은 파일 I/O 와 glob 이 학습 시작/읽기를 잡아먹습니다.
+# 영수증 shard_size 장씩 한 파일에 이어 붙이고, 위치는 인덱스 파일로 찾습니다.
+#   shard-00000.bin      : [JPEG 바이트][라벨 JSON 바이트] 를 이어 붙인 것
+#   shard-00000.idx.npy  : 영수증마다 (시작 위치, JPEG 길이, 라벨 길이) int64
+#   manifest.json        : 샤드 목록과 샤드별 영수증 수
+# 읽을 때는 샤드를 mmap 으로 열어 (영수증 번호 -> 샤드 / 위치) 로 바로 찾아 읽으므로
+# DataLoader 가 전체 샤드에 걸쳐 섞어 읽을 수 있고, 워커마다 따로 열어 병렬로 읽습니다.
+# ==============================================================================
+
+MANIFEST = "manifest.json"
+FORMAT = "receipt-shards-v1"
+DEFAULT_SHARD_SIZE = 1000
+
+def shard_name(shard_index):
+    return f"shard-{shard_index:05d}"
+
+def is_complete_shard(out_dir, shard_index):
+    """ 인덱스 파일은 마지막에 만들어지므로, 있으면 끝까지 쓴 샤드 """
+    return os.path.exists(os.path.join(out_dir, shard_name(shard_index) + ".idx.npy"))
+
+# ==============================================================================
+# 1. 쓰기
+# ==============================================================================
+class ShardWriter:
+    """ 샤드 하나를 씁니다. 임시 파일에 쓰고 close() 에서 이름을 바꿔, 중간에 끊긴 샤드는 남지 않음 """
+
+    def __init__(self, out_dir, shard_index):
+        self.path = os.path.join(out_dir, shard_name(shard_index))
+        self._data = open(self.path + ".bin.tmp", "wb")
+        self._index = []
+
+    def add(self, image_bytes, label):
+        label_bytes = json.dumps(label, ensure_ascii=False).encode("utf-8")
+        offset = self._data.tell()
+        self._data.write(image_bytes)
+        self._data.write(label_bytes)
+        self._index.append((offset, len(image_bytes), len(label_bytes)))
+
+    def close(self):
+        self._data.close()
+        os.replace(self.path + ".bin.tmp", self.path + ".bin")
+        with open(self.path + ".idx.npy.tmp", "wb") as f:
+            np.save(f, np.asarray(self._index, dtype=np.int64).reshape(-1, 3))
+        os.replace(self.path + ".idx.npy.tmp", self.path + ".idx.npy")
+        return len(self._index)
+
+def write_manifest(out_dir, num_shards=None):
+    """
+    완성된 샤드들로 manifest.json 을 (다시) 만듭니다.
+    num_shards 가 있으면 0 ~ num_shards-1 번 샤드만 넣습니다. (예전에 더 많이 만든 샤드가 폴더에 남아 있어도 제외)
+    """
+    if num_shards is None:
+        index_paths = sorted(glob.glob(os.path.join(out_dir, "shard-*.idx.npy")))
+    else:
+        index_paths = [os.path.join(out_dir, shard_name(i) + ".idx.npy") for i in range(num_shards)]
+    shards = []
+    for index_path in index_paths:
+        if not os.path.exists(index_path):
+            # --start 로 일부만 만든 경우 등: 있는 샤드만 넣고 알림
+            print(f"⚠️ 아직 없는 샤드는 manifest 에서 뺍니다: {os.path.basename(index_path)}")
+            continue
+        name = os.path.basename(index_path)[:-len(".idx.npy")]
+        shards.append({"name": name, "count": int(np.load(index_path, mmap_mode="r").shape[0])})
+
+    manifest = {"format": FORMAT, "shards": shards, "total": sum(s["count"] for s in shards)}
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+def pack_directory(image_dir, label_dir, out_dir, shard_size=DEFAULT_SHARD_SIZE):
+    """ 기존 images/*.jpg + labels/*.json 데이터셋 -> 샤드 (JPEG 는 다시 인코딩하지 않고 그대로) """
+    os.makedirs(out_dir, exist_ok=True)
+    image_files = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+    for shard_index, start in enumerate(range(0, len(image_files), shard_size)):
+        writer = ShardWriter(out_dir, shard_index)
+        for image_path in image_files[start:start + shard_size]:
+            label_path = os.path.join(label_dir, os.path.basename(image_path)[:-len(".jpg")] + ".json")
+            with open(image_path, "rb") as f:
+                image_bytes = f.read()
+            with open(label_path, "r", encoding="utf-8") as f:
+                writer.add(image_bytes, json.load(f))
+        writer.close()
+        print(f"📦 {shard_name(shard_index)}: {min(start + shard_size, len(image_files))}/{len(image_files)}장")
+    return write_manifest(out_dir, (len(image_files) + shard_size - 1) // shard_size)
+
+# ==============================================================================
+# 2. 읽기
+# ==============================================================================
+class ShardReader:
+    """
+    번호로 영수증 (JPEG 바이트, 라벨 dict) 을 읽습니다.
+    샤드 mmap 은 처음 읽을 때 프로세스마다 따로 열고, pickle(DataLoader 워커로 복사)할 때는 빼고 보냅니다.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT:
+            raise ValueError(f"지원하지 않는 샤드 형식입니다: {manifest.get('format')}")
+        self.names = [shard["name"] for shard in manifest["shards"]]
+        self.starts = np.cumsum([0] + [shard["count"] for shard in manifest["shards"]]).tolist()
+        self._maps = {}
+        self._indexes = {}
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_maps"], state["_indexes"] = {}, {}
+        return state
+
+    def _open(self, shard):
+        if shard not in self._maps:
+            path = os.path.join(self.root, self.names[shard])
+            self._indexes[shard] = np.load(path + ".idx.npy", mmap_mode="r")
+            with open(path + ".bin", "rb") as f:
+                self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[shard], self._indexes[shard]
+
+    def read(self, idx):
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        shard = bisect.bisect_right(self.starts, idx) - 1
+        data, index = self._open(shard)
+        offset, image_size, label_size = (int(v) for v in index[idx - self.starts[shard]])
+        image_bytes = data[offset:offset + image_size]
+        label = json.loads(data[offset + image_size:offset + image_size + label_size].decode("utf-8"))
+        return image_bytes, label
+
+    def read_image(self, idx):
+        """ (PIL 이미지, 라벨 dict) """
+        from PIL import Image
+
+        image_bytes, label = self.read(idx)
+        return Image.open(io.BytesIO(image_bytes)), label
+
+    def __iter__(self):
+        """ 샤드 순서대로 차례로 읽기 (전체 훑기 / 변환용) """
+        for idx in range(len(self)):
+            yield self.read(idx)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="images/ + labels/ 데이터셋을 샤드 형식으로 변환")
+    parser.add_argument("--src", default="dataset/multi_receipt_train", help="images/, labels/ 가 있는 폴더")
+    parser.add_argument("--out", default="dataset/multi_receipt_shards", help="샤드를 만들 폴더")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="샤드 하나에 넣을 영수증 수")
+    args = parser.parse_args()
+
+    manifest = pack_directory(f"{args.src}/images", f"{args.src}/labels", args.out, args.shard_size)
+    print(f"✅ 샤드 {len(manifest['shards'])}개, 영수증 {manifest['total']}장 -> {args.out}")
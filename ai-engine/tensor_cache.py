@@ -0,0 +1,164 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import torch
+import receipt_shards
+from torch.utils.data import Dataset, DataLoader
+
+# ==============================================================================
+# 전처리 결과 캐시 (학습 에폭마다 같은 전처리를 반복하지 않기)
+#
+# ReceiptDataset.__getitem__ 은 매 에폭 JPEG 디코딩 -> 라벨 JSON 정리 -> DonutProcessor
+# 리사이즈/정규화 -> 토크나이즈를 다시 합니다. 처음 한 번만 돌려서 결과를 memmap 파일로 저장하고,
+# 이후 에폭은 파일에서 바로 꺼내 씁니다. (DataLoader 가 학습 속도를 잡아먹지 않게)
+#   pixel_values.f16 : (N, 3, H, W) float16
+#   labels.i32       : (N, max_length) int32 (패딩은 -100)
+#   meta.json        : 모양 / 캐시 키
+# 읽을 때는 fp16 / int32 그대로 (복사 없이) 배치로 묶어 GPU 로 보내고, 장치에 올린 뒤에
+# to_model_dtypes 로 모델이 받는 타입으로 바꿉니다. (호스트 메모리 복사 / 전송량 절반)
+# 캐시 폴더 이름은 프로세서 설정(해상도/정규화/토크나이저) + max_length + 원본 데이터셋 지문(source_fingerprint)
+# 으로 만든 키라서, 설정이 바뀌거나 같은 폴더에 데이터셋을 다시 만들면 새 캐시를 만듭니다.
+# 주의: 960x720 기준 영수증 1장에 약 4MB (5,000장 = 약 20GB). 디스크 여유를 확인하고 사용하세요.
+# ==============================================================================
+
+META = "meta.json"
+
+# 원본 데이터셋 지문에 쓰는 요약 파일 / 폴더 (source 바로 아래)
+#   manifest.json : 샤드 목록 (receipt_shards.py, 생성/변환할 때마다 다시 씀)
+#   dataset.json  : seed / 장수 / 파일명 자릿수 (generate_dataset.py 가 생성할 때마다 다시 씀)
+#   images/, labels/ : 폴더 자체의 수정 시각 (파일을 더하거나 지우면 바뀜)
+FINGERPRINT_FILES = (receipt_shards.MANIFEST, "dataset.json", "images", "labels")
+
+def source_fingerprint(source):
+    """
+    원본 데이터셋 내용의 지문: 요약 파일의 내용 + (크기, 수정 시각), 폴더의 수정 시각 해시.
+    영수증 파일마다 stat 하지 않으므로 10만 장 폴더도 금방이고, 같은 폴더에 다시 생성하면 값이 바뀝니다.
+    (dataset.json 없이 기존 파일을 제자리에서 덮어쓴 경우는 알아채지 못함)
+    """
+    digest = hashlib.sha1()
+    for name in FINGERPRINT_FILES:
+        path = os.path.join(source, name)
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def cache_key(processor, max_length, task_prompt, source, count):
+    """ 전처리 결과를 바꾸는 것들의 해시 """
+    tokenizer = processor.tokenizer
+    config = {
+        "image_processor": processor.image_processor.to_dict(),
+        "tokenizer": [tokenizer.name_or_path, len(tokenizer), tokenizer.eos_token, tokenizer.pad_token_id],
+        "max_length": max_length,
+        "task_prompt": task_prompt,
+        "source": os.path.abspath(source),
+        "content": source_fingerprint(source),
+        "count": count,
+    }
+    text = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def build_cache(dataset, cache_dir, num_workers=4, batch_size=16):
+    """
+    dataset(ReceiptDataset / ShardedReceiptDataset)을 한 번 훑어 memmap 으로 저장합니다.
+    임시 폴더에 다 쓴 뒤 이름을 바꾸므로, 중간에 끊기면 다음 실행에서 처음부터 다시 만듭니다.
+    """
+    first = dataset[0]
+    pixel_shape = tuple(first["pixel_values"].shape)
+    max_length = first["labels"].shape[0]
+    count = len(dataset)
+
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    pixels = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, "pixel_values.f16.npy"), mode="w+", dtype=np.float16, shape=(count, *pixel_shape)
+    )
+    labels = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, "labels.i32.npy"), mode="w+", dtype=np.int32, shape=(count, max_length)
+    )
+
+    print(f"🧊 전처리 캐시 생성 중: {count}장 -> {cache_dir}")
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    position = 0
+    for batch in loader:
+        size = batch["labels"].shape[0]
+        pixels[position:position + size] = batch["pixel_values"].numpy().astype(np.float16)
+        labels[position:position + size] = batch["labels"].numpy()
+        position += size
+        if position % 1000 < size:
+            print(f"  {position}/{count}장 완료...")
+    pixels.flush()
+    labels.flush()
+    del pixels, labels
+
+    with open(os.path.join(tmp_dir, META), "w", encoding="utf-8") as f:
+        json.dump({"count": count, "pixel_shape": pixel_shape, "max_length": max_length}, f)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    print("✅ 전처리 캐시 완료!")
+
+class CachedReceiptDataset(Dataset):
+    """
+    build_cache 로 만든 memmap 에서 바로 읽는 데이터셋 (JPEG 디코딩 / 전처리 / 토크나이즈 없음)
+    memmap 은 처음 읽을 때 프로세스(DataLoader 워커)마다 따로 엽니다.
+    pixel_values 는 float16, labels 는 int32 그대로 돌려주므로 학습 루프에서 to_model_dtypes 가 필요합니다.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, META), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._pixels = None
+        self._labels = None
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pixels"], state["_labels"] = None, None
+        return state
+
+    def _open(self):
+        if self._pixels is None:
+            # "c" (copy-on-write): 파일은 바뀌지 않고, torch.from_numpy 가 쓰기 불가 배열 경고를 내지 않음
+            self._pixels = np.load(os.path.join(self.cache_dir, "pixel_values.f16.npy"), mmap_mode="c")
+            self._labels = np.load(os.path.join(self.cache_dir, "labels.i32.npy"), mmap_mode="c")
+
+    def __getitem__(self, idx):
+        self._open()
+        # 복사 없이 memmap 조각 그대로 (배치로 묶을 때 한 번만 복사됨)
+        return {
+            "pixel_values": torch.from_numpy(self._pixels[idx]),
+            "labels": torch.from_numpy(self._labels[idx]),
+        }
+
+def to_model_dtypes(inputs, dtype=torch.float32):
+    """
+    장치에 올린 배치의 타입을 모델 입력에 맞춥니다. (Trainer._prepare_inputs 뒤에 부름)
+    float16 pixel_values -> dtype (모델 가중치 타입, fp16 학습이면 autocast 가 다시 내림),
+    int32 labels -> int64 (loss 가 int64 만 받음). 이미 맞는 배치는 그대로 돌려줍니다.
+    """
+    pixel_values = inputs.get("pixel_values")
+    if pixel_values is not None and pixel_values.dtype != dtype:
+        inputs["pixel_values"] = pixel_values.to(dtype)
+    labels = inputs.get("labels")
+    if labels is not None and labels.dtype != torch.int64:
+        inputs["labels"] = labels.long()
+    return inputs
+
+def cached_dataset(dataset, processor, cache_root, source, num_workers=4):
+    """ dataset 의 전처리 캐시가 있으면 그것을, 없으면 만들어서 CachedReceiptDataset 으로 돌려줍니다. """
+    key = cache_key(processor, dataset.max_length, dataset.task_prompt, source, len(dataset))
+    cache_dir = os.path.join(cache_root, key)
+    if os.path.exists(os.path.join(cache_dir, META)):
+        print(f"✅ 전처리 캐시를 사용합니다: {cache_dir}")
+    else:
+        build_cache(dataset, cache_dir, num_workers=num_workers)
+    return CachedReceiptDataset(cache_dir)
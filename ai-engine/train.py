@@ -1,16 +1,21 @@
+import io
 import os
 import json
 import glob
 import shutil
+import time
 import zipfile
 import torch
+import receipt_shards
+import tensor_cache
 from PIL import Image
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
 from transformers import (
     VisionEncoderDecoderModel,
     DonutProcessor,
     Seq2SeqTrainingArguments,
     Seq2SeqTrainer,
+    TrainerCallback,
     default_data_collator
 )
 
@@ -36,11 +41,26 @@ WORKING_DIR = "/kaggle/working"
 DATASET_DIR = "/kaggle/input/academy-dataset-with-handwriting/dataset/multi_receipt_train"
 IMAGE_DIR = f"{DATASET_DIR}/images"
 LABEL_DIR = f"{DATASET_DIR}/labels"
+# 샤드 형식 데이터셋 (generate_dataset.py --shards 또는 receipt_shards.py 로 변환).
+# 이 폴더에 manifest.json 이 있으면 images/ + labels/ 대신 샤드에서 읽음
+SHARD_DIR = "/kaggle/input/academy-dataset-with-handwriting/dataset/multi_receipt_shards"
+# 전처리 캐시 (tensor_cache.py): 첫 실행에 전처리 결과를 memmap 으로 저장하고 이후 에폭/실행은 그대로 읽음.
+# 960x720 기준 영수증 1장에 약 4MB 가 필요하므로 디스크 여유가 있을 때만 켜세요.
+USE_TENSOR_CACHE = False
+TENSOR_CACHE_DIR = f"{WORKING_DIR}/tensor_cache"
+# 즉석 합성 학습: 데이터셋 폴더 없이 DataLoader 워커가 generate_dataset.py 로 영수증을 바로 그려서 학습.
+# fonts/ 가 있는 ai-engine 폴더에서 실행하세요. 생성 속도는 dataloader_num_workers 에 비례합니다.
+USE_SYNTHETIC_STREAM = False
+SYNTHETIC_SEED = 1234
+SYNTHETIC_SAMPLES_PER_EPOCH = 5000
 
 # ==============================================================================
 # 2. 데이터 준비 (압축 해제)
 # ==============================================================================
 def prepare_data():
+    if os.path.exists(os.path.join(SHARD_DIR, receipt_shards.MANIFEST)):
+        print(f"✅ 샤드 데이터셋을 사용합니다: {SHARD_DIR}")
+        return
     if os.path.exists(IMAGE_DIR):
         print(f"✅ 데이터가 이미 준비되어 있습니다: {len(os.listdir(IMAGE_DIR))}장")
         return
@@ -83,7 +103,8 @@ class ReceiptDataset(Dataset):
     def __len__(self):
         return len(self.image_files)
 
-    def __getitem__(self, idx):
+    def load_sample(self, idx):
+        """ idx 번 영수증 -> (PIL 이미지, 라벨 dict) """
         image_path = self.image_files[idx]
         image = Image.open(image_path).convert("RGB")
         
@@ -94,6 +115,10 @@ class ReceiptDataset(Dataset):
         
         with open(label_path, "r", encoding="utf-8") as f:
             label_data = json.load(f)
+        return image, label_data
+
+    def __getitem__(self, idx):
+        image, label_data = self.load_sample(idx)
 
         # ------------------------------------------------------------------
         # ★ [핵심전략] 불필요한 정보 삭제 (AI 뇌 용량 확보)
@@ -132,12 +157,133 @@ class ReceiptDataset(Dataset):
             "labels": labels.squeeze()
         }
 
+class ShardedReceiptDataset(ReceiptDataset):
+    """
+    샤드 형식(receipt_shards.py) 데이터셋. 파일 목록 glob 없이 manifest 만 읽고,
+    영수증은 번호로 샤드를 mmap 해서 바로 꺼냅니다. (Trainer 의 셔플이 샤드 전체에 걸쳐 동작,
+    DataLoader 워커마다 샤드를 따로 열어 병렬로 읽음)
+    """
+    def __init__(self, shard_dir, processor, max_length=768):
+        self.reader = receipt_shards.ShardReader(shard_dir)
+        self.processor = processor
+        self.max_length = max_length
+        self.task_prompt = "<s_receipt>"
+
+    def __len__(self):
+        return len(self.reader)
+
+    def load_sample(self, idx):
+        image, label_data = self.reader.read_image(idx)
+        return image.convert("RGB"), label_data
+
+class SyntheticReceiptDataset(ReceiptDataset, IterableDataset):
+    """
+    디스크 없이 DataLoader 워커 안에서 영수증을 그리고 증강해서 바로 주는 데이터셋
+    - epoch 마다 (epoch * samples_per_epoch + i) 번 영수증 -> 같은 영수증이 다시 나오지 않음
+    - 영수증마다 (seed, 번호) 로 시드를 맞추므로 실행할 때마다 같은 영수증 (generate_dataset.py 로
+      같은 seed 로 만든 같은 번호 영수증과도 같은 이미지). 워커 w 는 w, w+W, w+2W ... 번째를 맡음
+    - epoch 번호는 Trainer 가 매 epoch 시작 때 DataLoader.set_epoch -> set_epoch 로 넣어줌
+      (워커는 epoch 마다 새로 뜨면서 데이터셋을 복사해 가므로 dataloader_persistent_workers 는 끄고 사용)
+    - 영수증마다 생성에 걸린 시간을 샘플의 "generate_seconds" 로 함께 보내고, ReceiptTrainer 가
+      모델에 넣기 전에 빼서 record_generated 로 메인 프로세스에서 합산 (워커끼리 공유 메모리를 쓰지 않음)
+    """
+    def __init__(self, processor, seed, samples_per_epoch, max_length=768):
+        self.processor = processor
+        self.seed = seed
+        self.samples_per_epoch = samples_per_epoch
+        self.max_length = max_length
+        self.task_prompt = "<s_receipt>"
+        self.epoch = 0
+        # 학습에 들어간 영수증 수 / 그 영수증들을 만드는 데 쓴 시간(초) (메인 프로세스 합계, 처리량 확인용)
+        self.generated = 0
+        self.generate_seconds = 0.0
+
+    def __len__(self):
+        return self.samples_per_epoch
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def record_generated(self, seconds):
+        """ 배치의 "generate_seconds" (영수증별 생성 시간) 를 합계에 더합니다. """
+        self.generated += len(seconds)
+        self.generate_seconds += float(seconds.sum())
+
+    def load_sample(self, idx):
+        # albumentations / faker 는 즉석 합성을 쓸 때만 필요하므로 여기서 import
+        import generate_dataset
+
+        generate_dataset.seed_image(self.seed, idx)
+        _, image_bytes, label_data = generate_dataset.render_record(idx)
+        return Image.open(io.BytesIO(image_bytes)).convert("RGB"), label_data
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        if worker is not None:
+            import generate_dataset
+            generate_dataset._init_worker()
+
+        first = self.epoch * self.samples_per_epoch
+        for position in range(worker_id, self.samples_per_epoch, num_workers):
+            started = time.perf_counter()
+            sample = self[first + position]
+            sample["generate_seconds"] = time.perf_counter() - started
+            yield sample
+
+class SyntheticStreamCallback(TrainerCallback):
+    """
+    즉석 합성 학습에서 로그 때마다 생성 가능 속도와 학습 소비 속도를 출력합니다.
+    생성 가능 속도가 소비 속도보다 낮으면 GPU 가 데이터를 기다리는 중 -> dataloader_num_workers 를 늘리세요.
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._last = None
+
+    def on_log(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        current = (now, self.dataset.generated, self.dataset.generate_seconds, state.global_step)
+        if self._last is not None:
+            elapsed = now - self._last[0]
+            generated = current[1] - self._last[1]
+            seconds = current[2] - self._last[2]
+            per_step = args.train_batch_size * args.gradient_accumulation_steps * args.world_size
+            consumed = (current[3] - self._last[3]) * per_step / elapsed
+            capacity = generated / seconds * max(args.dataloader_num_workers, 1) if seconds > 0 else 0.0
+            status = "✅" if capacity >= consumed else "⚠️ 생성이 학습을 못 따라감"
+            print(f"⚙️ 영수증 생성 가능 {capacity:.1f}장/초, 학습 소비 {consumed:.1f}장/초 {status}")
+        self._last = current
+
+class ReceiptTrainer(Seq2SeqTrainer):
+    """
+    배치를 장치에 올린 뒤 모델 입력 타입으로 바꾸는 Trainer.
+    전처리 캐시(tensor_cache.py)는 fp16 / int32 그대로 넘겨서 CPU 쪽 변환 복사와 전송량을 줄입니다.
+    즉석 합성 배치의 "generate_seconds" 는 모델에 넣지 않고 데이터셋 합계로 옮깁니다.
+    """
+    def _prepare_inputs(self, inputs):
+        seconds = inputs.pop("generate_seconds", None)
+        if seconds is not None:
+            self.train_dataset.record_generated(seconds)
+        return tensor_cache.to_model_dtypes(super()._prepare_inputs(inputs), self.model.dtype)
+
+def build_dataset(processor):
+    if USE_SYNTHETIC_STREAM:
+        return SyntheticReceiptDataset(processor, SYNTHETIC_SEED, SYNTHETIC_SAMPLES_PER_EPOCH)
+    if os.path.exists(os.path.join(SHARD_DIR, receipt_shards.MANIFEST)):
+        dataset, source = ShardedReceiptDataset(SHARD_DIR, processor), SHARD_DIR
+    else:
+        dataset, source = ReceiptDataset(IMAGE_DIR, LABEL_DIR, processor), DATASET_DIR
+    if USE_TENSOR_CACHE:
+        return tensor_cache.cached_dataset(dataset, processor, TENSOR_CACHE_DIR, source)
+    return dataset
+
 # ==============================================================================
 # 4. 학습 실행
 # ==============================================================================
 def train():
-    # 1. 데이터 준비
-    prepare_data()
+    # 1. 데이터 준비 (즉석 합성이면 데이터셋 폴더가 필요 없음)
+    if not USE_SYNTHETIC_STREAM:
+        prepare_data()
 
     print("🔥 모델 로드 중...")
     processor = DonutProcessor.from_pretrained(MODEL_ID)
@@ -162,7 +308,7 @@ def train():
     print(f"✅ 학습 장치: {device}")
 
     # 데이터셋 연결
-    train_dataset = ReceiptDataset(IMAGE_DIR, LABEL_DIR, processor)
+    train_dataset = build_dataset(processor)
     print(f"📊 학습 데이터 수: {len(train_dataset)}장")
 
     # 학습 인자 설정
@@ -190,12 +336,13 @@ def train():
         optim="adamw_bnb_8bit" 
     )
 
-    trainer = Seq2SeqTrainer(
+    trainer = ReceiptTrainer(
         model=model,
         args=training_args,
         train_dataset=train_dataset,
         tokenizer=processor.tokenizer,
         data_collator=default_data_collator,
+        callbacks=[SyntheticStreamCallback(train_dataset)] if USE_SYNTHETIC_STREAM else None,
     )
 
     print("🚀 학습 시작!")
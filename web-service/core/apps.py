@@ -1,6 +1,35 @@
+import sys
+
 from django.apps import AppConfig
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # 학생/결제 변경 시 명단 스냅샷과 미납 장부를 갱신하는 시그널 등록
+        from . import signals  # noqa: F401
+
+        from django.conf import settings
+
+        # 작업 큐 워커는 여기서 띄우지 않음: WSGI/ASGI 진입점에서만 (core/jobs.py start_workers_at_boot)
+
+        # (선택) AI 모델 미리 로딩 + 워밍업 (settings.INFERENCE_PRELOAD)
+        if settings.INFERENCE_PRELOAD and not _is_management_command():
+            from .inference import preload_model, uses_model_server
+            if uses_model_server():
+                return  # 모델은 모델 서버(manage.py run_model_server)가 올림
+            try:
+                preload_model()
+            except Exception as e:
+                # 로딩에 실패해도 서버는 뜨고, 첫 요청에서 다시 지연 로딩을 시도
+                print(f"⚠️ AI 모델 미리 로딩 실패: {e}")
+
+def _is_management_command():
+    """ migrate / snapshot_model 같은 관리 명령에서는 모델을 올리지 않음 (runserver 는 예외) """
+    return (
+        len(sys.argv) > 1
+        and sys.argv[0].endswith('manage.py')
+        and sys.argv[1] != 'runserver'
+    )
@@ -1,8 +1,14 @@
-import torch
-import re
-import json
-from PIL import Image
-from transformers import DonutProcessor, VisionEncoderDecoderModel
+import copy
+import importlib
+import queue
+import threading
+import time
+from collections import Counter, deque
+from django.conf import settings
+
+from . import telemetry
+from .model_server import remote_inference_batch, remote_info, remote_metrics
+from .result_cache import content_hash, get_cache, namespace_for
 
 # -----------------------------------------------------------------------------
 # ★ [설정] 본인의 Hugging Face 모델 ID로 바꿔주세요
@@ -11,110 +17,331 @@ from transformers import DonutProcessor, VisionEncoderDecoderModel
 # -----------------------------------------------------------------------------
 MODEL_ID = "HYPER-KJY/academy-receipt-model"
 
-# 전역 변수
-model = None
-processor = None
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+# 마이크로 배치 설정 (settings.py, 환경변수로 조정)
+# 창(window) 안에 들어온 요청을 최대 MAX_BATCH_SIZE 장까지 묶어 generate 를 한 번만 돌립니다.
+BATCH_WINDOW_MS = getattr(settings, 'INFERENCE_BATCH_WINDOW_MS', 20)
+MAX_BATCH_SIZE = getattr(settings, 'INFERENCE_MAX_BATCH_SIZE', 4)
+
+# -----------------------------------------------------------------------------
+# 추론 백엔드 선택 (settings.INFERENCE_BACKEND)
+#   - 'torch'       : transformers generate (core/torch_backend.py)
+#   - 'onnx'        : ONNX Runtime, transformers 없이 실행 (core/onnx_backend.py)
+#   - 'torchscript' : TorchScript, transformers 없이 실행 (core/onnx_backend.py)
+# 모든 백엔드는 load_model_lazy / warm_up / input_size / preprocess / stack / generate_batch / is_loaded 를 제공합니다.
+# -----------------------------------------------------------------------------
+BACKEND_MODULES = {
+    'torch': '.torch_backend',
+    'onnx': '.onnx_backend',
+    'torchscript': '.onnx_backend',
+}
+
+_backend = None
+_ready = threading.Event()   # 모델 로딩 + 워밍업 완료 여부
+
+# 모델 서버 (core/model_server.py, manage.py run_model_server)
+# settings.INFERENCE_SERVER_SOCKET 이 있으면 이 프로세스는 모델을 올리지 않고 서버에 요청만 보냅니다.
+# (모델 서버 프로세스 자신은 use_local_model() 로 직접 추론)
+_local_only = False
+
+def use_local_model():
+    global _local_only
+    _local_only = True
+
+def uses_model_server():
+    return bool(getattr(settings, 'INFERENCE_SERVER_SOCKET', '')) and not _local_only
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'INFERENCE_BACKEND', 'torch')
+        if name not in BACKEND_MODULES:
+            raise ValueError(f"알 수 없는 추론 백엔드입니다: {name} (가능: {', '.join(BACKEND_MODULES)})")
+        _backend = importlib.import_module(BACKEND_MODULES[name], __package__)
+    return _backend
 
 def load_model_lazy():
+    """ 선택된 백엔드의 모델을 (처음 한 번만) 로드합니다. """
+    get_backend().load_model_lazy()
+
+def preload_model():
     """
-    최초 요청 시 Hugging Face Hub에서 모델을 다운로드/로드합니다.
+    서버 시작 시 모델을 미리 올리고 워밍업 generate 를 한 번 돌립니다. (CoreConfig.ready)
+    첫 사용자가 모델 로딩/첫 실행 비용(수십 초)을 떠안지 않게 합니다.
     """
-    global model, processor
-    
-    if model is not None:
-        return
+    started = time.perf_counter()
+    backend = get_backend()
+    backend.load_model_lazy()
+    backend.warm_up()
+    _ready.set()
+    print(f"🔥 AI 모델 준비 완료 ({time.perf_counter() - started:.1f}초)")
 
-    print(f"💤 Hugging Face Hub에서 모델을 찾아오는 중... (ID: {MODEL_ID})")
+def input_size():
+    """ 모델 입력 이미지 크기 (height, width). 업로드 이미지를 이 크기에 맞춰 줄여서 디코딩 (core/ingest.py) """
+    if uses_model_server():
+        info = remote_info()
+        if 'input_size' not in info:
+            raise RuntimeError(info['error'])
+        return tuple(info['input_size'])
+    backend = get_backend()
+    backend.load_model_lazy()
+    return backend.input_size()
 
-    try:
-        # ---------------------------------------------------------
-        # Hugging Face Hub 자동 로드 (인터넷 연결 필수)
-        # ---------------------------------------------------------
-        # 만약 비공개(Private) 모델이라면, 터미널에서 'huggingface-cli login'을 했거나
-        # token="hf_..." 인자를 추가해야 합니다.
-        
-        # 1. 프로세서 로드
-        try:
-            processor = DonutProcessor.from_pretrained(MODEL_ID)
-        except OSError:
-            # 혹시나 설정 파일이 꼬였을 경우를 대비한 안전장치
-            print("⚠️ 모델 저장소에 프로세서 설정이 없어 기본값(donut-base)을 사용합니다.")
-            processor = DonutProcessor.from_pretrained("naver-clova-ix/donut-base")
-            processor.tokenizer.add_tokens(["<s_receipt>", "</s_receipt>"])
-
-        # 2. 모델 로드
-        model = VisionEncoderDecoderModel.from_pretrained(MODEL_ID)
-        
-        # 토큰 크기 맞춤
-        model.decoder.resize_token_embeddings(len(processor.tokenizer))
-        
-        model.to(device)
-        model.eval()
-        print(f"✅ AI 모델 로딩 완료! (Source: Hugging Face Hub)")
-        
-    except Exception as e:
-        print(f"❌ 모델 로딩 실패: {e}")
-        model = None
-        raise e
+def model_fingerprint():
+    """ 현재 백엔드 모델의 지문 (모델 ID / 리비전 / 양자화 모드 등). 결과 캐시 무효화에 사용 """
+    if uses_model_server():
+        return remote_info().get('fingerprint')
+    return get_backend().model_fingerprint()
 
-def run_inference(image_input):
+def is_ready():
+    """ 모델 로딩 + 첫 generate(워밍업 또는 첫 요청)까지 끝났는지 """
+    return _ready.is_set()
+
+# -----------------------------------------------------------------------------
+# 마이크로 배치 (동시에 들어온 요청을 묶어서 한 번에 generate)
+# -----------------------------------------------------------------------------
+class _PendingRequest:
+    __slots__ = ('pixel_values', 'enqueued_at', 'done', 'output', 'batch_size')
+
+    def __init__(self, pixel_values):
+        self.pixel_values = pixel_values
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.output = None
+        self.batch_size = 0
+
+class BatchMetrics:
     """
-    views.py에서 호출하는 추론 함수
+    마이크로 배치 지표: 요청별 지연 시간(대기 / 전체)과 배치 크기 분포.
+    최근 WINDOW 건의 지연 시간만 보관해서 p50/p95 를 계산합니다.
+    """
+    WINDOW = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = Counter()    # 배치 크기 -> 횟수
+        self._wait_ms = deque(maxlen=self.WINDOW)
+        self._latency_ms = deque(maxlen=self.WINDOW)
+
+    def record_batch(self, size):
+        with self._lock:
+            self.batches += 1
+            self.batch_sizes[size] += 1
+
+    def record_request(self, wait_ms, latency_ms):
+        with self._lock:
+            self.requests += 1
+            self._wait_ms.append(wait_ms)
+            self._latency_ms.append(latency_ms)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {'avg': None, 'p50': None, 'p95': None, 'max': None}
+        ordered = sorted(values)
+        pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 1)
+        return {
+            'avg': round(sum(ordered) / len(ordered), 1),
+            'p50': pick(0.50),
+            'p95': pick(0.95),
+            'max': round(ordered[-1], 1),
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'batches': self.batches,
+                'avg_batch_size': round(self.requests / self.batches, 2) if self.batches else None,
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                'queue_wait_ms': self._percentiles(self._wait_ms),
+                'latency_ms': self._percentiles(self._latency_ms),
+                'window_ms': BATCH_WINDOW_MS,
+                'max_batch_size': MAX_BATCH_SIZE,
+            }
+
+class MicroBatcher:
+    """
+    요청 스레드는 전처리(pixel_values)까지만 하고 큐에 넣은 뒤 기다립니다.
+    배치 스레드 하나가 첫 요청을 받으면 window 동안(또는 max_size 장이 찰 때까지) 더 모은 뒤
+    pixel_values 를 쌓아(backend.stack) generate 를 한 번 돌리고, 결과를 각 요청에 나눠 줍니다.
+    (모델은 이 스레드에서만 쓰이므로 동시 요청이 모델을 두고 경쟁하지 않습니다.)
     """
-    if model is None:
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_size=MAX_BATCH_SIZE):
+        self.window = max(window_ms, 0) / 1000
+        self.max_size = max(max_size, 1)
+        self.metrics = BatchMetrics()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, pixel_values):
+        """ pixel_values (1, C, H, W) 를 넣고 결과 dict 를 받을 때까지 기다립니다. """
+        return self.submit_many([pixel_values])[0]
+
+    def submit_many(self, pixel_values_list):
+        """
+        여러 장을 한꺼번에 넣고 모두 끝날 때까지 기다립니다. (영수증 여러 장을 나눈 사진)
+        연달아 큐에 들어가므로 max_size 장씩 같은 배치로 묶입니다.
+        """
+        self._ensure_thread()
+        requests = [_PendingRequest(pixel_values) for pixel_values in pixel_values_list]
+        for request in requests:
+            self._queue.put(request)
+        for request in requests:
+            request.done.wait()
+        return [request.output for request in requests]
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="inference-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        # 어떤 예외가 나도 스레드는 살아 있고, 기다리는 요청은 모두 (오류 결과로라도) 깨어남
+        while True:
+            batch = self._collect()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                print(f"⚠️ 마이크로 배치 처리 오류: {e}")
+            finally:
+                for request in batch:
+                    if request.output is None:
+                        request.output = {"status": "error", "message": "추론 결과를 받지 못했습니다."}
+                    request.done.set()
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
         try:
-            load_model_lazy()
+            backend = get_backend()
+            outputs = backend.generate_batch(backend.stack([r.pixel_values for r in batch]))
+            if len(outputs) != len(batch):
+                raise RuntimeError(f"백엔드 결과 수가 입력 수와 다릅니다. ({len(outputs)} != {len(batch)})")
         except Exception as e:
-            return {"status": "error", "message": f"모델 로딩 실패: {str(e)}"}
+            outputs = [{"status": "error", "message": str(e)} for _ in batch]
 
-    try:
-        # 1. 이미지 포맷 통일
-        if image_input.mode != "RGB":
-            image_input = image_input.convert("RGB")
-
-        # 2. 전처리
-        pixel_values = processor(image_input, return_tensors="pt").pixel_values
-        pixel_values = pixel_values.to(device)
-
-        # 3. 프롬프트 준비
-        task_prompt = "<s_receipt>"
-        decoder_input_ids = processor.tokenizer(
-            task_prompt, add_special_tokens=False, return_tensors="pt"
-        ).input_ids.to(device)
-
-        # 4. 생성 (Inference) - 품질 옵션 적용
-        with torch.no_grad():
-            outputs = model.generate(
-                pixel_values,
-                decoder_input_ids=decoder_input_ids,
-                max_length=768,
-                early_stopping=True,
-                pad_token_id=processor.tokenizer.pad_token_id,
-                eos_token_id=processor.tokenizer.eos_token_id,
-                use_cache=True,
-                # 앵무새 방지 옵션
-                num_beams=4,
-                repetition_penalty=1.2,
-                no_repeat_ngram_size=3,
-                
-                bad_words_ids=[[processor.tokenizer.unk_token_id]],
-                return_dict_in_generate=True,
+        for request, output in zip(batch, outputs):
+            request.output = output
+            request.batch_size = len(batch)
+            if 'timing' in output:
+                output['timing']['queue_wait_ms'] = round((started - request.enqueued_at) * 1000, 1)
+
+        self.metrics.record_batch(len(batch))
+        finished = time.perf_counter()
+        for request in batch:
+            self.metrics.record_request(
+                (started - request.enqueued_at) * 1000,
+                (finished - request.enqueued_at) * 1000,
             )
 
-        # 5. 후처리
-        sequence = processor.batch_decode(outputs.sequences)[0]
-        sequence = sequence.replace(processor.tokenizer.eos_token, "").replace(processor.tokenizer.pad_token, "")
-        sequence = re.sub(r"<.*?>", "", sequence, count=1).strip()
-        
-        print(f"🤖 AI 분석 결과(Raw): {sequence}")
+_batcher = MicroBatcher()
 
-        # 6. JSON 파싱
-        try:
-            json_output = processor.token2json(sequence)
-            return {"status": "success", "result": json_output}
-        except Exception as json_err:
-            return {"status": "partial_success", "result": {"text_content": sequence}}
+def get_batch_metrics():
+    """ 마이크로 배치 + 결과 캐시 지표 (GET /api/matching/inference-metrics/) """
+    if uses_model_server():
+        return {'server': str(settings.INFERENCE_SERVER_SOCKET), **remote_metrics()}
+    cache = get_cache()
+    return {
+        'backend': getattr(settings, 'INFERENCE_BACKEND', 'torch'),
+        'model_ready': is_ready(),
+        **_batcher.metrics.snapshot(),
+        'cache': cache.stats() if cache else None,
+    }
 
+# -----------------------------------------------------------------------------
+# 추론
+# -----------------------------------------------------------------------------
+def run_inference(image_input):
+    """
+    views.py에서 호출하는 추론 함수
+    (동시에 들어온 요청은 마이크로 배치로 묶여 한 번의 generate 로 처리됩니다)
+    같은 이미지는 결과 캐시(core/result_cache.py)에서 바로 돌려줍니다.
+    """
+    return run_inference_batch([image_input])[0]
+
+def run_inference_batch(images):
+    """
+    여러 이미지(한 사진에서 나눈 영수증들)를 한 번에 추론합니다. 결과는 images 와 같은 순서의 목록.
+    캐시에 없는 이미지만 모아 배치 스레드에 넣습니다. (모델 서버를 쓰면 서버가 같은 일을 대신 함)
+    """
+    if uses_model_server():
+        with telemetry.span('model_server'):
+            outputs = remote_inference_batch(images)
+        _record_timings(outputs)
+        return outputs
+
+    try:
+        backend = get_backend()
+        backend.load_model_lazy()
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return [{"status": "error", "message": f"모델 로딩 실패: {str(e)}"} for _ in images]
+
+    outputs = [None] * len(images)
+    pending = []   # (위치, pixel_values, 캐시 키, 전처리 ms)
+    cache = get_cache()
+    namespace = namespace_for(backend.model_fingerprint()) if cache is not None else None
+    for index, image_input in enumerate(images):
+        try:
+            # 1. 이미지 포맷 통일
+            if image_input.mode != "RGB":
+                image_input = image_input.convert("RGB")
+
+            # 2. 결과 캐시 조회 (디코딩된 픽셀 해시가 정확히 같을 때만)
+            key = None
+            if cache is not None:
+                with telemetry.span('cache_lookup'):
+                    key = content_hash(image_input)
+                    cached = cache.get(namespace, key)
+                if cached is not None:
+                    outputs[index] = copy.deepcopy(cached)
+                    if 'decoding' in outputs[index]:
+                        outputs[index]['decoding']['cached'] = True
+                    continue
+
+            # 3. 전처리 (요청 스레드에서 병렬로)
+            started = time.perf_counter()
+            pixel_values = backend.preprocess(image_input)
+            pending.append((index, pixel_values, key, (time.perf_counter() - started) * 1000))
+
+        except Exception as e:
+            outputs[index] = {"status": "error", "message": str(e)}
+
+    if not pending:
+        return outputs
+
+    # 4~6. 생성 + 후처리 (배치 스레드에서)
+    results = _batcher.submit_many([pixel_values for _, pixel_values, _, _ in pending])
+    for (index, _, key, preprocess_ms), output in zip(pending, results):
+        outputs[index] = output
+        if 'timing' in output:
+            output['timing']['preprocess_ms'] = round(preprocess_ms, 1)
+        if output['status'] != 'error':
+            _ready.set()  # 미리 올리지 않은 경우엔 첫 요청이 워밍업 역할
+            if cache is not None:
+                cached = {k: v for k, v in output.items() if k != 'timing'}
+                cache.put(namespace, key, copy.deepcopy(cached))
+    _record_timings(outputs)
+    return outputs
+
+def _record_timings(outputs):
+    """ 백엔드가 결과에 담아 준 단계별 시간 -> 히스토그램 / 요청 trace (core/telemetry.py) """
+    for output in outputs:
+        if output.get('timing'):
+            telemetry.record_model_timing(output['timing'])
@@ -0,0 +1,208 @@
+# web-service/core/ingest.py
+
+import tempfile
+from pathlib import Path
+
+from PIL import Image, ImageFilter
+from django.conf import settings
+
+# -----------------------------------------------------------------------------
+# 업로드 영수증 이미지 수집 (뷰 / 작업 큐 -> PIL 이미지)
+#
+# 휴대폰 사진(12MP 이상)을 통째로 메모리에 읽고 원본 해상도로 디코딩하면
+# 요청 하나가 수십 MB 를 쓰는데, 모델 입력은 1280x960 이면 충분합니다.
+#   1. 업로드를 조각 단위로 임시 파일에 저장하면서 용량 제한 확인
+#   2. 헤더만 읽어 가로x세로 픽셀 수 제한 확인 (디코딩 전)
+#   3. 작은 미리보기로 영수증 영역(밝은 종이)을 찾고
+#   4. JPEG 는 draft 모드(1/2, 1/4, 1/8 축소 디코딩)로 영수증 영역이 모델 입력 크기보다
+#      작아지지 않는 선에서 최대한 줄여서 디코딩 -> 영역만 잘라내기 -> EXIF 회전 적용
+#   여러 장 분리(INFERENCE_SPLIT_RECEIPTS)가 켜져 있으면 사진 전체가 아니라 영수증 한 장 한 장이
+#   모델 입력 크기 이상이어야 하므로, 원본 해상도로 디코딩하고 나눈 뒤 영수증별로 줄입니다. (core/receipt_split.py)
+# -----------------------------------------------------------------------------
+
+# 모델을 아직 못 올린 경우 사용할 입력 크기 (height, width), ai-engine/inference.py 와 동일
+DEFAULT_INPUT_SIZE = (1280, 960)
+
+# 영수증 영역 탐지용 미리보기 긴 변 길이
+PREVIEW_SIZE = 256
+
+# 영수증 영역이 이미지의 이 비율보다 작으면 탐지 실패로 보고, 이보다 크면 자를 필요가 없다고 봄
+MIN_CROP_AREA = 0.10
+MAX_CROP_AREA = 0.90
+CROP_MARGIN = 0.02
+
+# EXIF Orientation -> 회전/반전 (PIL.ImageOps.exif_transpose 와 같은 표)
+_EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+class ImageRejected(Exception):
+    """ 이미지가 아니거나 용량/픽셀 제한을 넘은 업로드 (뷰에서 400 으로 변환) """
+
+# -----------------------------------------------------------------------------
+# 1. 업로드 저장 + 제한 확인
+# -----------------------------------------------------------------------------
+def save_upload(image_file, path=None):
+    """
+    업로드 파일을 조각 단위로 디스크에 저장합니다. (path 가 없으면 임시 파일)
+    저장 중 INFERENCE_UPLOAD_MAX_MB 를 넘으면 바로 중단하고, 헤더로 이미지 여부/픽셀 수를 확인합니다.
+    """
+    max_bytes = settings.INFERENCE_UPLOAD_MAX_MB * 1024 * 1024
+    if image_file.size and image_file.size > max_bytes:
+        raise ImageRejected(f"이미지 용량이 너무 큽니다. (최대 {settings.INFERENCE_UPLOAD_MAX_MB}MB)")
+
+    if path is None:
+        suffix = Path(image_file.name or '').suffix.lower()
+        with tempfile.NamedTemporaryFile(prefix='receipt_', suffix=suffix, delete=False) as f:
+            path = Path(f.name)
+    path = Path(path)
+
+    try:
+        written = 0
+        with open(path, 'wb') as f:
+            for chunk in image_file.chunks():
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ImageRejected(f"이미지 용량이 너무 큽니다. (최대 {settings.INFERENCE_UPLOAD_MAX_MB}MB)")
+                f.write(chunk)
+        check_image(path)
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    return path
+
+def check_image(path):
+    """ 헤더만 읽어서 (디코딩 없이) 이미지 형식과 픽셀 수를 확인합니다. """
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise ImageRejected("이미지 파일을 읽을 수 없습니다. (JPG / PNG 파일을 올려주세요)")
+
+    if width * height > settings.INFERENCE_MAX_IMAGE_PIXELS:
+        raise ImageRejected(
+            f"이미지 해상도가 너무 큽니다. ({width}x{height}, 최대 {settings.INFERENCE_MAX_IMAGE_PIXELS:,} 픽셀)"
+        )
+    return width, height
+
+# -----------------------------------------------------------------------------
+# 2. 축소 디코딩 + 영수증 영역 자르기
+# -----------------------------------------------------------------------------
+def open_receipt_image(path, input_size=None, split=None):
+    """
+    저장된 업로드 이미지를 모델 입력에 필요한 만큼만 디코딩해서 RGB PIL 이미지로 반환합니다.
+    input_size 는 모델 입력 (height, width). 영수증 영역이 이 크기보다 작아지지 않게 축소합니다.
+    split (기본: INFERENCE_SPLIT_RECEIPTS) 이면 축소하지 않습니다. (나눈 뒤 reduce_for_model 로 영수증별 축소)
+    """
+    if split is None:
+        split = settings.INFERENCE_SPLIT_RECEIPTS
+    input_size = input_size or model_input_size()
+
+    with Image.open(path) as image:
+        width, height = image.size
+        orientation = image.getexif().get(0x0112)
+
+        # 영수증 영역 (원본 좌표)
+        box = find_receipt_box(path) if settings.INFERENCE_AUTO_CROP else None
+        box = box or (0, 0, width, height)
+        crop_w, crop_h = box[2] - box[0], box[3] - box[1]
+
+        # 영역의 짧은 변/긴 변이 각각 모델 입력의 짧은 변/긴 변 이상으로 남는 최대 축소 배율
+        # (JPEG draft 는 요청 크기 이상이 되는 1/2, 1/4, 1/8 중 가장 작은 크기로 디코딩)
+        scale = 1.0 if split else _fit_scale(crop_w, crop_h, input_size)
+        if scale > 1 and image.format == 'JPEG':
+            image.draft('RGB', (int(width / scale), int(height / scale)))
+
+        image = image.convert('RGB')
+        ratio = image.width / width
+        if box != (0, 0, width, height):
+            image = image.crop(tuple(round(v * ratio) for v in box))
+
+        # draft 로 못 줄인 나머지(PNG 등)는 정수배 축소 (전처리/캐시 해시가 다루는 픽셀 수 감소)
+        remaining = int(scale * ratio)
+        if remaining >= 2:
+            image = image.reduce(remaining)
+
+    if orientation in _EXIF_TRANSPOSE:
+        image = image.transpose(_EXIF_TRANSPOSE[orientation])
+    return image
+
+def reduce_for_model(image, input_size=None):
+    """ 모델 입력 크기보다 작아지지 않는 선에서 정수배 축소 (여러 장을 나눈 뒤 영수증별로 사용) """
+    input_size = input_size or model_input_size()
+    factor = int(_fit_scale(image.width, image.height, input_size))
+    return image.reduce(factor) if factor >= 2 else image
+
+def _fit_scale(width, height, input_size):
+    """ 짧은 변/긴 변이 각각 모델 입력의 짧은 변/긴 변 이상으로 남는 최대 축소 배율 """
+    short_side, long_side = sorted(input_size)
+    return min(min(width, height) / short_side, max(width, height) / long_side)
+
+def model_input_size():
+    """ 현재 추론 백엔드의 입력 크기. 모델 로딩에 실패하면 기본값 (추론 단계에서 다시 에러로 보고됨) """
+    from .inference import input_size
+    try:
+        return input_size()
+    except Exception:
+        return DEFAULT_INPUT_SIZE
+
+def find_receipt_box(path):
+    """
+    미리보기(긴 변 PREVIEW_SIZE)에서 배경보다 밝은 영역(영수증 종이)의 외곽 상자를 찾습니다.
+    원본 좌표 (left, top, right, bottom) 를 반환하고, 못 찾거나 자를 필요가 없으면 None.
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        if image.format == 'JPEG':
+            image.draft('L', (PREVIEW_SIZE, PREVIEW_SIZE))
+        preview = image.convert('L')
+    preview.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE), Image.Resampling.BILINEAR)
+
+    threshold = _otsu_threshold(preview.histogram())
+    mask = preview.point(lambda v: 255 if v > threshold else 0)
+    # 글자 획/점 같은 작은 구멍과 잡티 제거 (닫기 -> 열기)
+    mask = mask.filter(ImageFilter.MaxFilter(5)).filter(ImageFilter.MinFilter(5))
+    mask = mask.filter(ImageFilter.MinFilter(5)).filter(ImageFilter.MaxFilter(5))
+    bbox = mask.getbbox()
+    if bbox is None:
+        return None
+
+    area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) / (preview.width * preview.height)
+    if not MIN_CROP_AREA <= area <= MAX_CROP_AREA:
+        return None
+
+    sx, sy = width / preview.width, height / preview.height
+    mx, my = width * CROP_MARGIN, height * CROP_MARGIN
+    return (
+        max(0, int(bbox[0] * sx - mx)),
+        max(0, int(bbox[1] * sy - my)),
+        min(width, int(bbox[2] * sx + mx)),
+        min(height, int(bbox[3] * sy + my)),
+    )
+
+def _otsu_threshold(histogram):
+    """ 흑백 히스토그램을 두 무리(배경 / 종이)로 나누는 밝기 값 """
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    best, best_variance = 127, -1.0
+    weight_b = weighted_b = 0
+    for value, count in enumerate(histogram):
+        weight_b += count
+        if weight_b == 0:
+            continue
+        weight_f = total - weight_b
+        if weight_f == 0:
+            break
+        weighted_b += value * count
+        mean_b = weighted_b / weight_b
+        mean_f = (weighted_total - weighted_b) / weight_f
+        variance = weight_b * weight_f * (mean_b - mean_f) ** 2
+        if variance > best_variance:
+            best, best_variance = value, variance
+    return best
@@ -0,0 +1,193 @@
+# web-service/core/jobs.py
+
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import telemetry
+from .models import InferenceJob
+from .ingest import save_upload, open_receipt_image
+
+# 대기 작업이 없을 때 워커가 DB를 다시 확인하는 간격(초)
+# (다른 프로세스가 넣은 작업도 이 간격 안에 처리됨)
+POLL_INTERVAL = 5.0
+
+# 보관 기간이 지난 작업을 지우는 간격(초), 워커가 쉴 때만
+PRUNE_INTERVAL = 600.0
+
+ACTIVE_STATUSES = ('PENDING', 'RUNNING')
+FINISHED_STATUSES = ('DONE', 'FAILED')
+
+class JobQueueFull(Exception):
+    """ 대기 중인 작업이 INFERENCE_JOB_QUEUE_SIZE 이상이라 새 작업을 받을 수 없음 """
+
+# -----------------------------------------------------------------
+# 1. 작업 등록 (HTTP 요청 안에서는 파일 저장 + INSERT 만)
+# -----------------------------------------------------------------
+_submit_lock = threading.Lock()
+
+def submit_image_job(image_file):
+    """
+    업로드 이미지를 디스크에 저장하고 PENDING 작업으로 등록한 뒤 바로 반환합니다.
+    큐가 가득 차 있으면 JobQueueFull 을 던집니다. (뷰에서 503 + Retry-After 로 변환)
+    이미지가 아니거나 제한을 넘으면 ImageRejected 를 던집니다. (뷰에서 400 으로 변환)
+    파일 저장은 잠금 밖에서 하므로 동시에 올라온 업로드끼리 디스크 I/O 를 기다리지 않습니다.
+    """
+    # 저장 전에 한 번 확인 (가득 찼으면 파일을 받지 않고 바로 거절)
+    _check_queue_size()
+
+    job_id = uuid.uuid4()
+    job_dir = Path(settings.INFERENCE_JOB_DIR)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    image_path = job_dir / f"{job_id}{Path(image_file.name or '').suffix.lower()}"
+
+    # 큰 파일도 메모리에 한 번에 올리지 않도록 조각 단위로 저장 (용량/해상도 초과 시 ImageRejected)
+    with telemetry.span('upload'):
+        save_upload(image_file, image_path)
+
+    # 확인 + INSERT 만 잠금 안에서 (저장하는 사이 다른 요청이 자리를 채웠을 수 있음)
+    try:
+        with _submit_lock:
+            _check_queue_size()
+            job = InferenceJob.objects.create(id=job_id, image_path=str(image_path))
+    except Exception:
+        image_path.unlink(missing_ok=True)
+        raise
+
+    start_workers()
+    _wakeup.set()
+    return job
+
+def _check_queue_size():
+    active = InferenceJob.objects.filter(status__in=ACTIVE_STATUSES).count()
+    if active >= settings.INFERENCE_JOB_QUEUE_SIZE:
+        raise JobQueueFull(f"분석 대기 중인 작업이 너무 많습니다. ({active}건)")
+
+def queue_position(job):
+    """ 이 작업 앞에 대기 중인 작업 수 (PENDING 일 때만 의미 있음) """
+    return InferenceJob.objects.filter(status='PENDING', created_at__lt=job.created_at).count()
+
+# -----------------------------------------------------------------
+# 2. 워커 스레드 (DB 테이블을 큐로 사용)
+# -----------------------------------------------------------------
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+def start_workers():
+    """
+    워커 스레드를 (프로세스당 한 번만) 띄웁니다.
+    서버 시작 시(start_workers_at_boot), 그리고 작업을 등록할 때 부릅니다.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+
+        for i in range(max(settings.INFERENCE_JOB_WORKERS, 1)):
+            worker = threading.Thread(target=_worker_loop, name=f"inference-job-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+def start_workers_at_boot():
+    """
+    WSGI/ASGI 진입점(myacademy/wsgi.py, asgi.py)에서 부릅니다. (runserver 도 wsgi.py 를 거침)
+    재시작 전에 남은 PENDING 작업도 새 업로드를 기다리지 않고 바로 처리합니다.
+    스크립트 / 테스트 / 관리 명령은 이 진입점을 거치지 않으므로 워커가 뜨지 않습니다.
+    """
+    if settings.INFERENCE_JOB_WORKERS > 0 and settings.INFERENCE_JOB_WORKERS_AUTOSTART:
+        start_workers()
+
+def requeue_stale_jobs():
+    """
+    INFERENCE_JOB_TIMEOUT 초가 지나도록 RUNNING 인 작업을 다시 PENDING 으로 돌립니다.
+    (처리하던 프로세스가 죽은 작업. 다른 프로세스가 지금 처리 중인 작업은 건드리지 않음)
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.INFERENCE_JOB_TIMEOUT)
+    requeued = (
+        InferenceJob.objects.filter(status='RUNNING', started_at__lt=cutoff)
+        .update(status='PENDING', started_at=None)
+    )
+    if requeued:
+        print(f"♻️ 중단된 분석 작업 {requeued}건을 다시 대기열에 넣었습니다.")
+    return requeued
+
+def prune_finished_jobs():
+    """ INFERENCE_JOB_RETENTION_HOURS 보다 오래전에 끝난 작업(DONE/FAILED)을 결과와 함께 지웁니다. """
+    cutoff = timezone.now() - timedelta(hours=settings.INFERENCE_JOB_RETENTION_HOURS)
+    deleted, _ = InferenceJob.objects.filter(status__in=FINISHED_STATUSES, finished_at__lt=cutoff).delete()
+    if deleted:
+        print(f"🧹 보관 기간이 지난 분석 작업 {deleted}건을 삭제했습니다.")
+    return deleted
+
+_last_prune = 0.0
+
+def _prune_if_due():
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune >= PRUNE_INTERVAL:
+        _last_prune = now
+        prune_finished_jobs()
+
+def _claim_next_job():
+    """
+    가장 오래된 PENDING 작업 하나를 RUNNING 으로 바꾸며 가져옵니다.
+    조건부 UPDATE 라서 여러 워커(프로세스)가 동시에 가져가도 한 곳만 성공합니다.
+    """
+    while True:
+        job_id = (
+            InferenceJob.objects.filter(status='PENDING')
+            .order_by('created_at').values_list('id', flat=True).first()
+        )
+        if job_id is None:
+            return None
+        claimed = InferenceJob.objects.filter(id=job_id, status='PENDING').update(
+            status='RUNNING', started_at=timezone.now()
+        )
+        if claimed:
+            return InferenceJob.objects.get(id=job_id)
+
+def _worker_loop():
+    while True:
+        close_old_connections()
+        try:
+            job = _claim_next_job()
+            if job is None and requeue_stale_jobs():
+                job = _claim_next_job()
+            if job is None:
+                _prune_if_due()
+        except Exception as e:
+            print(f"Job Queue Error: {e}")
+            job = None
+
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        _run_job(job)
+
+def _run_job(job):
+    from .pipeline import process_image
+
+    image_path = Path(job.image_path)
+    print(f"🧾 분석 작업 시작: {job.id}")
+    try:
+        inference_info = []
+        with telemetry.span('decode'):
+            pil_image = open_receipt_image(image_path)
+        results = process_image(pil_image, inference_info)
+        job.status, job.result, job.inference = 'DONE', results, inference_info
+    except Exception as e:
+        print(f"Job Processing Error ({job.id}): {e}")
+        job.status, job.error = 'FAILED', str(e)
+    finally:
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'result', 'inference', 'error', 'finished_at'])
+        image_path.unlink(missing_ok=True)
+    print(f"✅ 분석 작업 종료: {job.id} ({job.status})")
@@ -0,0 +1,149 @@
+# web-service/core/ledger.py
+
+import re
+import threading
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Student, Payment, OutstandingBalance
+
+# 입금으로 인정하는 Payment 상태 (금액 불일치라도 돈은 들어온 것으로 봄)
+RECEIVED_STATUSES = ('PAID', 'MISMATCH')
+
+# -----------------------------------------------------------------
+# 1. 청구 기간
+# -----------------------------------------------------------------
+def current_period():
+    return period_of(timezone.localdate())
+
+def period_of(date):
+    """ 날짜 -> 청구 기간 문자열 ('2025-11') """
+    return f"{date.year:04d}-{date.month:02d}"
+
+PERIOD_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+def is_valid_period(period):
+    """ 'YYYY-MM' 형식인지 (청구 기간은 사용자 입력으로도 들어오므로 장부에 쓰기 전에 확인) """
+    return bool(PERIOD_PATTERN.match(period or ''))
+
+def _period_range(period):
+    year, month = (int(part) for part in period.split('-'))
+    return (year, month)
+
+# -----------------------------------------------------------------
+# 2. 장부 갱신 (증분)
+# -----------------------------------------------------------------
+def open_period(period):
+    """
+    해당 기간 장부에 아직 행이 없는 학생들을 (청구액 = 수강료 + 교재비) 로 추가합니다.
+    이미 있는 학생은 건드리지 않으므로 여러 번 불러도 안전합니다.
+    """
+    missing = (
+        Student.objects
+        .exclude(balances__billing_period=period)
+        .values_list('id', 'base_fee', 'book_fee')
+    )
+    rows = [
+        OutstandingBalance(student_id=student_id, billing_period=period, amount_due=base_fee + book_fee)
+        for student_id, base_fee, book_fee in missing
+    ]
+    if rows:
+        OutstandingBalance.objects.bulk_create(rows, ignore_conflicts=True)
+        bump_version()
+    return len(rows)
+
+def sync_student(student, period=None):
+    """ 학생 수강료/교재비가 바뀌면 (현재 기간) 청구액을 맞춥니다. """
+    period = period or current_period()
+    OutstandingBalance.objects.update_or_create(
+        student_id=student.pk, billing_period=period,
+        defaults={'amount_due': student.base_fee + student.book_fee},
+    )
+    bump_version()
+
+def refresh_balance(student_id, period, bump=True):
+    """
+    (학생, 기간) 한 행의 입금액만 Payment 에서 다시 합산합니다.
+    전체 장부를 다시 계산하지 않으므로 입금 건이 많아도 비용이 일정합니다.
+    bump=False 이면 버전을 올리지 않습니다. (여러 행을 고친 뒤 한 번만 올리는 apply_payments 용)
+    """
+    year, month = _period_range(period)
+    paid = Payment.objects.filter(
+        student_id=student_id,
+        payment_date__year=year,
+        payment_date__month=month,
+        status__in=RECEIVED_STATUSES,
+    ).aggregate(total=Sum('amount_paid'))['total'] or 0
+
+    updated = OutstandingBalance.objects.filter(
+        student_id=student_id, billing_period=period
+    ).update(amount_paid=paid)
+
+    if not updated:
+        student = Student.objects.filter(id=student_id).values('base_fee', 'book_fee').first()
+        if student is None:
+            return
+        OutstandingBalance.objects.create(
+            student_id=student_id, billing_period=period,
+            amount_due=student['base_fee'] + student['book_fee'], amount_paid=paid,
+        )
+    # 같은 트랜잭션 안에서 올려야 커밋되는 순간 장부와 버전이 함께 보입니다.
+    if bump:
+        bump_version()
+
+def apply_payments(payments):
+    """
+    bulk_create 로 저장한 Payment 들을 장부에 반영합니다. (bulk_create 는 시그널이 없음)
+    버전은 모든 행을 고친 뒤 한 번만 올립니다.
+    """
+    rows = {(p.student_id, period_of(p.payment_date)) for p in payments}
+    for student_id, period in rows:
+        refresh_balance(student_id, period, bump=False)
+    if rows:
+        bump_version()
+
+# -----------------------------------------------------------------
+# 3. 미납 학생 조회 (메모리 캐시, 버전은 DB 에 저장 - core/versions.py)
+# -----------------------------------------------------------------
+VERSION_NAME = 'ledger'
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def bump_version():
+    """ 장부가 바뀌었음을 모든 프로세스에 알립니다. (장부를 바꾼 트랜잭션 안에서 호출) """
+    from . import versions
+    versions.bump(VERSION_NAME)
+
+def current_version():
+    from . import versions
+    return versions.current(VERSION_NAME)
+
+def outstanding_student_ids(period=None, roster_version=None):
+    """
+    해당 기간에 잔액이 남은 학생 id 집합을 반환합니다.
+    장부(Payment) 또는 학생 명단 버전이 바뀌었을 때만 DB를 한 번 조회합니다.
+    (다른 프로세스에서 기록한 입금도 DB 버전으로 알아챔)
+    조회만 하고 장부에는 쓰지 않습니다. 기간의 행은 open_period 가 만듭니다.
+    (학생 저장 시그널 / 명단 일괄 등록 / POST /api/balances/open/ / manage.py open_period)
+    """
+    period = period or current_period()
+    key = (period, roster_version)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == current_version():
+            return cached[1]
+
+        version = current_version()
+        ids = frozenset(
+            OutstandingBalance.objects
+            .filter(billing_period=period, amount_paid__lt=F('amount_due'))
+            .values_list('student_id', flat=True)
+        )
+        # 이전 명단 버전의 캐시는 더 이상 쓰지 않으므로 정리
+        for stale in [k for k in _cache if k[0] == period and k != key]:
+            del _cache[stale]
+        _cache[key] = (version, ids)
+        return ids
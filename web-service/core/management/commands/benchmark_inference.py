@@ -0,0 +1,399 @@
+# web-service/core/management/commands/benchmark_inference.py
+
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.model_store import QUANTIZE_MODES
+
+# -----------------------------------------------------------------------------
+# 추론 설정별 지연 시간 / 처리량 / 메모리 / 필드 정확도 비교 (합성 영수증 평가셋)
+#
+#   python manage.py benchmark_inference --beams 1,4 --sizes default,960x720 --threads 0,4
+#
+# 1. ai-engine/generate_dataset.py 로 seed 고정 평가셋을 만들고 (이미 있으면 재사용)
+# 2. 옵션 조합(백엔드 / 양자화 / 디코딩 / beam 수 / 해상도 / max_length / 스레드 / 배치 크기)마다
+#    새 프로세스(--run-config)를 띄워, 운영과 같은 백엔드 코드로 평가셋 전체를 추론합니다.
+#    (최대 RSS 와 torch 스레드 수는 프로세스 단위라 설정끼리 섞이지 않게 따로 잼)
+# 3. p50/p95 지연 시간, 초당 이미지 수, 최대 RSS, student/amount/date 정확도를 표로 보여주고
+#    JSON 으로 저장합니다. (benchmark_results/, 실행끼리 비교용)
+# 설정 하나는 INFERENCE_* 환경변수 묶음이라, 고른 설정은 그 환경변수를 그대로 서버에 주면 됩니다.
+# -----------------------------------------------------------------------------
+
+AI_ENGINE_DIR = Path(settings.BASE_DIR).parent / 'ai-engine'
+RESULTS_DIR = Path(settings.BASE_DIR) / 'benchmark_results'
+
+FIELDS = ('student', 'amount', 'date')
+
+# 설정 항목 -> 환경변수 (batch_size 는 벤치마크가 한 번에 generate 할 이미지 수 = INFERENCE_MAX_BATCH_SIZE)
+CONFIG_ENV = {
+    'backend': 'INFERENCE_BACKEND',
+    'quantize': 'INFERENCE_QUANTIZE',
+    'decoding': 'INFERENCE_DECODING',
+    'beams': 'INFERENCE_NUM_BEAMS',
+    'image_size': 'INFERENCE_IMAGE_SIZE',
+    'max_length': 'INFERENCE_MAX_LENGTH',
+    'threads': 'INFERENCE_NUM_THREADS',
+    'constrained': 'INFERENCE_CONSTRAINED',
+    'batch_size': 'INFERENCE_MAX_BATCH_SIZE',
+}
+
+class Command(BaseCommand):
+    help = "추론 설정 조합별 지연 시간(p50/p95), 처리량, 최대 메모리, 필드 정확도를 합성 영수증으로 비교합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help="평가셋 영수증 수 (generate_dataset.py 로 생성)")
+        parser.add_argument('--seed', type=int, default=1234, help="평가셋 seed (같은 seed 면 같은 평가셋)")
+        parser.add_argument('--dataset', default=None, help="이미 있는 images/, labels/ 폴더를 평가셋으로 사용")
+        parser.add_argument('--limit', type=int, default=None, help="평가할 영수증 수 (파일명 순서로 앞에서부터)")
+        parser.add_argument('--output', default=None, help="결과 JSON 경로 (기본: benchmark_results/benchmark_<시각>.json)")
+
+        # 비교할 설정 (쉼표로 여러 값 -> 모든 조합을 실행)
+        parser.add_argument('--backends', default='torch', help="torch,onnx,torchscript")
+        parser.add_argument('--modes', default=",".join(QUANTIZE_MODES), help="torch 양자화 모드 (예: none,decoder)")
+        parser.add_argument('--decodings', default='beam', help="beam,greedy,adaptive")
+        parser.add_argument('--beams', default='4', help="beam 수 (예: 1,4)")
+        parser.add_argument('--sizes', default='default', help="입력 해상도 HxW (default 는 모델 설정, 예: default,960x720)")
+        parser.add_argument('--max-lengths', default='768', help="생성 최대 토큰 수 (예: 256,768)")
+        parser.add_argument('--threads', default='0', help="연산당 스레드 수 (0 은 코어 수, 예: 0,2,4)")
+        parser.add_argument('--batch-sizes', default='1', help="한 번에 generate 할 이미지 수 (예: 1,4)")
+        parser.add_argument('--constrained', default='0', help="스키마 제약 디코딩 (예: 0,1)")
+
+        # 내부용: 설정 하나를 이 프로세스에서 실행하고 결과를 파일로 남김
+        parser.add_argument('--run-config', default=None, help="(내부용) 설정 JSON")
+        parser.add_argument('--result-file', default=None, help="(내부용) 결과 JSON 경로")
+
+    def handle(self, *args, **options):
+        if options['run_config']:
+            config = json.loads(options['run_config'])
+            result = run_config(config, Path(options['dataset']), options['limit'])
+            Path(options['result_file']).write_text(json.dumps(result, ensure_ascii=False), encoding='utf-8')
+            return
+
+        if options['dataset']:
+            dataset_dir = Path(options['dataset'])
+            eval_set = {'dataset': str(dataset_dir)}
+        else:
+            dataset_dir = ensure_eval_set(options['count'], options['seed'], self.stdout)
+            eval_set = {'dataset': str(dataset_dir), 'count': options['count'], 'seed': options['seed']}
+        limit = options['limit']
+        total = len(list_images(dataset_dir, limit))
+
+        configs = expand_configs(options)
+        self.stdout.write(f"🧪 영수증 {total}장, 설정 {len(configs)}개 ({dataset_dir})")
+
+        reports = []
+        for index, config in enumerate(configs, 1):
+            self.stdout.write(f"  [{index}/{len(configs)}] {config_label(config)} ...")
+            reports.append(self.run_in_subprocess(config, dataset_dir, limit))
+
+        # 첫 번째 설정(보통 기본값)과 필드 값이 모두 같은 비율
+        baseline = next((r['predictions'] for r in reports if 'predictions' in r), None)
+        for report in reports:
+            predictions = report.pop('predictions', None)
+            if predictions is not None and baseline:
+                report['agree_with_first'] = sum(p == b for p, b in zip(predictions, baseline)) / len(baseline)
+
+        self.print_table(reports)
+
+        output = Path(options['output'] or RESULTS_DIR / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'eval_set': {**eval_set, 'images': total},
+            'machine': {
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+            },
+            'results': reports,
+        }, ensure_ascii=False, indent=2), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f"💾 결과 저장: {output}"))
+
+    def run_in_subprocess(self, config, dataset_dir, limit):
+        env = {**os.environ, **config_env(config)}
+        env['INFERENCE_PRELOAD'] = '0'
+        env['INFERENCE_SERVER_SOCKET'] = ''
+
+        with tempfile.TemporaryDirectory(prefix='benchmark_') as tmp:
+            result_file = Path(tmp) / 'result.json'
+            command = [
+                sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark_inference',
+                '--run-config', json.dumps(config), '--dataset', str(dataset_dir),
+                '--result-file', str(result_file),
+            ]
+            if limit:
+                command += ['--limit', str(limit)]
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            if completed.returncode != 0 or not result_file.exists():
+                message = (completed.stderr or completed.stdout).strip().splitlines()[-1:] or ['알 수 없는 오류']
+                self.stdout.write(self.style.WARNING(f"    ⚠️ 실패: {message[0]}"))
+                return {'config': config, 'env': config_env(config), 'error': message[0]}
+            return json.loads(result_file.read_text(encoding='utf-8'))
+
+    def print_table(self, reports):
+        header = (
+            f"{'config':<52} {'load(s)':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'img/s':>7} {'RSS(MB)':>8} "
+            f"{'student':>8} {'amount':>8} {'date':>8} {'exact':>8} {'=first':>8}"
+        )
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in reports:
+            label = config_label(r['config'])
+            if 'error' in r:
+                self.stdout.write(f"{label:<52} ❌ {r['error']}")
+                continue
+            rss = f"{r['peak_rss_mb']:>8.0f}" if r['peak_rss_mb'] is not None else f"{'-':>8}"
+            self.stdout.write(
+                f"{label:<52} {r['load_s']:>8.1f} {r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f} "
+                f"{r['images_per_sec']:>7.2f} {rss} "
+                f"{r['student_acc']:>8.1%} {r['amount_acc']:>8.1%} {r['date_acc']:>8.1%} "
+                f"{r['exact_acc']:>8.1%} {r.get('agree_with_first', 0):>8.1%}"
+            )
+
+# -----------------------------------------------------------------------------
+# 설정 조합
+# -----------------------------------------------------------------------------
+def _values(text):
+    return [value.strip() for value in str(text).split(',') if value.strip()]
+
+def expand_configs(options):
+    """ 옵션 값들의 모든 조합 -> 설정 목록 (백엔드에 해당 없는 항목은 None 으로 두고 중복 제거) """
+    for mode in _values(options['modes']):
+        if mode not in QUANTIZE_MODES:
+            raise CommandError(f"알 수 없는 양자화 모드입니다: {mode}")
+    for decoding in _values(options['decodings']):
+        if decoding not in ('beam', 'greedy', 'adaptive'):
+            raise CommandError(f"알 수 없는 디코딩 방식입니다: {decoding}")
+
+    configs, seen = [], set()
+    for backend, quantize, decoding, beams, size, max_length, threads, batch_size, constrained in itertools.product(
+        _values(options['backends']), _values(options['modes']), _values(options['decodings']),
+        _values(options['beams']), _values(options['sizes']), _values(options['max_lengths']),
+        _values(options['threads']), _values(options['batch_sizes']), _values(options['constrained']),
+    ):
+        config = {
+            'backend': backend,
+            'quantize': quantize,
+            'decoding': decoding,
+            'beams': int(beams),
+            'image_size': None if size == 'default' else size.lower(),
+            'max_length': int(max_length),
+            'threads': int(threads),
+            'batch_size': int(batch_size),
+            'constrained': constrained.lower() in ('1', 'true', 'yes'),
+        }
+        if config['decoding'] == 'greedy' or config['beams'] == 1:
+            config['decoding'], config['beams'] = 'greedy', None
+        if backend != 'torch':
+            # 내보낸 모델은 greedy 전용, 해상도는 내보낼 때 고정
+            config.update(quantize=None, decoding='greedy', beams=None, image_size=None)
+
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+def config_env(config):
+    env = {}
+    for key, name in CONFIG_ENV.items():
+        value = config.get(key)
+        if value is None:
+            continue
+        env[name] = ('1' if value else '0') if isinstance(value, bool) else str(value)
+    return env
+
+def config_label(config):
+    parts = [config['backend']]
+    if config.get('quantize') not in (None, 'none'):
+        parts.append(f"int8-{config['quantize']}")
+    decoding = config.get('decoding') or 'greedy'
+    parts.append(decoding if decoding == 'greedy' else f"{decoding}{config['beams']}")
+    parts.append(config.get('image_size') or 'default')
+    parts.append(f"len{config['max_length']}")
+    parts.append(f"t{config['threads'] or 'auto'}")
+    parts.append(f"b{config['batch_size']}")
+    if config.get('constrained'):
+        parts.append('schema')
+    return " ".join(parts)
+
+# -----------------------------------------------------------------------------
+# 설정 하나 실행 (--run-config 로 뜬 자식 프로세스)
+# -----------------------------------------------------------------------------
+def run_config(config, dataset_dir, limit):
+    from core import inference
+    from core.ingest import open_receipt_image
+    from core.model_server import configure_threads
+
+    inference.use_local_model()
+    configure_threads()
+
+    started = time.perf_counter()
+    backend = inference.get_backend()
+    backend.load_model_lazy()
+    load_seconds = time.perf_counter() - started
+
+    # 운영과 같은 입력: 업로드 이미지를 ingest 로 모델 입력 크기에 맞춰 디코딩 (측정에서 제외)
+    # 영수증 한 장짜리 데이터셋을 바로 backend 에 넣으므로 여러 장 분리용 원본 해상도 디코딩은 끔
+    samples = [(open_receipt_image(path, split=False), label) for path, label in load_samples(dataset_dir, limit)]
+
+    # 워밍업 (측정에서 제외)
+    backend.warm_up()
+    backend.generate_batch(backend.preprocess(samples[0][0]))
+
+    batch_size = max(config['batch_size'], 1)
+    latencies, predictions, tokens, tokens_per_sec = [], [], [], []
+    correct = {field: 0 for field in FIELDS}
+    exact = errors = 0
+    total_seconds = 0.0
+    for start in range(0, len(samples), batch_size):
+        batch = samples[start:start + batch_size]
+        begin = time.perf_counter()
+        pixel_values = backend.stack([backend.preprocess(image) for image, _ in batch])
+        outputs = backend.generate_batch(pixel_values)
+        elapsed = time.perf_counter() - begin
+        total_seconds += elapsed
+        # 같은 배치의 영수증은 모두 배치가 끝날 때 결과를 받음
+        latencies.extend([elapsed * 1000] * len(batch))
+
+        for (_, label), output in zip(batch, outputs):
+            errors += output.get('status') == 'error'
+            timing = output.get('timing') or {}
+            if timing.get('tokens') is not None:
+                tokens.append(timing['tokens'])
+                if timing.get('decoder_ms'):
+                    tokens_per_sec.append(timing['tokens'] / (timing['decoder_ms'] / 1000))
+
+            predicted = extract_fields(output)
+            predictions.append(predicted)
+            hits = [predicted[field] == label[field] for field in FIELDS]
+            for field, hit in zip(FIELDS, hits):
+                correct[field] += hit
+            exact += all(hits)
+
+    latencies.sort()
+    total = len(samples)
+    return {
+        'config': config,
+        'env': config_env(config),
+        'images': total,
+        'input_size': list(backend.input_size()),
+        'load_s': round(load_seconds, 2),
+        'p50_ms': round(latencies[total // 2], 1),
+        'p95_ms': round(latencies[min(int(total * 0.95), total - 1)], 1),
+        'mean_ms': round(statistics.mean(latencies), 1),
+        'images_per_sec': round(total / total_seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'tokens_mean': round(statistics.mean(tokens), 1) if tokens else None,
+        'tokens_per_sec_p50': round(statistics.median(tokens_per_sec), 1) if tokens_per_sec else None,
+        **{f'{field}_acc': correct[field] / total for field in FIELDS},
+        'exact_acc': exact / total,
+        'errors': errors,
+        'predictions': predictions,
+    }
+
+def peak_rss_mb():
+    """ 이 프로세스의 최대 RSS (MB). resource 모듈이 없는 Windows 에서는 None """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 는 KB, macOS 는 바이트 단위
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# -----------------------------------------------------------------------------
+# 평가셋 / 필드 비교
+# -----------------------------------------------------------------------------
+def ensure_eval_set(count, seed, stdout):
+    """ ai-engine/dataset/benchmark_seed<seed>_n<count> 에 seed 고정 평가셋을 (없으면) 만듭니다. """
+    dataset_dir = AI_ENGINE_DIR / 'dataset' / f'benchmark_seed{seed}_n{count}'
+    if len(list((dataset_dir / 'labels').glob('*.json'))) >= count:
+        return dataset_dir
+
+    stdout.write(f"🧾 평가셋 생성 중: 영수증 {count}장 (seed={seed}) -> {dataset_dir}")
+    completed = subprocess.run(
+        [sys.executable, 'generate_dataset.py', '--out', str(dataset_dir), '--count', str(count), '--seed', str(seed)],
+        cwd=AI_ENGINE_DIR, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        last_line = (completed.stderr.strip().splitlines() or ['알 수 없는 오류'])[-1]
+        raise CommandError(
+            f"평가셋 생성 실패: {last_line} "
+            "(ai-engine/requirements.txt 의 albumentations / Faker 가 필요합니다. 또는 --dataset 으로 기존 폴더 지정)"
+        )
+    return dataset_dir
+
+def list_images(dataset_dir, limit):
+    image_files = sorted((dataset_dir / 'images').glob('*.jpg'))[:limit]
+    if not image_files:
+        raise CommandError(
+            f"{dataset_dir / 'images'} 에 영수증 이미지가 없습니다. "
+            "먼저 ai-engine 폴더에서 python generate_dataset.py 로 합성 데이터를 만들어주세요."
+        )
+    return image_files
+
+def load_samples(dataset_dir, limit):
+    """ [(이미지 경로, 정답 필드), ...] """
+    samples = []
+    for image_path in list_images(dataset_dir, limit):
+        with open(dataset_dir / 'labels' / f"{image_path.stem}.json", encoding='utf-8') as f:
+            receipt = json.load(f)['receipts'][0]
+        label = {
+            'student': normalize_text(receipt.get('student')),
+            'amount': normalize_amount(receipt.get('amount')),
+            'date': normalize_text(receipt.get('date')),
+        }
+        samples.append((image_path, label))
+    return samples
+
+def extract_fields(output):
+    """
+    run_inference 결과에서 student / amount / date 를 꺼냅니다.
+    학습 라벨이 JSON 문자열({"receipts": [...]})이라, 모델 출력도 JSON 텍스트로 오는 경우를 먼저 처리합니다.
+    """
+    result = output.get('result') or {}
+    text = result.get('text_sequence') or result.get('text_content')
+    if text:
+        try:
+            result = json.loads(text)
+        except ValueError:
+            result = {}
+
+    receipts = result.get('receipts') if isinstance(result, dict) else None
+    receipt = receipts[0] if isinstance(receipts, list) and receipts and isinstance(receipts[0], dict) else result
+    if not isinstance(receipt, dict):
+        receipt = {}
+
+    return {
+        'student': normalize_text(receipt.get('student')),
+        'amount': normalize_amount(receipt.get('amount', receipt.get('total_price'))),
+        'date': normalize_text(receipt.get('date')),
+    }
+
+def normalize_text(value):
+    return re.sub(r'\s+', '', str(value)) if value is not None else None
+
+def normalize_amount(value):
+    """ 250000 / '250,000' / '25만원' -> 250000 """
+    if value is None:
+        return None
+    text = str(value).replace(',', '')
+    match = re.search(r'(\d+)\s*만', text)
+    if match:
+        return int(match.group(1)) * 10000
+    digits = re.sub(r'\D', '', text)
+    return int(digits) if digits else None
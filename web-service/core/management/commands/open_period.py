@@ -0,0 +1,19 @@
+# web-service/core/management/commands/open_period.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import ledger
+
+class Command(BaseCommand):
+    help = "청구 기간 장부에 아직 없는 학생 행을 만듭니다. (매달 1일 cron 으로 실행, 여러 번 실행해도 안전)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', default=None, help="청구 기간 YYYY-MM (기본: 이번 달)")
+
+    def handle(self, *args, **options):
+        period = options['period'] or ledger.current_period()
+        if not ledger.is_valid_period(period):
+            raise CommandError(f"period 는 YYYY-MM 형식이어야 합니다: {period}")
+
+        created = ledger.open_period(period)
+        self.stdout.write(self.style.SUCCESS(f"✅ {period} 장부 열기 완료: {created}명 추가"))
@@ -0,0 +1,44 @@
+# web-service/core/management/commands/run_model_server.py
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import inference
+from core.model_server import ModelServer, configure_threads
+
+class Command(BaseCommand):
+    help = "AI 모델을 한 번만 올려두고 Django 워커들의 추론 요청을 Unix 소켓으로 받는 서버를 실행합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None, help="소켓 경로 (기본: settings.INFERENCE_SERVER_SOCKET)")
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="동시에 처리할 요청 수 (기본: settings.INFERENCE_SERVER_CONCURRENCY)")
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or settings.INFERENCE_SERVER_SOCKET
+        if not socket_path:
+            raise CommandError("소켓 경로가 없습니다. --socket 또는 INFERENCE_SERVER_SOCKET 을 지정해주세요.")
+        concurrency = options['concurrency'] or settings.INFERENCE_SERVER_CONCURRENCY
+
+        # 이 프로세스가 모델을 직접 들고 추론 (스레드 수는 모델을 올리기 전에 정해야 함)
+        inference.use_local_model()
+        configure_threads()
+        try:
+            inference.preload_model()
+        except Exception as e:
+            raise CommandError(f"모델을 불러오지 못했습니다: {e}")
+
+        server = ModelServer(socket_path, concurrency)
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 모델 서버 실행 중: {socket_path} (백엔드: {settings.INFERENCE_BACKEND}, 동시 요청: {concurrency})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            Path(socket_path).unlink(missing_ok=True)
+            self.stdout.write("👋 모델 서버 종료")
@@ -0,0 +1,27 @@
+# web-service/core/management/commands/snapshot_model.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.inference import MODEL_ID
+from core.torch_backend import load_hub_model
+from core.model_store import save_snapshot
+
+class Command(BaseCommand):
+    help = "Hugging Face Hub 의 영수증 모델/프로세서를 로컬 폴더(safetensors)로 저장합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-id', default=MODEL_ID, help="Hub 모델 ID (기본: core/inference.py 의 MODEL_ID)")
+        parser.add_argument('--output', default=None, help="저장 폴더 (기본: settings.INFERENCE_MODEL_DIR)")
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.INFERENCE_MODEL_DIR
+
+        try:
+            model, processor = load_hub_model(options['model_id'])
+        except Exception as e:
+            raise CommandError(f"모델을 불러오지 못했습니다: {e}")
+
+        path = save_snapshot(model, processor, output, options['model_id'])
+        self.stdout.write(self.style.SUCCESS(f"✅ 모델 스냅샷 저장 완료: {path}"))
+        self.stdout.write("   서버는 다음 로딩부터 이 폴더를 사용합니다. (INFERENCE_MODEL_DIR)")
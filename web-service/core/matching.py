@@ -0,0 +1,276 @@
+# web-service/core/matching.py
+
+from itertools import combinations
+from math import comb, prod
+
+import numpy as np
+
+# -----------------------------------------------------------------
+# 1. 금액 버킷 (같은 금액의 학생끼리 묶기)
+# -----------------------------------------------------------------
+def group_by_fee(items, fee_of):
+    """
+    학생 목록을 금액별 버킷으로 묶어 금액 오름차순으로 반환합니다.
+    (5,500명이라도 실제 수강료 종류는 몇 개뿐이므로 탐색 공간이 크게 줄어듭니다.)
+
+    반환: [(fee, [학생, ...]), ...]  (fee <= 0 인 학생은 합산 대상에서 제외)
+    """
+    return group_by_charges(items, lambda item: (fee_of(item),))
+
+def student_charges(student):
+    """
+    학생 한 명이 낼 수 있는 금액 후보: 수강료, 교재비, 수강료+교재비
+    (교재비가 없는 학생은 수강료 하나뿐)
+    """
+    if student.book_fee > 0:
+        return (student.base_fee, student.book_fee, student.base_fee + student.book_fee)
+    return (student.base_fee,)
+
+def group_by_charges(items, charges_of):
+    """
+    학생마다 여러 금액 후보(charges_of)를 가질 때의 버킷입니다.
+    한 학생이 여러 버킷에 들어갈 수 있으므로, 조합을 만들 때 같은 학생이 두 번 쓰이지 않게 확인합니다.
+    버킷 안에서는 그 금액이 앞쪽 후보(수강료)인 학생이 먼저 오도록 정렬합니다. (대표 조합이 수강료 우선)
+    """
+    buckets = {}
+    for item in items:
+        charges = charges_of(item)
+        for fee in set(charges):
+            if fee <= 0:
+                continue
+            buckets.setdefault(fee, []).append((charges.index(fee), item))
+    return [
+        (fee, [item for _, item in sorted(members, key=lambda m: m[0])])
+        for fee, members in sorted(buckets.items())
+    ]
+
+def charge_kind(student, fee):
+    """ 금액이 그 학생의 어떤 항목인지 ('base' / 'book' / 'base+book') """
+    if fee == student.base_fee:
+        return 'base'
+    if fee == student.book_fee:
+        return 'book'
+    return 'base+book'
+
+# -----------------------------------------------------------------
+# 2. Subset-Sum 탐색 (NumPy 브로드캐스팅 + 가지치기)
+# -----------------------------------------------------------------
+def find_fee_combinations(fees, counts, target, tolerance, size):
+    """
+    정렬된 금액 목록(fees)에서 중복 허용(단, 버킷 인원수 이내) 조합 중
+    합계가 target ± tolerance 안에 드는 size개짜리 조합을 모두 찾습니다.
+
+    한 단계마다 '지금까지의 부분합 배열 x 금액 배열'을 브로드캐스팅으로 한 번에 더하고,
+    - 인덱스가 오름차순이 아닌 조합 (중복 순서)
+    - 남은 인원을 지금 금액으로만 채워도 상한을 넘는 조합
+    - 남은 인원을 가장 비싼 금액으로 채워도 하한에 못 미치는 조합
+    을 마스크로 한꺼번에 걸러냅니다. (Python 루프는 인원수(size)만큼만 돕니다)
+
+    반환: (조합 수, size) 크기의 인덱스 배열 (행마다 오름차순)
+    """
+    fees = np.asarray(fees, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    n = len(fees)
+    if n == 0 or size < 1:
+        return np.empty((0, max(size, 0)), dtype=np.int64)
+
+    low, high = target - tolerance, target + tolerance
+    columns = np.arange(n)
+
+    def prune(sums, last, remaining):
+        return (
+            (sums + remaining * fees[last] <= high) &
+            (sums + remaining * fees[-1] >= low)
+        )
+
+    # 1명 고른 상태에서 시작
+    keep = prune(fees, columns, size - 1)
+    picked = columns[keep][:, None]
+    sums = fees[keep]
+
+    for step in range(2, size + 1):
+        if len(picked) == 0:
+            break
+        remaining = size - step
+        last = picked[:, -1]
+
+        new_sums = sums[:, None] + fees[None, :]                       # (조합 수, n)
+        used = (picked[:, :, None] == columns[None, None, :]).sum(axis=1)
+        valid = (
+            (columns[None, :] >= last[:, None]) &                      # 오름차순 (중복 순서 제거)
+            (used + 1 <= counts[None, :]) &                            # 버킷 인원수 이내
+            prune(new_sums, columns[None, :], remaining)
+        )
+        rows, cols = np.nonzero(valid)
+        picked = np.hstack([picked[rows], cols[:, None]])
+        sums = new_sums[rows, cols]
+
+    in_range = (sums >= low) & (sums <= high)
+    return picked[in_range]
+
+# -----------------------------------------------------------------
+# 3. 후보 조합 생성 + 순위 매기기
+# -----------------------------------------------------------------
+def match_fee_combinations(items, fee_of, paid_amount, tolerance=1000,
+                           min_batch_size=2, max_batch_size=3):
+    """
+    (N:1 매칭 엔진) 입금액과 합계가 맞는 학생 조합 후보를 '모두' 찾아 순위대로 반환합니다.
+
+    각 후보는 금액 단위 조합이며, 같은 금액의 학생들은 groups 안에 함께 담깁니다.
+    (예: 250,000원 학생이 800명이면 800C2 개의 학생 조합을 하나의 후보로 표현)
+
+    순위: 인원수가 적을수록 → 금액 차이가 작을수록 → (kind_of 를 주면) 수강료가 아닌 항목이 적을수록
+          → 가능한 학생 조합 수가 적을수록(덜 모호)
+    """
+    return match_bucket_combinations(
+        group_by_fee(items, fee_of), paid_amount, tolerance, min_batch_size, max_batch_size
+    )
+
+def match_bucket_combinations(buckets, paid_amount, tolerance=1000,
+                              min_batch_size=2, max_batch_size=3, kind_of=None):
+    """
+    match_fee_combinations 와 같지만, 미리 만들어 둔 금액 버킷(group_by_fee / group_by_charges 결과)을 받습니다.
+    (명단 스냅샷에 버킷을 캐시해 두고 입금 건마다 재사용할 때 사용)
+
+    버킷끼리 학생이 겹칠 수 있으므로(수강료 / 수강료+교재비), 서로 다른 학생으로
+    채울 수 없는 조합은 버립니다. 'combinations' 는 겹침을 무시한 상한값입니다.
+    kind_of(학생, 금액) 을 주면 대표 조합의 항목 종류('base' 등)를 'kinds' 에 담습니다.
+    """
+    fees = [fee for fee, _ in buckets]
+    counts = [len(members) for _, members in buckets]
+
+    candidates = []
+    for size in range(min_batch_size, max_batch_size + 1):
+        for picked in find_fee_combinations(fees, counts, paid_amount, tolerance, size):
+            multiplicity = {}
+            for i in picked.tolist():
+                multiplicity[i] = multiplicity.get(i, 0) + 1
+
+            groups = [
+                {'fee': fees[i], 'count': m, 'students': buckets[i][1]}
+                for i, m in multiplicity.items()
+            ]
+            # 대표 조합: 서로 다른 학생으로 각 버킷을 채움 (불가능하면 후보 아님)
+            representative = _pick_distinct(groups)
+            if representative is None:
+                continue
+
+            total_fee = sum(fees[i] for i in picked.tolist())
+            candidate = {
+                'fees': [fees[i] for i in picked.tolist()],
+                'total_fee': total_fee,
+                'diff': abs(total_fee - paid_amount),
+                'groups': groups,
+                'students': representative,
+                'combinations': prod(comb(len(g['students']), g['count']) for g in groups),
+            }
+            if kind_of is not None:
+                candidate['kinds'] = [kind_of(s, g['fee']) for g, s in zip(_slots(groups), representative)]
+            candidates.append(candidate)
+
+    # 수강료끼리 정확히 맞는 조합이 교재비 / 수강료+교재비가 섞인 조합보다 앞에 오도록
+    def non_base(c):
+        return sum(kind != 'base' for kind in c.get('kinds', ()))
+
+    candidates.sort(key=lambda c: (len(c['fees']), c['diff'], non_base(c), c['combinations']))
+    return candidates
+
+def _slots(groups):
+    return [g for g in groups for _ in range(g['count'])]
+
+def _pick_distinct(groups):
+    """
+    버킷별 필요 인원(count)을 서로 다른 학생으로 채웁니다. (이분 매칭, 증가 경로)
+    버킷이 겹치지 않으면 각 버킷의 앞쪽 학생들이 그대로 뽑힙니다.
+    """
+    slots = _slots(groups)
+    owner = {}  # id(학생) -> (slot 번호, 학생)
+
+    def assign(slot, seen):
+        for student in slots[slot]['students']:
+            key = id(student)
+            if key in seen:
+                continue
+            seen.add(key)
+            if key not in owner or assign(owner[key][0], seen):
+                owner[key] = (slot, student)
+                return True
+        return False
+
+    for slot in range(len(slots)):
+        if not assign(slot, set()):
+            return None
+
+    picked = [None] * len(slots)
+    for slot, student in owner.values():
+        picked[slot] = student
+    return picked
+
+def iter_student_combinations(candidate):
+    """
+    금액 단위 후보(candidate)를 실제 학생 조합(tuple)으로 하나씩 펼쳐줍니다.
+    (조합 수가 매우 클 수 있으니 필요한 만큼만 꺼내 쓰세요.)
+    """
+    groups = candidate['groups']
+
+    def expand(index, prefix):
+        if index == len(groups):
+            yield prefix
+            return
+        group = groups[index]
+        for part in combinations(group['students'], group['count']):
+            # 버킷이 겹치는 경우 같은 학생이 두 번 들어간 조합은 제외
+            if any(s in prefix for s in part):
+                continue
+            yield from expand(index + 1, prefix + part)
+
+    yield from expand(0, ())
+
+# -----------------------------------------------------------------
+# 4. 금액 인덱스 (1:1 매칭용, 이분 탐색)
+# -----------------------------------------------------------------
+FEE_KINDS = ('base', 'book', 'base+book')
+
+class FeeIndex:
+    """
+    (금액 -> 학생 id) 정렬 인덱스입니다.
+    학생마다 수강료(base), 교재비(book), 수강료+교재비(base+book) 세 가지 금액을 등록하고,
+    입금액 ± 허용 오차 구간을 np.searchsorted(이분 탐색)로 찾습니다.
+    """
+
+    def __init__(self, student_ids, base_fees, book_fees):
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        base_fees = np.asarray(base_fees, dtype=np.int64)
+        book_fees = np.asarray(book_fees, dtype=np.int64)
+
+        amounts = np.concatenate([base_fees, book_fees, base_fees + book_fees])
+        ids = np.concatenate([student_ids, student_ids, student_ids])
+        kinds = np.repeat(np.arange(len(FEE_KINDS), dtype=np.int8), len(student_ids))
+
+        # 0원 항목과, 교재비가 없어 base 와 똑같은 base+book 항목은 제외
+        keep = amounts > 0
+        keep[2 * len(student_ids):] &= book_fees > 0
+
+        order = np.argsort(amounts[keep], kind='stable')
+        self.amounts = amounts[keep][order]
+        self.student_ids = ids[keep][order]
+        self.kinds = kinds[keep][order]
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def lookup(self, paid_amount, tolerance=1000):
+        """ 입금액 ± tolerance 안에 드는 학생 id (중복 제거, 오름차순) """
+        start = np.searchsorted(self.amounts, paid_amount - tolerance, side='left')
+        end = np.searchsorted(self.amounts, paid_amount + tolerance, side='right')
+        return np.unique(self.student_ids[start:end])
+
+    def lookup_many(self, paid_amounts, tolerance=1000):
+        """
+        영수증 한 장에서 나온 여러 금액을 한 번에 조회합니다.
+        반환: 입력 순서대로 학생 id 배열 목록
+        """
+        paid_amounts = np.asarray(paid_amounts, dtype=np.int64)
+        starts = np.searchsorted(self.amounts, paid_amounts - tolerance, side='left')
+        ends = np.searchsorted(self.amounts, paid_amounts + tolerance, side='right')
+        return [np.unique(self.student_ids[s:e]) for s, e in zip(starts, ends)]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_student_book_fee'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutstandingBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_period', models.CharField(max_length=7)),
+                ('amount_due', models.IntegerField(default=0)),
+                ('amount_paid', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='core.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['billing_period', 'student'], name='core_outsta_billing_cbf023_idx')],
+                'unique_together': {('student', 'billing_period')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:01
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_outstandingbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InferenceJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('PENDING', '대기'), ('RUNNING', '분석 중'), ('DONE', '완료'), ('FAILED', '실패')], default='PENDING', max_length=10)),
+                ('image_path', models.CharField(blank=True, max_length=255)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='core_infere_status_fd9ea4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_inferencejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inferencejob',
+            name='inference',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
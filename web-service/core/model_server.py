@@ -0,0 +1,208 @@
+# web-service/core/model_server.py
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image
+from django.conf import settings
+
+# -----------------------------------------------------------------------------
+# 로컬 모델 서버 (manage.py run_model_server)
+#
+# gunicorn 워커마다 모델을 따로 올리면 메모리가 워커 수만큼 늘고, 워커마다 torch 스레드 풀을
+# 만들어 CPU 코어를 서로 뺏습니다. 모델은 이 서버 프로세스 하나만 들고 있고,
+# Django 워커는 settings.INFERENCE_SERVER_SOCKET (Unix 소켓) 으로 이미지를 보내 결과만 받습니다.
+#
+# 메시지 형식: [헤더 길이 4바이트][JSON 헤더][본문 바이트]
+#   infer   : 헤더 images=[{width, height, size}], 본문 = RGB 원본 픽셀을 이어 붙인 것
+#             (응답에 모델 지문도 담아서, 서버가 새 스냅샷으로 다시 뜨면 클라이언트가 info 를 다시 받음)
+#   info    : 모델 입력 크기 / 지문
+# 처리 중 에러가 나면 응답 헤더는 {'error': 메시지}
+#   metrics : 마이크로 배치 + 결과 캐시 지표
+# 서버 안에서는 기존 run_inference_batch(마이크로 배치, 결과 캐시)를 그대로 사용하므로
+# 여러 워커에서 동시에 온 요청도 한 번의 generate 로 묶입니다.
+# -----------------------------------------------------------------------------
+
+_HEADER = struct.Struct('>I')
+
+def _send(sock, header, body=b''):
+    data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+    if body:
+        sock.sendall(body)
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("모델 서버 연결이 끊어졌습니다.")
+        received += count
+    return bytes(buffer)
+
+def _recv(sock):
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, length).decode('utf-8'))
+
+# -----------------------------------------------------------------------------
+# 1. 서버
+# -----------------------------------------------------------------------------
+def configure_threads():
+    """
+    추론 스레드 수 설정 (모델을 올리기 전에 호출).
+    INFERENCE_NUM_THREADS 는 연산 하나를 나눠 돌릴 스레드 수 (0 이면 라이브러리 기본값 = 코어 수),
+    INFERENCE_INTEROP_THREADS 는 연산끼리 병렬로 돌릴 스레드 수 (배치 스레드 하나뿐이라 1 이면 충분)
+    """
+    num_threads = settings.INFERENCE_NUM_THREADS
+    interop_threads = settings.INFERENCE_INTEROP_THREADS
+    if settings.INFERENCE_BACKEND == 'onnx':
+        return  # onnx_backend 가 SessionOptions 에 직접 반영
+
+    import torch
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            pass  # 이미 병렬 작업이 시작된 뒤에는 바꿀 수 없음
+    print(f"🧵 torch 스레드: intra={torch.get_num_threads()}, inter={torch.get_num_interop_threads()}")
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        from . import inference
+
+        try:
+            request = _recv(self.request)
+            op = request.get('op')
+        except (ConnectionError, ValueError, OSError) as e:
+            print(f"⚠️ 모델 서버 요청 처리 실패: {e}")
+            return
+
+        try:
+            if op == 'infer':
+                outputs = self._infer(request, inference)
+                _send(self.request, {'outputs': outputs, 'fingerprint': inference.model_fingerprint()})
+            elif op == 'info':
+                _send(self.request, {
+                    'input_size': list(inference.input_size()),
+                    'fingerprint': inference.model_fingerprint(),
+                })
+            elif op == 'metrics':
+                _send(self.request, inference.get_batch_metrics())
+            else:
+                _send(self.request, {'error': f"알 수 없는 요청입니다: {op}"})
+        except (ConnectionError, OSError) as e:
+            print(f"⚠️ 모델 서버 요청 처리 실패: {e}")
+        except Exception as e:
+            # 모델 로딩 실패 등: 연결을 그냥 끊지 않고 에러를 돌려줌
+            print(f"⚠️ 모델 서버 요청 처리 실패 ({op}): {e}")
+            try:
+                _send(self.request, {'error': str(e)})
+            except OSError:
+                pass
+
+    def _infer(self, request, inference):
+        images = []
+        for spec in request['images']:
+            pixels = _recv_exact(self.request, spec['size'])
+            images.append(Image.frombytes('RGB', (spec['width'], spec['height']), pixels))
+
+        # 동시에 처리할 요청 수 제한 (넘치면 잠시 기다렸다가 그래도 안 되면 거절)
+        if not self.server.slots.acquire(timeout=settings.INFERENCE_SERVER_TIMEOUT):
+            return [{"status": "error", "message": "모델 서버가 바쁩니다. 잠시 후 다시 시도해주세요."} for _ in images]
+        try:
+            return inference.run_inference_batch(images)
+        finally:
+            self.server.slots.release()
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, max_concurrency):
+        self.slots = threading.BoundedSemaphore(max(max_concurrency, 1))
+        socket_path = Path(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        socket_path.unlink(missing_ok=True)  # 이전 실행에서 남은 소켓 파일
+        super().__init__(str(socket_path), _Handler)
+        os.chmod(socket_path, 0o660)   # 같은 그룹(웹 서버 사용자)만 접속
+
+# -----------------------------------------------------------------------------
+# 2. 클라이언트 (Django 워커의 run_inference 에서 사용)
+# -----------------------------------------------------------------------------
+# info(입력 크기 / 지문)를 다시 받아오는 간격(초). infer 응답의 지문이 달라지면 바로 다시 받음
+INFO_TTL = 60.0
+
+_info = None
+_info_fetched_at = 0.0
+_info_lock = threading.Lock()
+
+def _request(header, body_parts=()):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(settings.INFERENCE_SERVER_TIMEOUT)
+        sock.connect(str(settings.INFERENCE_SERVER_SOCKET))
+        _send(sock, header)
+        for part in body_parts:
+            sock.sendall(part)
+        return _recv(sock)
+
+def remote_inference_batch(images):
+    """ run_inference_batch 와 같은 반환 형식 (이미지별 결과 dict 목록) """
+    specs, bodies = [], []
+    for image in images:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        pixels = image.tobytes()
+        specs.append({'width': image.width, 'height': image.height, 'size': len(pixels)})
+        bodies.append(pixels)
+
+    try:
+        response = _request({'op': 'infer', 'images': specs}, bodies)
+    except (OSError, ConnectionError, ValueError) as e:
+        return [{"status": "error", "message": f"모델 서버에 연결할 수 없습니다: {e}"} for _ in images]
+    if 'error' in response:
+        return [{"status": "error", "message": f"모델 서버 에러: {response['error']}"} for _ in images]
+
+    _check_fingerprint(response.get('fingerprint'))
+    return response['outputs']
+
+def remote_info():
+    """
+    모델 서버의 입력 크기 / 모델 지문. INFO_TTL 동안 재사용하고, 서버에 연결할 수 없으면
+    마지막으로 받은 값을 (없으면 {'error': 메시지} 를) 돌려줍니다.
+    """
+    global _info, _info_fetched_at
+    with _info_lock:
+        if _info is not None and time.monotonic() - _info_fetched_at < INFO_TTL:
+            return _info
+        try:
+            response = _request({'op': 'info'})
+        except (OSError, ConnectionError, ValueError) as e:
+            response = {'error': f"모델 서버에 연결할 수 없습니다: {e}"}
+        if 'error' in response:
+            print(f"⚠️ 모델 서버 정보 조회 실패: {response['error']}")
+            return _info or response
+        _info, _info_fetched_at = response, time.monotonic()
+        return _info
+
+def _check_fingerprint(fingerprint):
+    """ 서버가 다른 모델(새 스냅샷)로 다시 떴으면 저장해 둔 info 를 버림 """
+    global _info
+    with _info_lock:
+        if fingerprint and _info is not None and _info.get('fingerprint') != fingerprint:
+            print("🔄 모델 서버의 모델이 바뀌어 정보를 다시 받습니다.")
+            _info = None
+
+def remote_metrics():
+    try:
+        return _request({'op': 'metrics'})
+    except (OSError, ConnectionError, ValueError) as e:
+        return {'error': f"모델 서버에 연결할 수 없습니다: {e}"}
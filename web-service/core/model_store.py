@@ -0,0 +1,140 @@
+# web-service/core/model_store.py
+
+import contextlib
+import json
+import mmap
+import struct
+import warnings
+from pathlib import Path
+
+import torch
+from transformers import VisionEncoderDecoderConfig, VisionEncoderDecoderModel
+
+try:
+    from transformers.initialization import no_init_weights
+except ImportError:  # transformers 4.x
+    try:
+        from transformers.modeling_utils import no_init_weights
+    except ImportError:
+        no_init_weights = contextlib.nullcontext
+
+# 스냅샷 폴더에 함께 저장하는 메타 정보 (어느 모델을 언제 받아왔는지)
+SNAPSHOT_META = "snapshot.json"
+
+_SAFETENSORS_DTYPES = {
+    'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+    'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8,
+    'U8': torch.uint8, 'BOOL': torch.bool,
+}
+
+# -----------------------------------------------------------------------------
+# 1. 로컬 스냅샷 저장 (manage.py snapshot_model)
+# -----------------------------------------------------------------------------
+def has_snapshot(path):
+    path = Path(path)
+    return (path / "config.json").exists() and any(path.glob("*.safetensors"))
+
+def save_snapshot(model, processor, path, model_id):
+    """ 모델(safetensors) + 프로세서를 로컬 폴더에 저장합니다. 이후 로딩은 인터넷 없이 가능 """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(path, safe_serialization=True)
+    processor.save_pretrained(path)
+    (path / SNAPSHOT_META).write_text(json.dumps({
+        "model_id": model_id,
+        "revision": getattr(model.config, "_commit_hash", None),
+        "vocab_size": len(processor.tokenizer),
+    }, ensure_ascii=False, indent=2))
+    return path
+
+def read_snapshot_meta(path):
+    meta_path = Path(path) / SNAPSHOT_META
+    if not meta_path.exists():
+        return {}
+    return json.loads(meta_path.read_text())
+
+# -----------------------------------------------------------------------------
+# 2. mmap 로딩 (가중치를 복사하지 않고 파일 페이지를 그대로 텐서로 사용)
+# -----------------------------------------------------------------------------
+def load_safetensors_mmap(file_path):
+    """
+    safetensors 파일을 mmap 으로 열어 state_dict 를 만듭니다.
+    텐서는 mmap 버퍼를 그대로 가리키므로(torch.frombuffer), 같은 파일을 연 여러 워커 프로세스가
+    OS 페이지 캐시를 공유합니다. ACCESS_COPY 라서 혹시 텐서를 수정해도 파일에는 쓰지 않습니다.
+    """
+    with open(file_path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_size = struct.unpack('<Q', buffer[:8])[0]
+    header = json.loads(buffer[8:8 + header_size])
+    data_start = 8 + header_size
+
+    state_dict = {}
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        dtype = _SAFETENSORS_DTYPES[info['dtype']]
+        begin, _ = info['data_offsets']
+        numel = 1
+        for dim in info['shape']:
+            numel *= dim
+        if numel:
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=numel, offset=data_start + begin)
+        else:
+            tensor = torch.empty(0, dtype=dtype)
+        state_dict[name] = tensor.reshape(info['shape'])
+    return state_dict
+
+def load_model_mmap(path):
+    """
+    스냅샷 폴더에서 VisionEncoderDecoderModel 을 만들고, 가중치는 mmap 텐서로 채웁니다. (CPU 전용)
+    무작위 초기화는 건너뛰고(no_init_weights), load_state_dict(assign=True) 로 파라미터를 통째로 교체합니다.
+    """
+    path = Path(path)
+    index_file = path / "model.safetensors.index.json"
+    if index_file.exists():
+        shards = sorted(set(json.loads(index_file.read_text())["weight_map"].values()))
+    else:
+        shards = ["model.safetensors"]
+
+    state_dict = {}
+    for shard in shards:
+        state_dict.update(load_safetensors_mmap(path / shard))
+
+    config = VisionEncoderDecoderConfig.from_pretrained(path)
+    with no_init_weights():
+        model = VisionEncoderDecoderModel(config)
+
+    result = model.load_state_dict(state_dict, strict=False, assign=True)
+    # lm_head 는 임베딩과 공유(tie)되는 가중치라 파일에 없을 수 있음
+    missing = [key for key in result.missing_keys if not key.endswith("lm_head.weight")]
+    if missing or result.unexpected_keys:
+        raise ValueError(f"스냅샷 가중치가 모델 구조와 맞지 않습니다. (missing={missing}, unexpected={result.unexpected_keys})")
+    model.tie_weights()
+    return model
+
+# -----------------------------------------------------------------------------
+# 3. CPU int8 동적 양자화
+# -----------------------------------------------------------------------------
+QUANTIZE_MODES = ('none', 'decoder', 'all')
+
+def quantize_dynamic_int8(model, mode):
+    """
+    nn.Linear 가중치를 int8 로 바꾸고, 활성값은 실행 중에 양자화합니다. (CPU 전용)
+
+    - 'decoder' : 자기회귀 디코더(MBart)만. generate 시간 대부분을 차지하는 부분
+    - 'all'     : Swin 인코더까지. 이미지당 한 번만 돌기 때문에 이득은 작고 정확도 손실은 더 큼
+    양자화된 가중치는 새 메모리에 만들어지므로, mmap 스냅샷의 페이지 공유 효과는 그만큼 줄어듭니다.
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"알 수 없는 양자화 모드입니다: {mode} (가능: {', '.join(QUANTIZE_MODES)})")
+    if mode == 'none':
+        return model
+
+    targets = [model.decoder] if mode == 'decoder' else [model.decoder, model.encoder]
+    with warnings.catch_warnings():
+        # torch 2.10+ 에서 eager 양자화 API 가 deprecated 경고를 냄 (동작은 동일)
+        warnings.simplefilter('ignore')
+        for module in targets:
+            torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
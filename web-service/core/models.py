@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 
 # Create your models here.
@@ -24,6 +25,72 @@ class Payment(models.Model):
     payment_date = models.DateField() # 결제일
     payment_method = models.CharField(max_length=50, blank=True) # 예: '카드', '이체'
     status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='UNPAID')
+    # 은행 입금 내역 정산으로 만든 결제의 입금 건 키 (같은 내역을 다시 올려도 중복 저장하지 않음, core/reconcile.py)
+    statement_key = models.CharField(max_length=64, null=True, blank=True, unique=True)
 
     def __str__(self):
-        return f"{self.student.name} - {self.amount_paid}원"
\ No newline at end of file
+        return f"{self.student.name} - {self.amount_paid}원"
+
+class OutstandingBalance(models.Model):
+    """
+    청구 기간(월)별 학생 미납 잔액 장부.
+    Payment 가 생기거나 상태가 바뀔 때마다 해당 (학생, 기간) 행만 다시 계산되고,
+    AI 매칭은 잔액이 남은 학생만 후보로 씁니다. (core/ledger.py)
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='balances')
+    billing_period = models.CharField(max_length=7) # 청구 기간 (예: '2025-11')
+    amount_due = models.IntegerField(default=0) # 청구액 (수강료 + 교재비)
+    amount_paid = models.IntegerField(default=0) # 입금 확인된 금액 (PAID + MISMATCH)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'billing_period')
+        indexes = [models.Index(fields=['billing_period', 'student'])]
+
+    @property
+    def balance(self):
+        return self.amount_due - self.amount_paid
+
+    def __str__(self):
+        return f"{self.student.name} {self.billing_period} 잔액 {self.balance}원"
+
+class InferenceJob(models.Model):
+    """
+    이미지 분석 비동기 작업. (core/jobs.py)
+    DB 테이블 자체가 작업 큐라서 별도 브로커(Redis 등) 없이 SQLite 만으로 동작하고,
+    서버가 재시작되어도 대기 중인 작업이 남아 있습니다.
+    """
+    JOB_STATUS_CHOICES = [
+        ('PENDING', '대기'),
+        ('RUNNING', '분석 중'),
+        ('DONE', '완료'),
+        ('FAILED', '실패'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=JOB_STATUS_CHOICES, default='PENDING')
+    image_path = models.CharField(max_length=255, blank=True) # 업로드 이미지 임시 저장 경로
+    result = models.JSONField(null=True, blank=True) # 매칭 결과 메시지 목록
+    inference = models.JSONField(null=True, blank=True) # 영수증별 디코딩 경로 / 신뢰도
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"작업 {self.id} ({self.get_status_display()})"
+
+class DataVersion(models.Model):
+    """
+    메모리 캐시(학생 명단 스냅샷, 미납 장부)의 버전 번호. (core/versions.py)
+    gunicorn 워커 / 작업 워커 / manage.py 등 여러 프로세스가 같은 행을 보므로,
+    한 프로세스에서 바꾼 내용을 다른 프로세스도 다음 조회 때 알아챕니다.
+    """
+    name = models.CharField(max_length=50, primary_key=True) # 예: 'roster', 'ledger'
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,304 @@
+# web-service/core/name_index.py
+
+import math
+import re
+import threading
+from collections import deque, defaultdict
+
+# -----------------------------------------------------------------
+# 1. Aho-Corasick 이름 오토마톤
+# -----------------------------------------------------------------
+class NameAutomaton:
+    """
+    전체 학생 이름을 하나의 Aho-Corasick 오토마톤으로 묶어,
+    OCR 텍스트를 '한 번만' 훑어서 등장하는 모든 이름을 찾습니다.
+
+    - 이름 원형과 공백을 제거한 형태('박 재' -> '박재')를 모두 패턴으로 등록합니다.
+    - 학생 추가/이름 변경 시 trie에 패턴만 덧붙이고(add/remove),
+      실패 링크(failure link)는 다음 검색 때 한 번만 다시 계산합니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._goto = [{}]          # 노드별 전이 (문자 -> 노드 번호)
+        self._fail = [0]           # 실패 링크
+        self._terminal = [None]    # 이 노드에서 끝나는 패턴 (없으면 None)
+        self._dict_link = [0]      # 실패 링크를 따라가며 만나는 첫 번째 '패턴 끝' 노드
+        self._dirty = False
+
+        self._pattern_ids = {}     # 패턴 -> {student_id, ...}
+        self._names = {}           # student_id -> 이름
+
+    @staticmethod
+    def patterns_for(name):
+        name = name.strip()
+        return {p for p in (name, name.replace(" ", "")) if p}
+
+    @property
+    def names(self):
+        """
+        student_id -> 이름 사본 (fuzzy 보정 등에서 DB 조회 없이 사용)
+        명단 갱신(update/remove)이 같은 객체를 고치므로, 잠금 안에서 복사해서 돌려줍니다.
+        """
+        with self._lock:
+            return dict(self._names)
+
+    def add(self, student_id, name):
+        with self._lock:
+            self._add(student_id, name)
+
+    def remove(self, student_id):
+        with self._lock:
+            self._remove(student_id)
+
+    def update(self, student_id, name):
+        """ 학생 추가 또는 이름 변경 """
+        with self._lock:
+            if self._names.get(student_id) == name:
+                return
+            self._remove(student_id)
+            self._add(student_id, name)
+
+    def _add(self, student_id, name):
+        self._names[student_id] = name
+        for pattern in self.patterns_for(name):
+            ids = self._pattern_ids.setdefault(pattern, set())
+            ids.add(student_id)
+            if len(ids) == 1:
+                self._insert(pattern)
+
+    def _remove(self, student_id):
+        name = self._names.pop(student_id, None)
+        if name is None:
+            return
+        for pattern in self.patterns_for(name):
+            ids = self._pattern_ids.get(pattern)
+            if ids is None:
+                continue
+            ids.discard(student_id)
+            if not ids:
+                # trie 노드는 남겨두고 결과에서만 빠지도록 (검색 시 빈 패턴은 무시)
+                del self._pattern_ids[pattern]
+
+    def _insert(self, pattern):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._dict_link.append(0)
+                self._goto[node][ch] = nxt
+            node = nxt
+        self._terminal[node] = pattern
+        self._dirty = True
+
+    def _build_links(self):
+        """ BFS로 실패 링크와 출력(dict) 링크를 계산합니다. """
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._dict_link[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[child] = fail
+                self._dict_link[child] = fail if self._terminal[fail] is not None else self._dict_link[fail]
+                queue.append(child)
+
+        self._dirty = False
+
+    def iter_matches(self, text):
+        """
+        텍스트를 한 번 훑으며 (끝 위치, 패턴) 을 모두 돌려줍니다.
+        """
+        with self._lock:
+            return self._matches(text)
+
+    def find_ids(self, text):
+        """ 텍스트에 정확히 등장하는 학생 id 집합 """
+        with self._lock:
+            found = set()
+            for _, pattern in self._matches(text):
+                found |= self._pattern_ids.get(pattern, set())
+            return found
+
+    def _matches(self, text):
+        if self._dirty:
+            self._build_links()
+        goto, fail, terminal, dict_link = self._goto, self._fail, self._terminal, self._dict_link
+        pattern_ids = self._pattern_ids
+
+        matches = []
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            out = node if terminal[node] is not None else dict_link[node]
+            while out:
+                if terminal[out] in pattern_ids:
+                    matches.append((pos, terminal[out]))
+                out = dict_link[out]
+        return matches
+
+# -----------------------------------------------------------------
+# 2. 자모(Jamo) / n-gram 역색인 (fuzzy 이름 검색용 후보 추출)
+# -----------------------------------------------------------------
+HANGUL_BASE, HANGUL_LAST = 0xAC00, 0xD7A3
+
+def decompose_jamo(text):
+    """
+    한글 음절을 초성/중성/종성 자모로 풀어씁니다. ('재' -> 'ㅈㅐ')
+    OCR 오타는 대부분 자모 하나 차이('민재' vs '민제')라서, 자모 단위 n-gram이 더 잘 맞습니다.
+    """
+    jamo = []
+    for ch in text:
+        code = ord(ch)
+        if HANGUL_BASE <= code <= HANGUL_LAST:
+            code -= HANGUL_BASE
+            jamo.append(chr(0x1100 + code // 588))
+            jamo.append(chr(0x1161 + (code % 588) // 28))
+            if code % 28:
+                jamo.append(chr(0x11A7 + code % 28))
+        else:
+            jamo.append(ch)
+    return "".join(jamo)
+
+def normalize_name(name):
+    """ '노*연(중등수학)' -> '노*연' (괄호 메모 제거, 공백 제거, 소문자) """
+    return re.sub(r'\(.*\)', '', name).replace(" ", "").strip().lower()
+
+class NameGramIndex:
+    """
+    학생 이름 역색인. 키는 세 종류입니다.
+
+    - 'b:'  글자 bigram          ('박민재' -> 박민, 민재)
+    - 'j:'  자모 trigram         (오타 한 글자에도 대부분의 키가 살아남음)
+    - 'p:' / 'e:'  앞/뒤 기준 글자 위치  ('박*재' 처럼 가려진 이름을 위치로 맞춤)
+    - 'f:'  길이 + 첫/끝 글자     (은행 내역의 '박*재' 형태를 한 번에 좁힘)
+
+    검색 시에는 문서 빈도(df)가 낮은(=변별력 있는) 키부터 쓰고, 너무 흔한 키('김' 등)는
+    건너뛰므로 학생 수가 수만 명으로 늘어도 조회 비용이 거의 일정합니다.
+    """
+
+    MAX_POSTING = 2000   # 이보다 긴 posting list 는 (다른 키가 있으면) 사용하지 않음
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(set)  # 키 -> {student_id, ...}
+        self._keys = {}                    # student_id -> 키 목록
+        self._names = {}                   # student_id -> 이름
+
+    @property
+    def names(self):
+        """ student_id -> 이름 사본 (잠금 안에서 복사) """
+        with self._lock:
+            return dict(self._names)
+
+    @staticmethod
+    def _segment_keys(segment):
+        keys = set()
+        for i in range(len(segment) - 1):
+            keys.add('b:' + segment[i:i + 2])
+        jamo = decompose_jamo(segment)
+        for i in range(len(jamo) - 2):
+            keys.add('j:' + jamo[i:i + 3])
+        return keys
+
+    @classmethod
+    def keys_for_name(cls, name):
+        name = normalize_name(name)
+        keys = cls._segment_keys(name)
+        for i, ch in enumerate(name):
+            keys.add(f'p:{i}:{ch}')
+            keys.add(f'e:{len(name) - 1 - i}:{ch}')
+        if name:
+            keys.add(f'f:{len(name)}:{name[0]}{name[-1]}')
+        return keys
+
+    @classmethod
+    def keys_for_query(cls, query):
+        """ 가려진 글자('*')는 건너뛰고, 보이는 글자 구간과 위치만 키로 씁니다. """
+        query = normalize_name(query)
+        keys = set()
+        for segment in query.split('*'):
+            keys |= cls._segment_keys(segment)
+        for i, ch in enumerate(query):
+            if ch != '*':
+                keys.add(f'p:{i}:{ch}')
+                keys.add(f'e:{len(query) - 1 - i}:{ch}')
+        if query and query[0] != '*' and query[-1] != '*':
+            keys.add(f'f:{len(query)}:{query[0]}{query[-1]}')
+        return keys
+
+    def add(self, student_id, name):
+        with self._lock:
+            self._add(student_id, name)
+
+    def remove(self, student_id):
+        with self._lock:
+            self._remove(student_id)
+
+    def update(self, student_id, name):
+        with self._lock:
+            if self._names.get(student_id) == name:
+                return
+            self._remove(student_id)
+            self._add(student_id, name)
+
+    def _add(self, student_id, name):
+        keys = self.keys_for_name(name)
+        self._names[student_id] = name
+        self._keys[student_id] = keys
+        for key in keys:
+            self._postings[key].add(student_id)
+
+    def _remove(self, student_id):
+        self._names.pop(student_id, None)
+        for key in self._keys.pop(student_id, ()):
+            posting = self._postings.get(key)
+            if posting is None:
+                continue
+            posting.discard(student_id)
+            if not posting:
+                del self._postings[key]
+
+    def candidates(self, query, limit=50, allowed=None):
+        """
+        질의 이름과 키를 많이(가중치 기준) 공유하는 학생 id를 최대 limit 명까지 반환합니다.
+        가중치는 IDF(log(N/df))라서 흔한 글자보다 드문 글자가 일치할수록 점수가 높습니다.
+        allowed 가 주어지면 그 안의 학생만 후보로 셉니다. (예: 미납 학생)
+        """
+        with self._lock:
+            total = max(len(self._names), 1)
+            postings = [
+                self._postings[key] for key in self.keys_for_query(query)
+                if key in self._postings
+            ]
+            if not postings:
+                return []
+
+            postings.sort(key=len)
+            selective = [p for p in postings if len(p) <= self.MAX_POSTING]
+            if not selective:
+                selective = postings[:1]
+
+            scores = defaultdict(float)
+            for posting in selective:
+                weight = math.log(1 + total / len(posting))
+                for student_id in posting:
+                    if allowed is None or student_id in allowed:
+                        scores[student_id] += weight
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [student_id for student_id, _ in ranked[:limit]]
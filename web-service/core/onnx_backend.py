@@ -0,0 +1,373 @@
+# web-service/core/onnx_backend.py
+
+import json
+import re
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+from . import receipt_schema
+from .result_cache import files_fingerprint
+
+# -----------------------------------------------------------------------------
+# ONNX Runtime / TorchScript 추론 백엔드 (settings.INFERENCE_BACKEND = 'onnx' | 'torchscript')
+#
+# ai-engine/export_onnx.py 로 내보낸 폴더(settings.INFERENCE_EXPORT_DIR)를 읽습니다.
+#   encoder.onnx / decoder.onnx (또는 encoder.pt / decoder.pt), tokenizer.json, export_config.json
+# transformers 를 import 하지 않으므로 워커가 가볍고 빨리 뜹니다.
+# (전처리는 DonutImageProcessor, 후처리는 DonutProcessor.token2json 을 그대로 옮긴 것)
+# -----------------------------------------------------------------------------
+
+# 전역 변수
+runner = None
+tokenizer = None
+export_config = None
+
+_load_lock = threading.Lock()
+
+# 스키마 제약 디코딩 (core/receipt_schema.py)
+CONSTRAINED = getattr(settings, 'INFERENCE_CONSTRAINED', False)
+_pieces = None   # 토큰 id -> 문자열 (제약 디코딩용, 처음 쓸 때 만듦)
+
+# 생성 옵션 (core/torch_backend.py 의 generate 옵션과 동일한 값)
+REPETITION_PENALTY = 1.2
+NO_REPEAT_NGRAM_SIZE = 3
+# 내보낸 디코더의 max_length 보다 길게는 생성하지 않음
+MAX_LENGTH = getattr(settings, 'INFERENCE_MAX_LENGTH', 768)
+
+class _OnnxRunner:
+    def __init__(self, export_dir):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 스레드 수 (0 이면 onnxruntime 기본값 = 코어 수), core/model_server.py configure_threads 참고
+        options.intra_op_num_threads = settings.INFERENCE_NUM_THREADS
+        options.inter_op_num_threads = settings.INFERENCE_INTEROP_THREADS
+        providers = ['CPUExecutionProvider']
+        self.encoder = ort.InferenceSession(str(export_dir / "encoder.onnx"), options, providers=providers)
+        self.decoder = ort.InferenceSession(str(export_dir / "decoder.onnx"), options, providers=providers)
+        self.cross_names = [o.name for o in self.encoder.get_outputs()]
+        self.decoder_inputs = [i.name for i in self.decoder.get_inputs()]
+
+    def encode(self, pixel_values):
+        return self.encoder.run(None, {"pixel_values": pixel_values})
+
+    def decode(self, input_ids, cross, past):
+        feeds = dict(zip(self.decoder_inputs, [input_ids, *cross, *past]))
+        outputs = self.decoder.run(None, feeds)
+        return outputs[0], outputs[1:]
+
+class _TorchScriptRunner:
+    """ torch 는 쓰지만 transformers 는 필요 없는 TorchScript 실행기 """
+
+    def __init__(self, export_dir):
+        import torch
+
+        self.torch = torch
+        self.encoder = torch.jit.load(str(export_dir / "encoder.pt")).eval()
+        self.decoder = torch.jit.load(str(export_dir / "decoder.pt")).eval()
+
+    def encode(self, pixel_values):
+        with self.torch.no_grad():
+            return [t.numpy() for t in self.encoder(self.torch.from_numpy(pixel_values))]
+
+    def decode(self, input_ids, cross, past):
+        to_tensor = self.torch.from_numpy
+        with self.torch.no_grad():
+            outputs = self.decoder(to_tensor(input_ids), *map(to_tensor, cross), *map(to_tensor, past))
+        return outputs[0].numpy(), [t.numpy() for t in outputs[1:]]
+
+_RUNNERS = {'onnx': _OnnxRunner, 'torchscript': _TorchScriptRunner}
+
+# -----------------------------------------------------------------------------
+# 1. 로딩
+# -----------------------------------------------------------------------------
+def is_loaded():
+    return runner is not None
+
+def model_fingerprint():
+    """ 결과 캐시 무효화용: 내보낸 원본 모델 ID + 그래프 파일 지문 """
+    export_dir = Path(settings.INFERENCE_EXPORT_DIR)
+    graphs = [p for p in export_dir.iterdir() if p.suffix in ('.onnx', '.pt')]
+    return (
+        f"{settings.INFERENCE_BACKEND}:{export_config.get('model_id')}@{files_fingerprint(graphs)}"
+        f":{'constrained' if CONSTRAINED else 'free'}:max={MAX_LENGTH}"
+    )
+
+def input_size():
+    """ 모델 입력 이미지 크기 (height, width) """
+    return export_config["image"]["height"], export_config["image"]["width"]
+
+def load_model_lazy():
+    global runner, tokenizer, export_config
+
+    if runner is not None:
+        return
+
+    with _load_lock:
+        if runner is not None:
+            return
+        from tokenizers import Tokenizer
+
+        export_dir = Path(settings.INFERENCE_EXPORT_DIR)
+        backend = settings.INFERENCE_BACKEND
+        config_path = export_dir / "export_config.json"
+        if not config_path.exists():
+            raise FileNotFoundError(
+                f"{export_dir} 에 내보낸 모델이 없습니다. (ai-engine/export_onnx.py --format {backend} 로 먼저 생성)"
+            )
+
+        config = json.loads(config_path.read_text(encoding='utf-8'))
+        tokenizer = Tokenizer.from_file(str(export_dir / "tokenizer.json"))
+        runner = _RUNNERS[backend](export_dir)
+        export_config = config
+        print(f"✅ AI 모델 로딩 완료! (Source: {export_dir}, 백엔드: {backend})")
+
+def warm_up():
+    """ 빈 이미지로 짧게 한 번 돌려서 세션 초기화 비용을 미리 치릅니다. """
+    image = export_config["image"]
+    blank = Image.new("RGB", (image["width"], image["height"]), "white")
+    generate_batch(preprocess(blank), max_length=len(export_config["tokens"]["prompt_ids"]) + 4)
+
+# -----------------------------------------------------------------------------
+# 2. 전처리 (DonutImageProcessor 와 같은 순서: 긴 축 정렬 -> 리사이즈 -> 썸네일 -> 패딩 -> 정규화)
+# -----------------------------------------------------------------------------
+def preprocess(image):
+    """ PIL 이미지 -> (1, 3, H, W) float32 """
+    config = export_config["image"]
+    height, width = config["height"], config["width"]
+    image = image.convert("RGB")
+
+    if config["do_align_long_axis"]:
+        if (width < height and image.width > image.height) or (width > height and image.width < image.height):
+            image = image.transpose(Image.Transpose.ROTATE_270)
+
+    # 짧은 변을 min(height, width) 에 맞춤
+    shortest_edge = min(height, width)
+    short, long = sorted(image.size)
+    new_short, new_long = shortest_edge, int(shortest_edge * long / short)
+    new_size = (new_short, new_long) if image.width <= image.height else (new_long, new_short)
+    image = image.resize(new_size, Image.Resampling.BILINEAR)
+
+    if config["do_thumbnail"]:
+        thumb_h, thumb_w = min(image.height, height), min(image.width, width)
+        if (thumb_h, thumb_w) != (image.height, image.width):
+            if image.height > image.width:
+                thumb_w = int(image.width * thumb_h / image.height)
+            elif image.width > image.height:
+                thumb_h = int(image.height * thumb_w / image.width)
+            image = image.resize((thumb_w, thumb_h), Image.Resampling.BILINEAR)
+
+    array = np.asarray(image, dtype=np.float32)
+    if config["do_pad"]:
+        delta_h, delta_w = height - array.shape[0], width - array.shape[1]
+        top, left = delta_h // 2, delta_w // 2
+        array = np.pad(array, ((top, delta_h - top), (left, delta_w - left), (0, 0)))
+
+    mean = np.asarray(config["mean"], dtype=np.float32)
+    std = np.asarray(config["std"], dtype=np.float32)
+    array = (array / 255.0 - mean) / std
+    return array.transpose(2, 0, 1)[None].astype(np.float32)
+
+def stack(batch):
+    return np.concatenate(batch, axis=0)
+
+# -----------------------------------------------------------------------------
+# 3. 생성 (KV 캐시 greedy 디코딩)
+# -----------------------------------------------------------------------------
+def generate_batch(pixel_values, max_length=None):
+    """
+    (B, C, H, W) 이미지 묶음 -> 이미지별 결과 dict 목록 (run_inference 와 같은 형식)
+    cross-attention K/V 는 인코더에서 한 번만 만들고, self-attention K/V 는 스텝마다 이어 붙입니다.
+    beam search 대신 greedy 로 디코딩하고, 반복 방지(repetition penalty / no-repeat 3-gram)와
+    <unk> 금지는 torch 백엔드와 같게 적용합니다.
+    CONSTRAINED 이면 영수증 JSON 스키마를 지키는 토큰만 고르고, JSON 이 닫히면 바로 멈춥니다.
+    """
+    tokens = export_config["tokens"]
+    decoder = export_config["decoder"]
+    max_length = max_length or min(export_config["max_length"], MAX_LENGTH)
+    batch = pixel_values.shape[0]
+
+    started = time.perf_counter()
+    cross = runner.encode(pixel_values)
+    encoder_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    past = [
+        np.zeros((batch, decoder["num_heads"], 0, decoder["head_dim"]), dtype=np.float32)
+        for _ in range(2 * decoder["num_layers"])
+    ]
+
+    sequences = np.tile(np.asarray(tokens["prompt_ids"], dtype=np.int64), (batch, 1))
+    finished = np.zeros(batch, dtype=bool)
+    step_input = sequences
+
+    states = [receipt_schema.START_STATE] * batch if CONSTRAINED else None
+    pieces = _token_pieces()
+    token_logprobs = [[] for _ in range(batch)]   # 필드 신뢰도 계산용
+
+    while sequences.shape[1] < max_length and not finished.all():
+        logits, past = runner.decode(step_input, cross, past)
+        logits = _apply_generation_rules(logits, sequences, tokens["unk_id"])
+        next_tokens = logits.argmax(axis=-1)
+        if CONSTRAINED:
+            for row in np.flatnonzero(~finished):
+                (next_tokens[row], states[row]), = receipt_schema.allowed_tokens(
+                    logits[row], states[row], pieces, tokens["eos_id"]
+                )
+        next_tokens[finished] = tokens["pad_id"]
+        logprobs = _log_softmax(logits)
+        for row in np.flatnonzero(~finished):
+            token_logprobs[row].append(float(logprobs[row, next_tokens[row]]))
+        finished |= next_tokens == tokens["eos_id"]
+        if CONSTRAINED:
+            # 닫는 "]}" 까지 나왔으면 EOS 를 만들려고 한 스텝 더 돌리지 않음
+            finished |= np.array([receipt_schema.is_complete(state) for state in states])
+
+        sequences = np.concatenate([sequences, next_tokens[:, None]], axis=1)
+        step_input = next_tokens[:, None]
+    decoder_ms = (time.perf_counter() - started) * 1000
+
+    prompt_length = len(tokens["prompt_ids"])
+    results = []
+    for row, sequence in enumerate(sequences.tolist()):
+        generated = sequence[prompt_length:prompt_length + len(token_logprobs[row])]
+        parse_started = time.perf_counter()
+        if CONSTRAINED:
+            result = _parse_constrained(generated)
+        else:
+            result = _parse_sequence(tokenizer.decode(sequence, skip_special_tokens=False))
+        parse_ms = (time.perf_counter() - parse_started) * 1000
+
+        # beam search 가 없으므로 adaptive 모드에서도 항상 greedy (신뢰도만 보고)
+        valid, fields, confidence = receipt_schema.field_confidence(generated, token_logprobs[row], pieces)
+        result['decoding'] = {
+            'path': 'greedy',
+            'confidence': confidence,
+            'fields': fields,
+            'schema_valid': valid,
+        }
+        # 단계별 시간 (core/telemetry.py). encoder / decoder 는 배치 전체 시간
+        result['timing'] = {
+            'batch_size': batch,
+            'encoder_ms': round(encoder_ms, 1),
+            'decoder_ms': round(decoder_ms, 1),
+            'parse_ms': round(parse_ms, 1),
+            'tokens': len(generated),
+        }
+        results.append(result)
+    return results
+
+def _log_softmax(logits):
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+def _token_pieces():
+    global _pieces
+    if _pieces is None:
+        tokens = export_config["tokens"]
+        special_ids = {tokens["eos_id"], tokens["pad_id"], tokens["unk_id"]}
+        _pieces = receipt_schema.token_pieces(
+            tokenizer.id_to_token, tokenizer.get_vocab_size(with_added_tokens=True), special_ids
+        )
+    return _pieces
+
+def _apply_generation_rules(logits, sequences, unk_id):
+    logits = logits.astype(np.float32, copy=True)
+
+    # <unk> 생성 금지
+    if unk_id is not None:
+        logits[:, unk_id] = -np.inf
+
+    for row, sequence in enumerate(sequences):
+        # 반복 패널티: 이미 나온 토큰의 점수를 낮춤
+        seen = np.unique(sequence)
+        scores = logits[row, seen]
+        logits[row, seen] = np.where(scores > 0, scores / REPETITION_PENALTY, scores * REPETITION_PENALTY)
+
+        # 같은 3-gram 이 다시 나오지 않도록 금지
+        n = NO_REPEAT_NGRAM_SIZE
+        if len(sequence) + 1 >= n:
+            prefix = tuple(sequence[len(sequence) - n + 1:])
+            banned = [
+                sequence[i + n - 1] for i in range(len(sequence) - n + 1)
+                if tuple(sequence[i:i + n - 1]) == prefix
+            ]
+            if banned:
+                logits[row, banned] = -np.inf
+    return logits
+
+# -----------------------------------------------------------------------------
+# 4. 후처리 (torch 백엔드의 _parse_sequence / DonutProcessor.token2json 과 동일)
+# -----------------------------------------------------------------------------
+def _parse_sequence(sequence):
+    tokens = export_config["tokens"]
+    sequence = sequence.replace(tokens["eos_token"], "").replace(tokens["pad_token"], "")
+    sequence = re.sub(r"<.*?>", "", sequence, count=1).strip()
+
+    print(f"🤖 AI 분석 결과(Raw): {sequence}")
+
+    try:
+        return {"status": "success", "result": token2json(sequence)}
+    except Exception:
+        return {"status": "partial_success", "result": {"text_content": sequence}}
+
+def _parse_constrained(token_ids):
+    sequence = receipt_schema.join_pieces(token_ids, _token_pieces())
+    print(f"🤖 AI 분석 결과(Raw): {sequence}")
+    return receipt_schema.parse(sequence)
+
+def _added_vocab():
+    try:
+        return {token.content for token in tokenizer.get_added_tokens_decoder().values()}
+    except AttributeError:
+        return set()
+
+def token2json(tokens, is_inner_value=False, added_vocab=None):
+    """ '<s_student>홍길동</s_student>...' 형태의 토큰 문자열을 dict 로 변환 """
+    if added_vocab is None:
+        added_vocab = _added_vocab()
+
+    output = {}
+    while tokens:
+        start_token = re.search(r"<s_(.*?)>", tokens, re.IGNORECASE)
+        if start_token is None:
+            break
+        key = start_token.group(1)
+        end_token = re.search(rf"</s_{re.escape(key)}>", tokens, re.IGNORECASE)
+        start_token = start_token.group()
+        if end_token is None:
+            tokens = tokens.replace(start_token, "")
+            continue
+
+        end_token = end_token.group()
+        content = re.search(
+            f"{re.escape(start_token)}(.*?){re.escape(end_token)}", tokens, re.IGNORECASE | re.DOTALL
+        )
+        if content is not None:
+            content = content.group(1).strip()
+            if "<s_" in content and "</s_" in content:  # 하위 노드
+                value = token2json(content, is_inner_value=True, added_vocab=added_vocab)
+                if value:
+                    output[key] = value[0] if len(value) == 1 else value
+            else:  # 값
+                leaves = []
+                for leaf in content.split("<sep/>"):
+                    leaf = leaf.strip()
+                    if leaf in added_vocab and leaf[0] == "<" and leaf[-2:] == "/>":
+                        leaf = leaf[1:-2]
+                    leaves.append(leaf)
+                output[key] = leaves[0] if len(leaves) == 1 else leaves
+
+        tokens = tokens[tokens.find(end_token) + len(end_token):].strip()
+        if tokens[:6] == "<sep/>":
+            return [output] + token2json(tokens[6:], is_inner_value=True, added_vocab=added_vocab)
+
+    if output:
+        return [output] if is_inner_value else output
+    return [] if is_inner_value else {"text_sequence": tokens}
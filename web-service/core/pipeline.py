@@ -0,0 +1,180 @@
+# web-service/core/pipeline.py
+
+import json
+import re
+
+# 로컬 AI 엔진 가져오기
+from . import telemetry
+from .inference import run_inference_batch
+from .receipt_split import split_receipts
+
+# 기존 서비스 로직 (DB 매칭용)
+from .services import (
+    find_students_by_amounts, 
+    scan_text_for_students,
+    find_payment_matches
+)
+
+# 합산 매칭 결과에 표시할 청구 항목 이름
+CHARGE_LABELS = {'base': '수강료', 'book': '교재비', 'base+book': '수강료+교재비'}
+
+# -----------------------------------------------------------------
+# 1. 이미지 분석 (AI 추론 -> 텍스트 변환 -> 매칭)
+#    (HTTP 요청과 비동기 작업 큐(core/jobs.py)가 함께 사용)
+# -----------------------------------------------------------------
+def process_image(pil_image, inference_info=None, split_info=None):
+    """
+    이미지를 AI 모델에 넣어 JSON 결과를 받고, 텍스트로 변환하여 분석
+    여러 영수증이 찍힌 사진은 영수증별로 잘라(core/receipt_split.py) 한 번에 배치 추론한 뒤,
+    영수증별 텍스트를 합쳐서 매칭합니다.
+    inference_info 에 목록을 넘기면 영수증별 디코딩 경로/신뢰도를 채워 줍니다. (응답에 포함)
+    split_info 에 dict 를 넘기면 분석한 영수증 수(receipts)와 최대 장수를 넘어 건너뛴 수(skipped)를 채워 줍니다.
+    """
+    try:
+        # 1. 영수증별로 나누고 AI 추론 실행 (배치)
+        with telemetry.span('split'):
+            crops, skipped = split_receipts(pil_image)
+        if split_info is not None:
+            split_info.update({'receipts': len(crops), 'skipped': skipped})
+        ai_outputs = run_inference_batch(crops)
+        if inference_info is not None:
+            inference_info.extend(ai_output.get('decoding') for ai_output in ai_outputs)
+
+        # 2. 영수증별 결과를 매칭용 텍스트로 변환
+        texts, errors = [], []
+        for ai_output in ai_outputs:
+            if ai_output['status'] == 'error':
+                errors.append(ai_output.get('message'))
+                continue
+            print(f"🔍 AI 추출 JSON 데이터: {ai_output['result']}")
+            texts.extend(output_to_texts(ai_output))
+
+        if errors and not texts:
+            return [f"❌ AI 분석 실패: {errors[0]}"]
+
+        # 3. [중요] 합친 텍스트로 기존 매칭 로직 실행
+        full_text_from_ai = "\n".join(text for text in texts if text)
+        print(f"📝 변환된 분석 텍스트:\n{full_text_from_ai}")
+        with telemetry.span('matching'):
+            results = process_text_data(full_text_from_ai)
+        if errors:
+            results.append(f"⚠️ 영수증 {len(ai_outputs)}장 중 {len(errors)}장은 분석하지 못했습니다.")
+        if skipped:
+            results.append(
+                f"⚠️ 사진에서 영수증 {len(crops) + skipped}장을 찾았지만 {len(crops)}장까지만 분석했습니다. "
+                f"나머지 {skipped}장은 따로 찍어 올려주세요."
+            )
+        return results
+
+    except Exception as e:
+        print(f"Image Processing Error: {e}")
+        return [f"서버 에러: 이미지 처리 중 문제가 발생했습니다. {str(e)}"]
+
+def output_to_texts(ai_output):
+    """
+    run_inference 결과 하나 -> 영수증별 매칭용 텍스트 목록
+    학습 라벨이 JSON 문자열({"receipts": [...]})이라 모델 출력이 JSON 텍스트로 오는 경우도 풀어서 처리합니다.
+    """
+    data = ai_output['result']
+    text = data.get('text_sequence') or data.get('text_content')
+    if text:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            # 부분 성공: 구조화하지 못한 텍스트를 그대로 매칭에 사용
+            return [text]
+
+    receipts = data.get('receipts') if isinstance(data, dict) else None
+    if isinstance(receipts, list):
+        return [receipt_to_text(r) for r in receipts if isinstance(r, dict)]
+    return [receipt_to_text(data)] if isinstance(data, dict) else []
+
+def receipt_to_text(data):
+    """
+    AI 추출 JSON 을 매칭용 텍스트로 바꿉니다.
+    예: {'total_price': '50,000', 'student': '홍길동'} -> "학생명: 홍길동\n총계 50,000"
+    """
+    converted_lines = []
+    
+    # (1) 학생 이름 추출
+    if 'student' in data:
+        converted_lines.append(f"학생명: {data['student']}")
+    
+    # (2) 총 금액 추출 (total_price 또는 amount 키)
+    if 'total_price' in data:
+        converted_lines.append(f"총계 {data['total_price']}")
+    elif 'amount' in data:
+        converted_lines.append(f"금액 {data['amount']}")
+    
+    # (3) 품목 내역 추출 (items 리스트)
+    if 'items' in data and isinstance(data['items'], list):
+        for item in data['items']:
+            # item이 dict인 경우 desc와 price 추출
+            if isinstance(item, dict):
+                desc = item.get('desc', item.get('item', ''))
+                price = item.get('price', item.get('amount', ''))
+                converted_lines.append(f"{desc} {price}")
+            elif isinstance(item, str):
+                converted_lines.append(item)
+
+    return "\n".join(converted_lines)
+
+# -----------------------------------------------------------------
+# 2. 텍스트 분석 (이름 / 금액 매칭)
+# -----------------------------------------------------------------
+def process_text_data(text):
+    """ 텍스트에서 학생 이름과 금액을 찾아 DB와 매칭 """
+    results = []
+    
+    # 1. 이름 기반 검색
+    found_students = scan_text_for_students(text)
+    if found_students:
+        for student in found_students:
+            results.append(f"✅ 이름 매칭: '{student.name}' 학생 (DB 수강료: {student.base_fee:,}원)")
+
+    # 2. 금액 기반 검색
+    # (1) 텍스트 전체에서 후보 금액을 먼저 모은 뒤
+    amounts = []
+    lines = text.splitlines()
+    for line in lines:
+        # 숫자만 추출 (콤마 제거)
+        numbers = re.findall(r'\d+', line.replace(',', ''))
+        
+        for num_str in numbers:
+            amount = int(num_str)
+            
+            # 금액 노이즈 필터링
+            if amount < 1000 or amount > 10000000:
+                continue
+
+            # 이미 찾은 학생의 수강료와 같다면 중복 출력 방지
+            is_already_found = False
+            for s in found_students:
+                if amount in (s.base_fee, s.book_fee, s.base_fee + s.book_fee):
+                    is_already_found = True
+                    break
+            if is_already_found:
+                continue
+
+            amounts.append(amount)
+
+    # (2) 금액 매칭은 한 번에 조회
+    students = find_students_by_amounts(amounts)
+    for amount, student in zip(amounts, students):
+        if student:
+            results.append(f"💰 금액 매칭: {amount:,}원 → {student.name}")
+        else:
+            # 합산 매칭 시도
+            matches = find_payment_matches(amount)
+            if matches['type'] == 'N:1':
+                kinds = matches['candidates'][0].get('kinds') or ['base'] * len(matches['students'])
+                names = ", ".join([
+                    s.name if kind == 'base' else f"{s.name}({CHARGE_LABELS[kind]})"
+                    for s, kind in zip(matches['students'], kinds)
+                ])
+                results.append(f"💡 합산 의심: {amount:,}원 → {names} 합산액과 일치")
+
+    if not results:
+        results.append("❌ 매칭 실패: 텍스트에서 유의미한 정보를 찾지 못했습니다.")
+
+    return results
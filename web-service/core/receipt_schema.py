@@ -0,0 +1,203 @@
+# web-service/core/receipt_schema.py
+
+import json
+import math
+
+import numpy as np
+
+# -----------------------------------------------------------------------------
+# 영수증 JSON 스키마 제약 디코딩 (settings.INFERENCE_CONSTRAINED)
+#
+# 모델은 학습 라벨 그대로 아래 형태의 JSON 텍스트를 생성합니다. (ai-engine/train.py)
+#   {"receipts": [{"student": "홍길동", "amount": 250000, "date": "2025-03-05", "type": "memo"}, ...]}
+# 매 스텝 점수가 높은 후보 토큰부터 이 형태를 깨지 않는 첫 토큰을 고르고(문자 단위 상태 기계),
+# 닫는 "]}" 가 나오면 바로 끝냅니다. 필드 길이에도 상한을 둬서 같은 글자를 반복하며
+# max_length 까지 달리는 경우를 막습니다. 결과는 항상 json.loads 가 되는 텍스트입니다.
+# -----------------------------------------------------------------------------
+
+# 필드별 최대 글자 수 (amount 는 숫자 자릿수)
+FIELD_MAX_CHARS = {'student': 20, 'amount': 9, 'date': 16}
+RECEIPT_TYPES = ('card', 'gani', 'memo')
+
+# 한 이미지(영수증 한 장으로 잘린 crop)에서 받을 최대 영수증 수
+MAX_RECEIPTS = 10
+
+_PROGRAM = (
+    ('lit', '{'), ('lit', '"receipts"'), ('lit', ':'), ('lit', '['),
+    ('lit', '{'), ('lit', '"student"'), ('lit', ':'), ('str', 'student'),
+    ('lit', ','), ('lit', '"amount"'), ('lit', ':'), ('int', 'amount'),
+    ('lit', ','), ('lit', '"date"'), ('lit', ':'), ('str', 'date'),
+    ('lit', ','), ('lit', '"type"'), ('lit', ':'), ('enum', 'type'),
+    ('lit', '}'), ('next', None), ('lit', '}'), ('end', None),
+)
+_RECEIPT_START = 4
+_NEXT = 21
+_END = len(_PROGRAM) - 1
+
+# 상태: (프로그램 위치, 위치 안에서의 진행도, 현재 값 글자, 영수증 수)
+START_STATE = (0, 0, '', 1)
+
+def feed(state, text):
+    """ 상태에 문자열을 이어 붙인 새 상태. 스키마를 벗어나면 None """
+    for char in text:
+        state = _feed_char(state, char)
+        if state is None:
+            return None
+    return state
+
+def is_complete(state):
+    return state[0] == _END
+
+def _feed_char(state, char):
+    index, offset, value, count = state
+    kind, arg = _PROGRAM[index]
+
+    if kind == 'lit':
+        if offset == 0 and char.isspace():
+            return state
+        if char != arg[offset]:
+            return None
+        if offset + 1 == len(arg):
+            return (index + 1, 0, '', count)
+        return (index, offset + 1, '', count)
+
+    if kind in ('str', 'enum'):
+        if offset == 0:
+            if char.isspace():
+                return state
+            return (index, 1, '', count) if char == '"' else None
+        if char == '"':
+            if kind == 'enum' and value not in RECEIPT_TYPES:
+                return None
+            return (index + 1, 0, '', count) if value else None
+        if char == '\\' or ord(char) < 32:
+            return None
+        value += char
+        if kind == 'enum':
+            return (index, 1, value, count) if any(t.startswith(value) for t in RECEIPT_TYPES) else None
+        return (index, 1, value, count) if len(value) <= FIELD_MAX_CHARS[arg] else None
+
+    if kind == 'int':
+        if char.isdigit():
+            if (value == '0') or len(value) >= FIELD_MAX_CHARS[arg]:
+                return None
+            return (index, 1, value + char, count)
+        if not value:
+            return state if char.isspace() else None
+        # 숫자가 끝나면 다음 항목에서 이 글자를 다시 처리
+        return _feed_char((index + 1, 0, '', count), char)
+
+    if kind == 'next':
+        if char.isspace():
+            return state
+        if char == ',':
+            return (_RECEIPT_START, 0, '', count + 1) if count < MAX_RECEIPTS else None
+        return (index + 1, 0, '', count) if char == ']' else None
+
+    # 'end': 닫힌 뒤에는 공백만
+    return state if char.isspace() else None
+
+def salvage(text):
+    """
+    중간에 끊긴 출력(max_length 도달 등)에서 끝까지 닫힌 영수증까지만 남겨 유효한 JSON 으로 만듭니다.
+    """
+    state, last_closed = START_STATE, None
+    for position, char in enumerate(text):
+        previous, state = state, _feed_char(state, char)
+        if state is None:
+            break
+        if state[0] == _NEXT and previous[0] != _NEXT:  # 영수증 하나가 '}' 로 닫힘
+            last_closed = position + 1
+        if is_complete(state):
+            return text[:position + 1]
+    if last_closed is None:
+        return '{"receipts": []}'
+    return text[:last_closed] + ']}'
+
+def parse(text):
+    """ 제약 디코딩 결과 텍스트 -> run_inference 결과 dict (항상 success) """
+    text = text.strip()
+    return {"status": "success", "result": json.loads(salvage(text))}
+
+# -----------------------------------------------------------------------------
+# 디코딩 스텝 도우미 (torch / onnx 백엔드 공용)
+# -----------------------------------------------------------------------------
+def token_pieces(id_to_token, vocab_size, special_ids):
+    """
+    토큰 id -> 이어 붙일 문자열 (sentencepiece 의 '▁' 는 공백). 특수/바이트 토큰은 None (생성 금지)
+    """
+    pieces = []
+    for token_id in range(vocab_size):
+        token = id_to_token(token_id)
+        if token is None or token_id in special_ids or (token.startswith('<') and token.endswith('>')):
+            pieces.append(None)
+        else:
+            pieces.append(token.replace('▁', ' '))
+    return pieces
+
+def allowed_tokens(scores, state, pieces, eos_id, limit=1):
+    """
+    점수(1차원 numpy 배열)가 높은 순으로 스키마를 지키는 토큰을 최대 limit 개 고릅니다.
+    반환: [(토큰 id, 새 상태), ...]. 스키마가 닫혔거나 이어갈 토큰이 없으면 [(eos_id, state)]
+    """
+    if is_complete(state):
+        return [(eos_id, state)]
+
+    allowed = []
+    for token_id in np.argsort(-scores):
+        if not np.isfinite(scores[token_id]):
+            break  # 나머지는 반복 금지 등으로 막힌 토큰
+        piece = pieces[token_id] if token_id < len(pieces) else None
+        if piece is None:
+            continue
+        new_state = feed(state, piece)
+        if new_state is not None:
+            allowed.append((int(token_id), new_state))
+            if len(allowed) == limit:
+                break
+    return allowed or [(eos_id, state)]
+
+def join_pieces(token_ids, pieces):
+    """ 생성된 토큰 id -> 상태 기계가 본 것과 같은 텍스트 (특수 토큰 제외) """
+    return "".join(pieces[t] for t in token_ids if t < len(pieces) and pieces[t] is not None)
+
+# -----------------------------------------------------------------------------
+# 필드별 신뢰도 (settings.INFERENCE_DECODING = 'adaptive' 에서 beam 재시도 여부 판단)
+# -----------------------------------------------------------------------------
+def field_confidence(token_ids, token_logprobs, pieces):
+    """
+    생성 토큰과 토큰별 log 확률(같은 길이, 모르는 값은 None) -> (스키마 유효 여부, {필드: 신뢰도}, 전체 신뢰도)
+    필드 신뢰도는 그 값을 이루는 토큰 확률의 기하 평균이고, 영수증이 여러 장이면 가장 낮은 값.
+    전체 신뢰도는 필드 중 가장 낮은 값 (스키마를 벗어났거나 영수증이 없으면 None)
+    """
+    state = START_STATE
+    spans = []   # [(영수증 번호, 필드, [log 확률, ...]), ...]
+    for token_id, logprob in zip(token_ids, token_logprobs):
+        piece = pieces[token_id] if token_id < len(pieces) else None
+        if piece is None:
+            continue
+        touched = set()
+        for char in piece:
+            state = _feed_char(state, char)
+            if state is None:
+                return False, {}, None
+            kind, field = _PROGRAM[state[0]]
+            if kind in ('str', 'int', 'enum') and state[2]:
+                touched.add((state[3], field))
+        if logprob is None:  # 확률을 기록하지 못한 토큰 (신뢰도 계산에서만 제외)
+            continue
+        for receipt, field in touched:
+            if spans and spans[-1][:2] == (receipt, field):
+                spans[-1][2].append(logprob)
+            else:
+                spans.append((receipt, field, [logprob]))
+
+    fields = {}
+    for _, field, logprobs in spans:
+        confidence = math.exp(sum(logprobs) / len(logprobs))
+        fields[field] = min(fields.get(field, 1.0), confidence)
+    fields = {field: round(value, 4) for field, value in fields.items()}
+
+    valid = is_complete(state)
+    overall = min(fields.values()) if valid and fields else None
+    return valid, fields, overall
@@ -0,0 +1,104 @@
+# web-service/core/receipt_split.py
+
+from django.conf import settings
+
+from .ingest import reduce_for_model
+
+# -----------------------------------------------------------------------------
+# 한 장의 사진에 여러 영수증이 찍힌 경우 영수증별로 잘라내기 (OpenCV 윤곽선)
+#
+# 영수증 5장을 한 번에 찍은 사진을 통째로 디코딩하면 시퀀스가 길어져 느리고,
+# max_length(768)에서 잘려 뒤쪽 영수증을 놓치기 쉽습니다.
+# 배경보다 밝은 종이 덩어리를 윤곽선으로 찾아 영수증마다 잘라서 배치 추론합니다.
+# (opencv 가 설치되어 있지 않으면 나누지 않고 한 장으로 처리)
+# -----------------------------------------------------------------------------
+
+# 윤곽선 탐지용 축소본 긴 변 길이
+DETECT_SIZE = 800
+
+# 영수증 한 장으로 인정할 최소 면적 (사진 대비 비율)
+MIN_RECEIPT_AREA = 0.02
+
+# 잘라낼 때 상자 바깥으로 더 붙일 여백 (상자 짧은 변 대비)
+CROP_PADDING = 0.03
+
+_cv2_missing_warned = False
+
+def _import_cv2():
+    global _cv2_missing_warned
+    try:
+        import cv2
+        return cv2
+    except ImportError:
+        if not _cv2_missing_warned:
+            print("⚠️ opencv 가 없어 여러 장 영수증 분리를 건너뜁니다. (pip install opencv-python-headless)")
+            _cv2_missing_warned = True
+        return None
+
+def find_receipt_boxes(pil_image):
+    """
+    밝은 종이 영역의 윤곽선을 찾아 영수증 상자 [(left, top, right, bottom), ...] 를 반환합니다.
+    위 -> 아래, 왼쪽 -> 오른쪽 순서. 두 장 이상 찾지 못하면 빈 목록 (나눌 필요 없음)
+    """
+    cv2 = _import_cv2()
+    if cv2 is None:
+        return []
+    import numpy as np
+
+    gray = np.asarray(pil_image.convert('L'))
+    height, width = gray.shape
+    scale = min(1.0, DETECT_SIZE / max(height, width))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    # 종이(밝음) / 배경(어두움) 분리 -> 글자 구멍 메우기 -> 맞닿은 잡티 떼어내기
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9)))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = MIN_RECEIPT_AREA * mask.shape[0] * mask.shape[1]
+    rects = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= min_area]
+    if len(rects) < 2:
+        return []
+
+    boxes = []
+    for x, y, w, h in rects:
+        pad = CROP_PADDING * min(w, h)
+        boxes.append((
+            max(0, int((x - pad) / scale)),
+            max(0, int((y - pad) / scale)),
+            min(width, int((x + w + pad) / scale)),
+            min(height, int((y + h + pad) / scale)),
+        ))
+
+    # 같은 줄(세로 위치가 겹치는 상자)은 왼쪽부터, 줄은 위에서부터
+    boxes.sort(key=lambda b: b[1])
+    rows = []
+    for box in boxes:
+        if rows and box[1] < rows[-1][0][3] - (rows[-1][0][3] - rows[-1][0][1]) / 2:
+            rows[-1].append(box)
+        else:
+            rows.append([box])
+    return [box for row in rows for box in sorted(row, key=lambda b: b[0])]
+
+def split_receipts(pil_image):
+    """
+    사진 -> (영수증별 이미지 목록, 최대 장수를 넘어 버린 영수증 수)
+    한 장이면 ([원본], 0). INFERENCE_MAX_RECEIPTS 를 넘는 영수증은 분석하지 않고 개수만 알려줍니다.
+    분리가 켜져 있으면 ingest 가 원본 해상도로 넘겨주므로, 나눈 뒤 영수증별로 모델 입력 크기까지 줄입니다.
+    """
+    if not settings.INFERENCE_SPLIT_RECEIPTS:
+        return [pil_image], 0
+
+    found = find_receipt_boxes(pil_image)
+    if not found:
+        return [reduce_for_model(pil_image)], 0
+
+    boxes = found[:settings.INFERENCE_MAX_RECEIPTS]
+    skipped = len(found) - len(boxes)
+    if skipped:
+        print(f"⚠️ 영수증 {len(found)}장 중 {skipped}장은 최대 장수({settings.INFERENCE_MAX_RECEIPTS})를 넘어 분석하지 않습니다.")
+    print(f"✂️ 영수증 {len(boxes)}장으로 분리")
+    return [reduce_for_model(pil_image.crop(box)) for box in boxes], skipped
@@ -0,0 +1,394 @@
+# web-service/core/reconcile.py
+
+import csv
+import io
+import datetime
+import hashlib
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+
+from .models import Payment
+from . import ledger
+from .roster import get_outstanding_roster
+from .services import rank_students_by_name, find_payment_matches
+
+try:
+    # 있으면 SciPy 의 C 구현을 사용 (없으면 아래 NumPy 구현으로 대체)
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# 비용 설정 (작을수록 확실한 매칭)
+#   이름 + 금액: 0 ~ 0.65 / 이름만: 0.8 ~ 0.95 / 금액만: 1.0 ~ 1.5
+NAME_MISS_COST = 1.0          # 이름 근거가 없을 때
+AMOUNT_MISS_COST = 0.8        # 금액이 허용 오차 밖일 때 (이름 근거가 있으면 금액만 맞는 경우보다 항상 쌈)
+REVIEW_COST = 1.0             # 이 비용 이상(= 이름 근거 없음)인 배정은 저장하지 않고 '확인 필요'로 남김
+UNMATCHED_COST = 1.6          # 이 비용보다 비싼 배정은 '미매칭'으로 남김
+MAX_AMOUNT_CANDIDATES = 20    # 금액만 맞는 후보가 이보다 많으면 (너무 모호하므로) 금액 근거는 버림
+BIG_COST = 1e9
+
+# -----------------------------------------------------------------
+# 1. 은행 입금 내역 파싱 (CSV/TSV)
+# -----------------------------------------------------------------
+HEADER_ALIASES = {
+    'date': ('거래일시', '거래일자', '거래일', '입금일', '날짜', 'date'),
+    'name': ('입금자명', '입금자', '보낸분', '의뢰인', '적요', '내용', '이름', 'name'),
+    'amount': ('입금액', '입금금액', '입금', '금액', 'amount'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y.%m.%d', '%Y/%m/%d', '%Y%m%d')
+
+def _find_columns(header):
+    normalized = [h.strip().lower().replace(" ", "") for h in header]
+    columns = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            matches = [i for i, h in enumerate(normalized) if alias in h and i not in columns.values()]
+            if matches:
+                columns[field] = matches[0]
+                break
+    missing = [field for field in ('name', 'amount') if field not in columns]
+    if missing:
+        raise ValueError(f"입금 내역 헤더에서 {', '.join(missing)} 열을 찾지 못했습니다: {header}")
+    return columns
+
+def _parse_amount(value):
+    value = value.replace(',', '').replace('원', '').strip()
+    try:
+        return int(float(value))
+    except ValueError:
+        return 0
+
+def _parse_date(value):
+    value = value.strip().split(' ')[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def parse_statement(uploaded_file, encoding='utf-8-sig'):
+    """
+    업로드된 은행 입금 내역을 한 줄씩 읽어 입금 건을 돌려줍니다.
+    출금 등 입금액이 0 이하인 줄은 건너뜁니다.
+    (전역 배정에 모든 입금 건이 필요해서 reconcile_statement 는 결과를 목록으로 모아 씁니다)
+
+    반환(generator): {'row', 'date', 'name', 'amount'}
+    """
+    text = io.TextIOWrapper(uploaded_file, encoding=encoding, newline='')
+    first_line = text.readline()
+    if not first_line:
+        return
+
+    delimiter = '\t' if '\t' in first_line else ','
+    reader = csv.reader(chain([first_line], text), delimiter=delimiter)
+    columns = _find_columns(next(reader))
+
+    for row_number, row in enumerate(reader, start=2):
+        if not row or len(row) <= max(columns.values()):
+            continue
+        amount = _parse_amount(row[columns['amount']])
+        if amount <= 0:
+            continue
+        yield {
+            'row': row_number,
+            'date': _parse_date(row[columns['date']]) if 'date' in columns else None,
+            'name': row[columns['name']].strip(),
+            'amount': amount,
+        }
+
+# -----------------------------------------------------------------
+# 2. 입금 건별 후보 학생 (기존 이름/금액 매칭 로직 재사용)
+# -----------------------------------------------------------------
+def build_candidate_edges(deposits, tolerance=1000, period=None):
+    """
+    입금 건마다 후보 학생과 비용을 계산합니다. (해당 기간 미납 학생만)
+
+    - 이름 근거: rank_students_by_name 점수 85점 이상 (비용 0 ~ 0.15, 없으면 NAME_MISS_COST)
+    - 금액 근거: 수강료/교재비/합계와의 차이가 tolerance 이내 (비용 0 ~ 0.5, 없으면 AMOUNT_MISS_COST)
+
+    반환: {deposit_index: {student_id: cost}}
+    """
+    roster = get_outstanding_roster(period)
+    name_cache = {}
+    edges = {}
+
+    for index, deposit in enumerate(deposits):
+        # 같은 학부모가 여러 번 입금하는 경우가 많으므로 이름별로 한 번만 계산
+        name = deposit['name']
+        if name not in name_cache:
+            name_cache[name] = {
+                record.id: score for record, score in rank_students_by_name(name, period=period) if score >= 85
+            }
+        name_scores = name_cache[name]
+
+        amount_ids = roster.fee_index.lookup(deposit['amount'], tolerance)
+        if len(amount_ids) > MAX_AMOUNT_CANDIDATES:
+            amount_ids = np.intersect1d(amount_ids, np.fromiter(name_scores, dtype=np.int64))
+
+        candidates = {}
+        for student_id in set(name_scores) | {int(i) for i in amount_ids}:
+            record = roster.get(student_id)
+            if record is None:
+                continue
+            name_cost = 1 - name_scores[student_id] / 100 if student_id in name_scores else NAME_MISS_COST
+            diff = _amount_diff(record, deposit['amount'])
+            amount_cost = 0.5 * diff / max(tolerance, 1) if diff <= tolerance else AMOUNT_MISS_COST
+            candidates[student_id] = name_cost + amount_cost
+        edges[index] = candidates
+
+    return edges
+
+def _amount_diff(record, amount):
+    charges = [fee for fee in (record.base_fee, record.book_fee, record.base_fee + record.book_fee) if fee > 0]
+    return min((abs(fee - amount) for fee in charges), default=amount)
+
+# -----------------------------------------------------------------
+# 3. 전역 최소 비용 배정 (한 학생은 한 입금 건에만)
+# -----------------------------------------------------------------
+def _hungarian(cost):
+    """
+    직사각형(행 <= 열) 비용 행렬의 최소 비용 배정 (Hungarian, O(n^2 m)).
+    열 방향 계산은 NumPy 로 한 번에 처리합니다.
+    반환: 행마다 배정된 열 번호 배열
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)    # p[j] = 열 j에 배정된 행 (1부터, 0은 없음)
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            current = cost[i0 - 1] - u[i0] - v[1:]
+            improve = free & (current < minv[1:])
+            minv[1:][improve] = current[improve]
+            way[1:][improve] = j0
+
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+
+            used_cols = np.flatnonzero(used)
+            u[p[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = np.full(n, -1, dtype=np.int64)
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+def _solve(cost):
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+        assignment = np.full(cost.shape[0], -1, dtype=np.int64)
+        assignment[rows] = cols
+        return assignment
+    return _hungarian(cost)
+
+def _components(edges):
+    """ 입금 건-학생 후보 그래프를 연결 요소별로 나눕니다. (서로 무관한 입금끼리는 따로 풂) """
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for deposit_index, candidates in edges.items():
+        find(('d', deposit_index))
+        for student_id in candidates:
+            parent[find(('d', deposit_index))] = find(('s', student_id))
+
+    groups = {}
+    for deposit_index in edges:
+        groups.setdefault(find(('d', deposit_index)), []).append(deposit_index)
+    return list(groups.values())
+
+def solve_assignment(edges):
+    """
+    모든 입금 건과 학생 사이의 최소 비용 1:1 배정을 구합니다.
+    입금 건마다 '미매칭' 가상 열(UNMATCHED_COST)을 붙여, 근거가 약한 배정은 하지 않습니다.
+
+    반환: {deposit_index: (student_id, cost)}  (배정된 건만)
+    """
+    result = {}
+    for deposit_indexes in _components(edges):
+        student_ids = sorted({s for d in deposit_indexes for s in edges[d]})
+        if not student_ids:
+            continue
+        column = {student_id: j for j, student_id in enumerate(student_ids)}
+
+        n, k = len(deposit_indexes), len(student_ids)
+        cost = np.full((n, k + n), BIG_COST)
+        for row, deposit_index in enumerate(deposit_indexes):
+            for student_id, edge_cost in edges[deposit_index].items():
+                cost[row, column[student_id]] = edge_cost
+            cost[row, k + row] = UNMATCHED_COST
+
+        for row, col in enumerate(_solve(cost)):
+            if 0 <= col < k and cost[row, col] < UNMATCHED_COST:
+                result[deposit_indexes[row]] = (student_ids[col], float(cost[row, col]))
+    return result
+
+# -----------------------------------------------------------------
+# 4. 결과 저장 (Payment, 청크 단위 트랜잭션)
+# -----------------------------------------------------------------
+def deposit_key(deposit, occurrence=1):
+    """
+    입금 건 키: (날짜, 입금자명, 금액, 같은 값의 몇 번째 입금인지) 의 해시.
+    파일의 행 번호는 넣지 않으므로, 기간이 겹치게 다시 내보낸 내역(1~15일 -> 1~31일)에서도 같은 입금은 같은 키
+    """
+    date = deposit['date'].isoformat() if deposit['date'] else ''
+    raw = f"{date}|{deposit['name']}|{deposit['amount']}|{occurrence}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def assign_deposit_keys(deposits):
+    """ 입금 건마다 'key' 를 채웁니다. 한 파일 안에 똑같은 입금이 여러 번 있으면 순서대로 1, 2, ... 번째로 구분 """
+    seen = Counter()
+    for deposit in deposits:
+        value = (deposit['date'], deposit['name'], deposit['amount'])
+        seen[value] += 1
+        deposit['key'] = deposit_key(deposit, seen[value])
+
+def existing_deposit_keys(keys):
+    """ 이미 Payment 로 저장된 입금 건 키 """
+    found = set()
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        found.update(
+            Payment.objects.filter(statement_key__in=keys[start:start + 500]).values_list('statement_key', flat=True)
+        )
+    return found
+
+def save_payments(payments, chunk_size=500):
+    """ statement_key 가 이미 있는 결제는 건너뜁니다. (동시에 같은 내역을 올린 경우 대비) """
+    created = 0
+    for start in range(0, len(payments), chunk_size):
+        with transaction.atomic():
+            chunk = payments[start:start + chunk_size]
+            existing = existing_deposit_keys(p.statement_key for p in chunk if p.statement_key)
+            chunk = Payment.objects.bulk_create([p for p in chunk if p.statement_key not in existing])
+            # bulk_create 는 시그널이 없으므로 미납 장부를 직접 갱신
+            ledger.apply_payments(chunk)
+            created += len(chunk)
+    return created
+
+def statement_period(deposits):
+    """ 입금 내역에서 가장 많이 등장하는 달을 청구 기간으로 봅니다. (날짜가 없으면 이번 달) """
+    periods = Counter(ledger.period_of(d['date']) for d in deposits if d['date'])
+    if not periods:
+        return ledger.current_period()
+    return periods.most_common(1)[0][0]
+
+# -----------------------------------------------------------------
+# 5. 전체 흐름
+# -----------------------------------------------------------------
+def reconcile_statement(uploaded_file, tolerance=1000, dry_run=False, encoding='utf-8-sig'):
+    """
+    은행 입금 내역 전체를 한 번에 정산합니다.
+
+    1) 내역 파싱 → 2) 입금 건별 후보 계산 (해당 월 미납 학생만) → 3) 전역 최소 비용 배정
+    4) 이름 근거가 있는 배정만 Payment 로 저장 (금액이 맞으면 PAID, 이름만 맞으면 MISMATCH)
+       금액만 맞는 배정은 저장하지 않고 '확인 필요'(review)로 돌려줌
+    5) 배정되지 않은 건은 합산(N:1) 후보만 제안
+    이미 저장된 입금 건(같은 내역을 다시 올린 경우)은 'duplicate' 로 건너뜁니다.
+    """
+    all_deposits = list(parse_statement(uploaded_file, encoding=encoding))
+    period = statement_period(all_deposits)
+    assign_deposit_keys(all_deposits)
+    saved_keys = existing_deposit_keys(d['key'] for d in all_deposits)
+    deposits = [d for d in all_deposits if d['key'] not in saved_keys]
+
+    edges = build_candidate_edges(deposits, tolerance, period)
+    assignment = solve_assignment(edges)
+
+    roster = get_outstanding_roster(period)
+    today = datetime.date.today()
+    results, payments = [], []
+    summary = {
+        'period': period, 'deposits': len(all_deposits), 'matched': 0, 'mismatch': 0, 'review': 0,
+        'suggested': 0, 'unmatched': 0, 'duplicate': len(all_deposits) - len(deposits),
+    }
+
+    for deposit in all_deposits:
+        if deposit['key'] in saved_keys:
+            results.append({**_entry(deposit), 'status': 'duplicate'})
+
+    for index, deposit in enumerate(deposits):
+        entry = _entry(deposit)
+
+        if index in assignment and assignment[index][1] >= REVIEW_COST:
+            # 금액만 맞는 학생: 같은 금액의 다른 학생일 수 있으므로 저장하지 않고 확인 요청
+            student_id, cost = assignment[index]
+            entry.update({
+                'status': 'review',
+                'student_id': student_id,
+                'student': roster.get(student_id).name,
+                'cost': round(cost, 3),
+            })
+            summary['review'] += 1
+        elif index in assignment:
+            student_id, cost = assignment[index]
+            record = roster.get(student_id)
+            payment_status = 'PAID' if _amount_diff(record, deposit['amount']) <= tolerance else 'MISMATCH'
+            entry.update({
+                'status': 'matched',
+                'student_id': student_id,
+                'student': record.name,
+                'payment_status': payment_status,
+                'cost': round(cost, 3),
+            })
+            summary['matched' if payment_status == 'PAID' else 'mismatch'] += 1
+            payments.append(Payment(
+                student_id=student_id,
+                amount_paid=deposit['amount'],
+                payment_date=deposit['date'] or today,
+                payment_method='이체',
+                status=payment_status,
+                statement_key=deposit['key'],
+            ))
+        else:
+            matches = find_payment_matches(deposit['amount'], tolerance, period=period)
+            if matches['type'] == 'N:1':
+                entry.update({'status': 'suggested', 'students': [s.name for s in matches['students']]})
+                summary['suggested'] += 1
+            else:
+                entry['status'] = 'unmatched'
+                summary['unmatched'] += 1
+
+        results.append(entry)
+
+    results.sort(key=lambda entry: entry['row'])
+    summary['created'] = 0 if dry_run else save_payments(payments)
+    return {'summary': summary, 'results': results}
+
+def _entry(deposit):
+    return {
+        'row': deposit['row'],
+        'date': deposit['date'].isoformat() if deposit['date'] else None,
+        'name': deposit['name'],
+        'amount': deposit['amount'],
+    }
@@ -0,0 +1,203 @@
+# web-service/core/result_cache.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+# -----------------------------------------------------------------------------
+# 영수증 이미지 -> run_inference 결과 캐시
+#
+# - 키: 디코딩된 픽셀의 SHA-256 (같은 사진을 다시 올리면 파일명/메타데이터가 달라도 적중)
+#   (비슷한 이미지로 찾는 지각 해시는 쓰지 않음: 같은 양식의 다른 학생 영수증이 같은 결과로 적중할 수 있음)
+# - 메모리 LRU 앞단 + 디스크(JSON 파일) 뒷단, 디스크는 총 용량 기준으로 오래된 것부터 삭제
+# - 모델 ID / 리비전 / 백엔드 / 양자화 모드마다 네임스페이스(하위 폴더)가 따로 있어 서로 섞이지 않음.
+#   다른 네임스페이스는 다른 프로세스(onnx 워커, 배포 중인 새 버전)가 쓰고 있을 수 있으므로
+#   stale_days 동안 아무도 쓰지 않은 것만 지움
+# -----------------------------------------------------------------------------
+
+def content_hash(image):
+    """ 디코딩된 RGB 픽셀 + 크기의 SHA-256 """
+    image = image.convert("RGB")
+    digest = hashlib.sha256(f"{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def files_fingerprint(paths):
+    """ 모델 파일들의 (이름, 크기, 수정 시각) -> 짧은 지문. 파일을 다시 받거나 내보내면 값이 바뀜 """
+    parts = []
+    for path in sorted(Path(p) for p in paths):
+        stat = path.stat()
+        parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
+
+class ResultCache:
+    def __init__(self, directory, max_bytes, memory_items, stale_days=30):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.stale_days = stale_days
+
+        self._lock = threading.Lock()
+        self._namespace = None
+        self._memory = OrderedDict()   # key -> output (최근 사용 순)
+        self._disk = OrderedDict()     # key -> 파일 크기 (최근 사용 순)
+        self._disk_bytes = 0
+        self.counters = {
+            'memory_hits': 0, 'disk_hits': 0,
+            'misses': 0, 'stores': 0, 'evictions': 0, 'invalidations': 0,
+        }
+
+    # -------------------------------------------------------------
+    # 네임스페이스 (모델마다 하위 폴더)
+    # -------------------------------------------------------------
+    def _use_namespace(self, namespace):
+        if namespace == self._namespace:
+            return
+
+        if self._namespace is not None:
+            self.counters['invalidations'] += 1
+        self._namespace = namespace
+        self._memory.clear()
+        self._disk.clear()
+        self._disk_bytes = 0
+
+        (self.directory / namespace).mkdir(parents=True, exist_ok=True)
+        self._prune_stale_namespaces()
+
+        # 디스크에 남아 있는 항목을 오래된 순으로 색인
+        entries = []
+        for path in (self.directory / namespace).glob("*/*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _prune_stale_namespaces(self):
+        """ stale_days 동안 읽히지도 쓰이지도 않은 다른 네임스페이스 폴더만 삭제 (조회/저장 때 파일 mtime 갱신) """
+        cutoff = time.time() - self.stale_days * 86400
+        for other in self.directory.iterdir():
+            if not other.is_dir() or other.name == self._namespace:
+                continue
+            try:
+                newest = max([other.stat().st_mtime] + [p.stat().st_mtime for p in other.glob("*/*.json")])
+            except OSError:
+                continue
+            if newest < cutoff:
+                shutil.rmtree(other, ignore_errors=True)
+                print(f"🧹 {self.stale_days}일 동안 쓰지 않은 추론 캐시 삭제: {other.name}")
+
+    def _path(self, key):
+        return self.directory / self._namespace / key[:2] / f"{key}.json"
+
+    # -------------------------------------------------------------
+    # 조회 / 저장
+    # -------------------------------------------------------------
+    def get(self, namespace, key):
+        with self._lock:
+            self._use_namespace(namespace)
+
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self._memory[key]
+
+            output = self._read(key) if key in self._disk else None
+            if output is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['disk_hits'] += 1
+            self._remember(key, output)
+            return output
+
+    def put(self, namespace, key, output):
+        with self._lock:
+            self._use_namespace(namespace)
+            self._remember(key, output)
+
+            path = self._path(key)
+            data = json.dumps({'output': output, 'created': time.time()}, ensure_ascii=False)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(data, encoding='utf-8')
+                size = path.stat().st_size
+            except OSError as e:
+                print(f"⚠️ 추론 캐시 저장 실패 (메모리에만 보관): {e}")
+                return
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._disk_bytes += size
+            self.counters['stores'] += 1
+            self._evict()
+
+    def _remember(self, key, output):
+        self._memory[key] = output
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            output = json.loads(path.read_text(encoding='utf-8'))['output']
+        except (OSError, ValueError, KeyError):
+            self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        os.utime(path)  # 재시작 후에도 최근 사용 순서를 유지
+        self._disk.move_to_end(key)
+        return output
+
+    def _evict(self):
+        while self._disk_bytes > self.max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._memory.pop(key, None)
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+            self.counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = sum(self.counters[k] for k in ('memory_hits', 'disk_hits', 'misses'))
+            hits = lookups - self.counters['misses']
+            return {
+                **self.counters,
+                'hit_rate': round(hits / lookups, 3) if lookups else None,
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'namespace': self._namespace,
+            }
+
+# -----------------------------------------------------------------------------
+# 프로세스 전역 캐시 (core/inference.py run_inference 에서 사용)
+# -----------------------------------------------------------------------------
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    if not settings.INFERENCE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(
+                settings.INFERENCE_CACHE_DIR,
+                max_bytes=settings.INFERENCE_CACHE_MAX_MB * 1024 * 1024,
+                memory_items=settings.INFERENCE_CACHE_MEMORY_ITEMS,
+                stale_days=settings.INFERENCE_CACHE_STALE_DAYS,
+            )
+        return _cache
+
+def namespace_for(fingerprint):
+    """ 모델 지문 문자열 -> 캐시 폴더 이름 """
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
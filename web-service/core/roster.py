@@ -0,0 +1,159 @@
+# web-service/core/roster.py
+
+import threading
+import numpy as np
+
+from .matching import FeeIndex, group_by_charges, student_charges
+from .name_index import NameAutomaton, NameGramIndex
+
+# -----------------------------------------------------------------
+# 1. 학생 레코드 (모델 인스턴스 대신 쓰는 가벼운 읽기 전용 객체)
+# -----------------------------------------------------------------
+class StudentRecord:
+    """
+    매칭 서비스에서 쓰는 학생 정보만 담은 객체입니다.
+    (views.py 에서 쓰는 name / base_fee / book_fee 는 Student 모델과 동일한 이름)
+    """
+    __slots__ = ('id', 'name', 'base_fee', 'book_fee')
+
+    def __init__(self, id, name, base_fee, book_fee):
+        self.id = id
+        self.name = name
+        self.base_fee = base_fee
+        self.book_fee = book_fee
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<StudentRecord: {self.name}>"
+
+# -----------------------------------------------------------------
+# 2. 학생 명단 스냅샷 (버전 단위로 통째로 교체)
+# -----------------------------------------------------------------
+class RosterSnapshot:
+    """
+    특정 버전의 학생 명단을 메모리에 올려둔 스냅샷입니다.
+
+    - records / by_id : 학생 레코드
+    - ids / base_fees / book_fees : 금액 매칭용 NumPy 배열 (records 와 같은 순서)
+    - fee_index : 금액 -> 학생 id 정렬 인덱스 (core/matching.py)
+    - charge_buckets : 금액(수강료/교재비/합계)별 학생 버킷 (합산 매칭용, core/matching.py)
+    - automaton / gram_index : 이름 매칭용 인덱스 (core/name_index.py)
+    """
+
+    def __init__(self, version, records, automaton, gram_index):
+        self.version = version
+        self.records = records
+        self.by_id = {record.id: record for record in records}
+        self.ids = np.fromiter((r.id for r in records), dtype=np.int64, count=len(records))
+        self.base_fees = np.fromiter((r.base_fee for r in records), dtype=np.int64, count=len(records))
+        self.book_fees = np.fromiter((r.book_fee for r in records), dtype=np.int64, count=len(records))
+        self.fee_index = FeeIndex(self.ids, self.base_fees, self.book_fees)
+        self.charge_buckets = group_by_charges(records, student_charges)
+        self.automaton = automaton
+        self.gram_index = gram_index
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, student_id):
+        return self.by_id.get(student_id)
+
+    def get_many(self, student_ids):
+        """ id 순서를 유지하며 레코드를 돌려줍니다. (없는 id 는 건너뜀) """
+        return [self.by_id[i] for i in student_ids if i in self.by_id]
+
+    def restrict(self, student_ids):
+        """
+        일부 학생(예: 미납 학생)만 담은 스냅샷을 만듭니다.
+        금액 배열/인덱스는 새로 만들고, 이름 인덱스는 공유합니다. (by_id 로 걸러서 사용)
+        """
+        records = [record for record in self.records if record.id in student_ids]
+        return RosterSnapshot(self.version, records, self.automaton, self.gram_index)
+
+# -----------------------------------------------------------------
+# 3. 프로세스 전역 스냅샷 + 버전 (DB 에 저장, core/versions.py)
+# -----------------------------------------------------------------
+VERSION_NAME = 'roster'
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def bump_version():
+    """
+    학생 명단이 바뀌었음을 알립니다. (모든 프로세스가 다음 get_roster() 호출 때 한 번만 다시 읽음)
+    StudentViewSet 저장/삭제는 시그널로, bulk_create 는 직접 호출합니다.
+    명단을 바꾼 트랜잭션 안에서 불러야 커밋 전 데이터로 새 버전 스냅샷을 만드는 일이 없습니다.
+    """
+    from . import versions
+    versions.bump(VERSION_NAME)
+
+def current_version():
+    from . import versions
+    return versions.current(VERSION_NAME)
+
+def get_roster():
+    """
+    현재 버전의 학생 명단 스냅샷을 반환합니다.
+    버전이 바뀌지 않았다면 명단은 다시 읽지 않습니다. (버전 자체도 CACHE_VERSION_TTL 동안 메모리 값, core/versions.py)
+    """
+    global _snapshot
+
+    version = current_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _build_snapshot(version, _snapshot)
+        return _snapshot
+
+_outstanding = {}
+_outstanding_lock = threading.Lock()
+
+def get_outstanding_roster(period=None):
+    """
+    해당 청구 기간에 잔액이 남은 학생만 담은 스냅샷을 반환합니다. (core/ledger.py)
+    월말로 갈수록 납부가 끝난 학생이 빠지므로 매칭 탐색 공간도 함께 줄어듭니다.
+    """
+    from . import ledger
+
+    period = period or ledger.current_period()
+    roster = get_roster()
+    student_ids = ledger.outstanding_student_ids(period, roster.version)
+
+    with _outstanding_lock:
+        cached = _outstanding.get(period)
+        if cached is not None and cached[0] is roster and cached[1] is student_ids:
+            return cached[2]
+        subset = roster.restrict(student_ids)
+        _outstanding[period] = (roster, student_ids, subset)
+        return subset
+
+def _build_snapshot(version, previous):
+    from .models import Student
+
+    rows = Student.objects.order_by('id').values_list('id', 'name', 'base_fee', 'book_fee')
+    records = [StudentRecord(*row) for row in rows]
+
+    # 이름 인덱스는 새로 만들지 않고, 바뀐 학생만 반영 (추가/이름 변경/삭제)
+    if previous is None:
+        automaton, gram_index = NameAutomaton(), NameGramIndex()
+    else:
+        automaton, gram_index = previous.automaton, previous.gram_index
+        current_ids = {record.id for record in records}
+        for student_id in previous.by_id.keys() - current_ids:
+            automaton.remove(student_id)
+            gram_index.remove(student_id)
+
+    for record in records:
+        automaton.update(record.id, record.name)
+        gram_index.update(record.id, record.name)
+
+    return RosterSnapshot(version, records, automaton, gram_index)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Student, Payment # 우리가 만든 모델을 가져옵니다.
+from .models import Student, Payment, OutstandingBalance, InferenceJob # 우리가 만든 모델을 가져옵니다.
 
 class StudentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,4 +9,18 @@ class StudentSerializer(serializers.ModelSerializer):
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        read_only_fields = ['statement_key']  # 입금 내역 정산에서만 채움
+
+class OutstandingBalanceSerializer(serializers.ModelSerializer):
+    student_name = serializers.CharField(source='student.name', read_only=True)
+    balance = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = OutstandingBalance
+        fields = '__all__'  # + 학생 이름, 잔액
+
+class InferenceJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InferenceJob
+        exclude = ['image_path']  # 서버 내부 파일 경로는 노출하지 않음
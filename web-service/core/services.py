@@ -5,43 +5,52 @@ import json
 import uuid
 import time
 import re
-from itertools import combinations
 from django.conf import settings
 from fuzzywuzzy import fuzz, process
 from .models import Student, Payment
+from .matching import match_bucket_combinations, charge_kind
+from .roster import get_roster, get_outstanding_roster
 
 def scan_text_for_students(full_text):
     """
     OCR 전체 텍스트를 스캔하여, DB에 등록된 학생 이름이 
     포함되어 있는지 전수 조사합니다. (여러 명 발견 가능)
+
+    모든 학생 이름을 미리 묶어둔 Aho-Corasick 오토마톤(core/name_index.py)으로
+    텍스트를 한 번만 훑고, 정확히 일치하는 이름이 없는 줄에 대해서만 fuzzy 보정을 합니다.
     """
     
-    # 1. DB의 모든 학생 이름을 가져옵니다.
-    all_students = list(Student.objects.all())
-    found_students = []
-    
-    # 텍스트 전처리 (공백 줄이기 등)
-    normalized_text = full_text.replace(" ", "") # "박 재" -> "박재" 등 인식을 위해
+    # 1. 학생 명단 스냅샷의 이름 오토마톤 (학생 추가/수정 시 버전이 바뀌면 자동 갱신)
+    roster = get_roster()
+    automaton = roster.automaton
+    found_ids = set()
+    unmatched_lines = []
     
-    for student in all_students:
-        # 2. 학생 이름이 텍스트 안에 있는지 확인 (단순 포함 여부)
-        #    (이름이 '김준'인데 '김준수'를 찾는 오작동 방지를 위해 이름 길이에 따라 로직 조정 가능)
+    for line in full_text.splitlines():
+        # 텍스트 전처리 (공백 줄이기 등)
+        normalized_line = line.replace(" ", "") # "박 재" -> "박재" 등 인식을 위해
         
-        # Case A: 정확히 일치하는 이름이 있는 경우
-        if student.name in full_text or student.name in normalized_text:
-            found_students.append(student)
-            continue
-            
-        # Case B: 이름이 텍스트와 매우 유사한 경우 (Fuzzy - 오타 보정)
-        # 텍스트를 한 줄씩 쪼개서 이름과 비교
-        for line in full_text.splitlines():
-            ratio = fuzz.partial_ratio(student.name, line)
-            if ratio >= 90: # 90점 이상이면 발견으로 간주
-                found_students.append(student)
-                break # 이 학생은 찾았으니 다음 학생으로
-    
-    # 중복 제거 후 반환
-    return list(set(found_students))
+        # Case A: 정확히 일치하는 이름이 있는 경우 (원문 + 공백 제거본 모두 검사)
+        line_ids = automaton.find_ids(line) | automaton.find_ids(normalized_line)
+        if line_ids:
+            found_ids |= line_ids
+        elif line.strip():
+            unmatched_lines.append(line)
+    
+    # Case B: 이름이 텍스트와 매우 유사한 경우 (Fuzzy - 오타 보정)
+    # 정확히 일치하는 이름이 하나도 없던 줄만 대상으로 합니다.
+    if unmatched_lines:
+        for student_id, name in automaton.names.items():
+            if student_id in found_ids:
+                continue
+            for line in unmatched_lines:
+                ratio = fuzz.partial_ratio(name, line)
+                if ratio >= 90: # 90점 이상이면 발견으로 간주
+                    found_ids.add(student_id)
+                    break # 이 학생은 찾았으니 다음 학생으로
+    
+    # 2. 발견된 학생 레코드 반환 (메모리 스냅샷에서, 중복 없음)
+    return roster.get_many(sorted(found_ids))
 # -----------------------------------------------------------------
 # 1. Naver CLOVA OCR API Service
 # -----------------------------------------------------------------
@@ -98,99 +107,135 @@ def call_clova_ocr_api(image_file):
 # -----------------------------------------------------------------
 # 2. AI Matching Service (Name-based)
 # -----------------------------------------------------------------
-def find_student_by_name(ocr_name):
+def find_student_by_name(ocr_name, period=None):
     """
     OCR로 인식된 이름(예: '박*재', '노*연(중등수학)')을 받아서,
     DB의 학생 이름과 비교해 가장 일치하는 학생을 찾습니다.
+
+    전체 학생을 비교하지 않고, 자모/n-gram 역색인(core/name_index.py)으로
+    후보 몇십 명만 뽑은 뒤 그 안에서만 fuzzy 점수를 계산합니다.
     """
-    # 이름에서 "(중등수학)" 같은 괄호 안 메모를 제거
-    cleaned_name = re.sub(r'\(.*\)', '', ocr_name).strip()
-    
-    students = Student.objects.all() # (향후 '미납' 학생만 필터링)
-    best_score = 0
-    best_match = None
-    
-    for student in students:
-        # '노*연(중등수학)'과 '노*연'을 비교하기 위해 partial_ratio 사용
-        score = fuzz.partial_ratio(cleaned_name.lower(), student.name.lower())
-        
-        if score > best_score:
-            best_score = score
-            best_match = student
+    ranked = rank_students_by_name(ocr_name, limit=1, period=period)
             
     # 85점 이상일 때만 동일인으로 간주 (오인식 방지)
-    if best_score >= 85:
-        return best_match
+    if ranked and ranked[0][1] >= 85:
+        return ranked[0][0]
     else:
         return None
 
+def rank_students_by_name(ocr_name, limit=5, period=None):
+    """
+    find_student_by_name 의 후보 점수표 버전입니다. (해당 기간 미납 학생만 대상)
+    반환: [(학생 레코드, 점수), ...]  점수 내림차순, 최대 limit 명
+    (일괄 정산처럼 '1등만'이 아니라 여러 후보가 필요한 곳에서 사용)
+    """
+    # 이름에서 "(중등수학)" 같은 괄호 안 메모를 제거
+    cleaned_name = re.sub(r'\(.*\)', '', ocr_name).strip()
+    if not cleaned_name:
+        return []
+    
+    roster = get_outstanding_roster(period) # '미납' 학생만
+    candidate_ids = roster.gram_index.candidates(cleaned_name, allowed=roster.by_id)
+    
+    # '*'로 가려진 글자는 아무 글자 1개와 일치하는 것으로 봅니다. ('박*재' -> '박.재')
+    masked_pattern = None
+    if '*' in cleaned_name:
+        masked_pattern = re.compile(
+            ".".join(re.escape(part) for part in cleaned_name.lower().replace(" ", "").split('*'))
+        )
+    
+    scored = []
+    for student_id in candidate_ids:
+        record = roster.get(student_id)
+        if record is None:
+            continue
+        
+        if masked_pattern is not None and masked_pattern.fullmatch(record.name.lower().replace(" ", "")):
+            score = 100
+        else:
+            # '노*연(중등수학)'과 '노*연'을 비교하기 위해 partial_ratio 사용
+            score = fuzz.partial_ratio(cleaned_name.lower(), record.name.lower())
+        scored.append((record, score))
+    
+    # 점수가 같으면 색인 후보 순서를 유지 (stable sort)
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:limit]
+
 # -----------------------------------------------------------------
 # 3. AI Matching Service (Amount-based, 1:1)
 # -----------------------------------------------------------------
-def find_student_by_amount(paid_amount, tolerance=1000):
+def find_student_by_amount(paid_amount, tolerance=1000, period=None):
     """
-    (1:1 매칭) 입금액을 '수강료' 또는 '교재비'와 비교하여
+    (1:1 매칭) 입금액을 '수강료', '교재비' 또는 '수강료+교재비'와 비교하여
     일치하는 '미납' 학생 1명을 찾습니다.
     """
-    
-    min_fee = paid_amount - tolerance
-    max_fee = paid_amount + tolerance
-    
-    from django.db.models import Q # 👈 Q 객체 임포트 (OR 조건용)
+    return find_students_by_amounts([paid_amount], tolerance, period)[0]
 
-    # 👇 [수정] DB 조회 로직
-    # "base_fee가 범위 내에 '또는(OR)' book_fee가 범위 내에 있는 학생"
-    possible_matches = Student.objects.filter(
-        Q(base_fee__range=(min_fee, max_fee)) |
-        Q(book_fee__range=(min_fee, max_fee))
-        # (향후: Q(base_fee + book_fee ... ) 합산 로직도 추가 가능)
-    )
-    
-    if possible_matches.count() == 1:
-        return possible_matches.first()
-    else:
-        # (만약 32,000원이 교재비인 학생이 여러 명이라 헷갈리면 실패 처리)
-        return None
+def find_students_by_amounts(paid_amounts, tolerance=1000, period=None):
+    """
+    (1:1 매칭, 일괄) 영수증 한 장에서 나온 여러 금액을 한 번에 매칭합니다.
+    반환: 입력 순서대로 학생 레코드 또는 None 목록
+    """
+    if not paid_amounts:
+        return []
+    
+    # 미납 학생 스냅샷의 정렬된 금액 인덱스를 이분 탐색 (DB 조회 없음)
+    roster = get_outstanding_roster(period)
+    results = []
+    for student_ids in roster.fee_index.lookup_many(paid_amounts, tolerance):
+        if len(student_ids) == 1:
+            results.append(roster.get(int(student_ids[0])))
+        else:
+            # (만약 32,000원이 교재비인 학생이 여러 명이라 헷갈리면 실패 처리)
+            results.append(None)
+    return results
 
 # -----------------------------------------------------------------
 # 4. AI Matching Service (Amount-based, N:1 - Killer Feature)
 # -----------------------------------------------------------------
-def find_payment_matches(paid_amount, tolerance=1000, max_batch_size=3):
+def find_payment_matches(paid_amount, tolerance=1000, max_batch_size=3, period=None):
     """
     (N:1 매칭) 입금액을 받아, 1:1 매칭 실패 시 
-    '미납' 학생들의 수강료 '조합'으로 합산 매칭을 시도합니다.
+    '미납' 학생들의 청구 금액 '조합'으로 합산 매칭을 시도합니다.
+
+    학생마다 수강료 / 교재비 / 수강료+교재비 세 가지 금액을 후보로 두고,
+    금액별 버킷 위에서 NumPy 로 부분합을 한꺼번에 계산합니다(core/matching.py).
+    max_batch_size를 4~5(형제/자매 합산)로 늘려도 수십 ms 안에 끝납니다.
+    반환값의 'candidates'에는 허용 오차 안의 모든 후보 조합이 순위대로 담기고,
+    'kinds'에는 대표 조합의 학생별 항목('base', 'book', 'base+book')이 담깁니다.
     """
     
-    # (향후: .filter(status='UNPAID') 등을 추가)
-    unpaid_students = list(Student.objects.all())
+    # 해당 기간 잔액이 남은 '미납' 학생만 (core/ledger.py)
+    # 금액별 버킷은 스냅샷에 캐시되어 있어 호출마다 다시 묶지 않습니다.
+    fee_buckets = get_outstanding_roster(period).charge_buckets
     
     # --- 1. (1:1 매칭) 단일 학생 매칭 시도 ---
     # (find_student_by_amount 함수 로직을 여기서 먼저 수행)
     
-    possible_matches_1_to_1 = []
-    for student in unpaid_students:
-        if abs(student.base_fee - paid_amount) <= tolerance:
-            possible_matches_1_to_1.append(student)
+    possible_matches_1_to_1 = {}
+    for fee, members in fee_buckets:
+        if abs(fee - paid_amount) <= tolerance:
+            for student in members:
+                possible_matches_1_to_1[student.id] = student
+    possible_matches_1_to_1 = list(possible_matches_1_to_1.values())
 
     if len(possible_matches_1_to_1) == 1:
-        return {'type': '1:1', 'students': possible_matches_1_to_1}
+        return {'type': '1:1', 'students': possible_matches_1_to_1, 'candidates': []}
 
     # --- 2. (N:1 매칭) 합산 결제 매칭 시도 ---
     
-    # (성능을 위해 최대 3명까지의 조합만 확인)
-    for batch_size in range(2, max_batch_size + 1):
-        for student_batch in combinations(unpaid_students, batch_size):
-            
-            # (예: (박*재, 이*준) 학생 조합)
-            total_fee = sum(student.base_fee for student in student_batch)
-            
-            # (예: 80,000 + 140,000 = 220,000)
-            if abs(total_fee - paid_amount) <= tolerance:
-                # 합산 매칭 성공!
-                return {
-                    'type': 'N:1',
-                    'students': list(student_batch)
-                }
+    # (예: (박*재, 이*준) 학생 조합 → 80,000 + (140,000 + 교재비 20,000) = 240,000)
+    candidates = match_bucket_combinations(
+        fee_buckets, paid_amount,
+        tolerance=tolerance, max_batch_size=max_batch_size, kind_of=charge_kind
+    )
+    if candidates:
+        # 합산 매칭 성공! (가장 유력한 후보를 대표로 반환)
+        return {
+            'type': 'N:1',
+            'students': candidates[0]['students'],
+            'candidates': candidates
+        }
 
     # 1:1, N:1 매칭 모두 실패
-    return {'type': 'FAIL', 'students': []}
\ No newline at end of file
+    return {'type': 'FAIL', 'students': [], 'candidates': []}
\ No newline at end of file
@@ -0,0 +1,43 @@
+# web-service/core/signals.py
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Student, Payment
+from . import ledger, roster
+
+# -----------------------------------------------------------------
+# 1. 학생 추가/수정/삭제 시 메모리 명단 스냅샷 버전 올리기
+# -----------------------------------------------------------------
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def on_student_changed(sender, instance, **kwargs):
+    # 같은 트랜잭션 안에서 올려야 커밋되는 순간 데이터와 버전이 함께 보입니다.
+    roster.bump_version()
+
+@receiver(post_save, sender=Student)
+def on_student_saved(sender, instance, **kwargs):
+    # 수강료/교재비가 바뀌었을 수 있으므로 이번 달 청구액 맞추기
+    ledger.sync_student(instance)
+
+# -----------------------------------------------------------------
+# 2. Payment 생성/상태 변경/삭제 시 미납 장부 갱신
+# -----------------------------------------------------------------
+@receiver(pre_save, sender=Payment)
+def remember_previous_payment(sender, instance, **kwargs):
+    # 학생이나 결제일(=청구 기간)이 바뀌면 이전 행도 다시 계산해야 하므로 기억해 둠
+    instance._ledger_previous = None
+    if instance.pk:
+        previous = Payment.objects.filter(pk=instance.pk).values('student_id', 'payment_date').first()
+        if previous:
+            instance._ledger_previous = (previous['student_id'], ledger.period_of(previous['payment_date']))
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def on_payment_changed(sender, instance, **kwargs):
+    current = (instance.student_id, ledger.period_of(instance.payment_date))
+    ledger.refresh_balance(*current)
+
+    previous = getattr(instance, '_ledger_previous', None)
+    if previous and previous != current:
+        ledger.refresh_balance(*previous)
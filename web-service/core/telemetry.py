@@ -0,0 +1,165 @@
+# web-service/core/telemetry.py
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# -----------------------------------------------------------------------------
+# 이미지 요청 단계별 시간 측정 (span) + 히스토그램 (GET /api/metrics/, Prometheus 텍스트 형식)
+#
+# 단계: upload(업로드 저장) -> decode(PIL 축소 디코딩) -> split(영수증 분리)
+#       -> cache_lookup -> preprocess(processor) -> queue_wait(마이크로 배치 대기)
+#       -> encoder -> decoder(토큰 생성) -> parse(token2json) -> matching(DB 매칭)
+# - 모든 단계 시간은 프로세스 전역 히스토그램에 쌓입니다. (gunicorn 워커마다 따로 집계)
+# - 요청 안에서 trace() 를 열어두면 그 요청의 단계 목록도 모아서 응답 debug 항목에 넣을 수 있습니다.
+# 모델 단계(preprocess ~ parse)는 배치 스레드 / 모델 서버에서 돌기 때문에 백엔드가 결과 dict 의
+# 'timing' 에 담아 돌려주고, 요청 스레드의 run_inference_batch 가 record_model_timing() 으로 기록합니다.
+# -----------------------------------------------------------------------------
+
+# 단계 시간 (초) / 생성 토큰 수 / 디코더 초당 토큰 수 히스토그램 구간
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 768)
+TOKENS_PER_SEC_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# 이름 -> (Prometheus 지표 이름, 설명, 구간)
+METRICS = {
+    'stage': ('myacademy_inference_stage_seconds', "이미지 요청 단계별 처리 시간", STAGE_BUCKETS),
+    'tokens': ('myacademy_inference_decoder_tokens', "영수증 한 장의 생성 토큰 수 (시퀀스 길이)", TOKEN_BUCKETS),
+    'tokens_per_sec': (
+        'myacademy_inference_decoder_tokens_per_second', "디코더 초당 생성 토큰 수", TOKENS_PER_SEC_BUCKETS
+    ),
+}
+
+# 백엔드 결과 'timing' 의 키 -> 단계 이름 (ms 단위)
+MODEL_STAGES = (
+    ('preprocess_ms', 'preprocess'),
+    ('queue_wait_ms', 'queue_wait'),
+    ('encoder_ms', 'encoder'),
+    ('decoder_ms', 'decoder'),
+    ('parse_ms', 'parse'),
+)
+
+class Histogram:
+    """ 누적 구간 히스토그램 (Prometheus histogram 과 같은 의미: le 이하 개수) """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 마지막 칸은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+_lock = threading.Lock()
+_histograms = {}   # (지표 이름, 라벨 (키, 값) 튜플) -> Histogram
+
+_trace = contextvars.ContextVar('inference_trace', default=None)
+
+def observe(metric, value, **labels):
+    """ METRICS 의 히스토그램에 값 하나를 기록합니다. """
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(METRICS[metric][2])
+        histogram.observe(value)
+
+# -----------------------------------------------------------------------------
+# 1. 단계 기록
+# -----------------------------------------------------------------------------
+def record(stage, elapsed_ms, **extra):
+    """ 이미 잰 단계 시간(ms)을 히스토그램과 (열려 있으면) 요청 trace 에 기록합니다. """
+    observe('stage', elapsed_ms / 1000, stage=stage)
+    spans = _trace.get()
+    if spans is not None:
+        spans.append({'stage': stage, 'ms': round(elapsed_ms, 1), **extra})
+
+@contextmanager
+def span(stage):
+    """ with span('decode'): ... 블록 실행 시간을 stage 단계로 기록 (예외가 나도 기록) """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, (time.perf_counter() - started) * 1000)
+
+def record_model_timing(timing):
+    """
+    백엔드가 결과에 담아 준 'timing' (영수증 한 장) 을 기록합니다.
+    encoder / decoder 시간은 배치 전체 시간이라 같은 배치의 영수증은 같은 값을 가집니다.
+    """
+    for key, stage in MODEL_STAGES:
+        if timing.get(key) is None:
+            continue
+        extra = {}
+        if stage == 'decoder' and timing.get('tokens'):
+            extra = {'tokens': timing['tokens'], 'batch_size': timing.get('batch_size')}
+            if timing[key] > 0:
+                extra['tokens_per_sec'] = round(timing['tokens'] / (timing[key] / 1000), 1)
+                observe('tokens_per_sec', extra['tokens_per_sec'])
+            observe('tokens', timing['tokens'])
+        record(stage, timing[key], **extra)
+
+@contextmanager
+def trace():
+    """
+    with trace() as spans: 블록 안에서 기록된 단계를 spans 목록에 모읍니다. (응답 debug 항목)
+    같은 스레드(요청 스레드) 안의 기록만 모입니다.
+    """
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+# -----------------------------------------------------------------------------
+# 2. Prometheus 텍스트 출력
+# -----------------------------------------------------------------------------
+def _format_labels(labels, **more):
+    items = list(labels) + list(more.items())
+    if not items:
+        return ''
+    escaped = (f'{key}="{_escape(value)}"' for key, value in items)
+    return '{' + ','.join(escaped) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus():
+    """ 지금까지 쌓인 히스토그램 -> Prometheus text exposition format (0.0.4) """
+    with _lock:
+        snapshot = {
+            key: (histogram.cumulative(), histogram.sum, histogram.count)
+            for key, histogram in _histograms.items()
+        }
+
+    lines = []
+    for metric, (name, help_text, _) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (key_metric, labels), (buckets, total, count) in sorted(snapshot.items()):
+            if key_metric != metric:
+                continue
+            for bound, cumulative in buckets:
+                lines.append(f"{name}_bucket{_format_labels(labels, le=_format_value(bound))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
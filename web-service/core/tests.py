@@ -1,3 +1,1015 @@
-from django.test import TestCase
+import datetime
+import io
+import itertools
+import math
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image, ImageDraw
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from transformers import DonutImageProcessor, DonutProcessor
+
+from . import (
+    ingest, inference, jobs, ledger, model_server, onnx_backend, receipt_schema, receipt_split, reconcile, roster,
+    services, telemetry, versions,
+)
+from .matching import (
+    FeeIndex, charge_kind, find_fee_combinations, group_by_charges, iter_student_combinations,
+    match_bucket_combinations, match_fee_combinations, student_charges,
+)
+from .models import DataVersion, InferenceJob, OutstandingBalance, Payment, Student
+from .result_cache import ResultCache, content_hash
+
+
+# -----------------------------------------------------------------------------
+# 추론 결과 캐시 (core/result_cache.py)
+# -----------------------------------------------------------------------------
+def _card_slip(student):
+    """ 같은 양식, 학생 이름만 다른 영수증 """
+    image = Image.new("RGB", (450, 300), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.text((150, 40), "CARD SLIP", fill=0)
+    draw.text((20, 120), "AMOUNT: 250,000", fill=0)
+    draw.text((20, 200), f"STUDENT: {student}", fill=0)
+    return image
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = ResultCache(self.tmp.name, max_bytes=1024 * 1024, memory_items=8)
+
+    def test_same_pixels_hit(self):
+        key = content_hash(_card_slip("KIM"))
+        self.cache.put("ns", key, {"status": "success", "student": "KIM"})
+        self.assertEqual(self.cache.get("ns", content_hash(_card_slip("KIM")))["student"], "KIM")
+
+    def test_same_template_other_student_misses(self):
+        self.cache.put("ns", content_hash(_card_slip("KIM")), {"status": "success", "student": "KIM"})
+        self.assertIsNone(self.cache.get("ns", content_hash(_card_slip("LEE"))))
+
+    def test_disk_hit_after_restart(self):
+        key = content_hash(_card_slip("KIM"))
+        self.cache.put("ns", key, {"student": "KIM"})
+        fresh = ResultCache(self.tmp.name, max_bytes=1024 * 1024, memory_items=8)
+        self.assertEqual(fresh.get("ns", key), {"student": "KIM"})
+        self.assertEqual(fresh.counters["disk_hits"], 1)
+
+    def test_namespaces_do_not_delete_each_other(self):
+        other = ResultCache(self.tmp.name, max_bytes=1024 * 1024, memory_items=8)
+        self.cache.put("torch", "a" * 64, {"backend": "torch"})
+        other.put("onnx", "b" * 64, {"backend": "onnx"})
+        self.assertIsNone(self.cache.get("torch", "b" * 64))
+        fresh = ResultCache(self.tmp.name, max_bytes=1024 * 1024, memory_items=8)
+        self.assertEqual(fresh.get("torch", "a" * 64), {"backend": "torch"})
+        self.assertEqual(fresh.get("onnx", "b" * 64), {"backend": "onnx"})
+
+    def test_stale_namespace_pruned(self):
+        self.cache.put("old", "a" * 64, {"x": 1})
+        old_dir = Path(self.tmp.name) / "old"
+        past = time.time() - 40 * 86400
+        for path in [old_dir, *old_dir.rglob("*")]:
+            os.utime(path, (past, past))
+        ResultCache(self.tmp.name, max_bytes=1024 * 1024, memory_items=8).get("new", "b" * 64)
+        self.assertFalse(old_dir.exists())
+
+    def test_evicts_oldest_over_budget(self):
+        cache = ResultCache(self.tmp.name, max_bytes=300, memory_items=1)
+        for i in range(5):
+            cache.put("ns", f"{i:064d}", {"value": "x" * 50})
+        self.assertGreater(cache.counters["evictions"], 0)
+        self.assertIsNone(cache.get("ns", f"{0:064d}"))
+        self.assertIsNotNone(cache.get("ns", f"{4:064d}"))
+
+
+# -----------------------------------------------------------------------------
+# 합산 매칭 순위 (core/matching.py)
+# -----------------------------------------------------------------------------
+def _student(student_id, base_fee, book_fee=0):
+    return SimpleNamespace(id=student_id, base_fee=base_fee, book_fee=book_fee)
+
+class MatchingRankTests(SimpleTestCase):
+    def test_base_only_pair_ranks_first(self):
+        # 430,000 = 180,000 + 250,000 (수강료끼리)
+        #         = 210,000 + (200,000 + 교재비 20,000)
+        #         = 교재비 50,000 + 380,000
+        students = [
+            _student(1, 180000), _student(2, 250000), _student(3, 210000),
+            _student(4, 200000, 20000), _student(5, 380000), _student(6, 300000, 50000),
+        ]
+        buckets = group_by_charges(students, student_charges)
+        candidates = match_bucket_combinations(buckets, 430000, tolerance=0, kind_of=charge_kind)
+
+        self.assertEqual([s.id for s in candidates[0]['students']], [1, 2])
+        self.assertEqual(candidates[0]['kinds'], ['base', 'base'])
+
+    def test_fewer_students_before_fewer_extras(self):
+        students = [_student(1, 100000, 30000), _student(2, 60000), _student(3, 70000)]
+        buckets = group_by_charges(students, student_charges)
+        candidates = match_bucket_combinations(buckets, 130000, tolerance=0, max_batch_size=3, kind_of=charge_kind)
+        self.assertEqual({s.id for s in candidates[0]['students']}, {2, 3})
+
+    def test_shared_bucket_prefers_base_student(self):
+        # 150,000 은 1번의 수강료이자 2번의 수강료+교재비 -> 대표는 1번
+        students = [_student(2, 100000, 50000), _student(1, 150000), _student(3, 50000)]
+        buckets = group_by_charges(students, student_charges)
+        top = match_bucket_combinations(buckets, 200000, tolerance=0, kind_of=charge_kind)[0]
+        self.assertEqual(top['kinds'], ['base', 'base'])
+
+class FeeCombinationTests(SimpleTestCase):
+    @staticmethod
+    def _brute_force(fees, counts, target, tolerance, size):
+        """ 버킷 인원수 이내의 중복 조합을 모두 만들어 보는 기준 구현 """
+        found = set()
+        for picked in itertools.combinations_with_replacement(range(len(fees)), size):
+            if any(picked.count(i) > counts[i] for i in set(picked)):
+                continue
+            if abs(sum(fees[i] for i in picked) - target) <= tolerance:
+                found.add(picked)
+        return found
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        for _ in range(30):
+            fees = sorted({int(v) * 10000 for v in rng.integers(5, 40, size=rng.integers(1, 9))})
+            counts = [int(c) for c in rng.integers(1, 4, size=len(fees))]
+            target = int(rng.integers(10, 100)) * 10000
+            tolerance = int(rng.choice([0, 1000, 10000]))
+            for size in (1, 2, 3, 4):
+                found = find_fee_combinations(fees, counts, target, tolerance, size)
+                self.assertEqual(
+                    {tuple(int(i) for i in row) for row in found},
+                    self._brute_force(fees, counts, target, tolerance, size),
+                    (fees, counts, target, tolerance, size),
+                )
+
+    def test_bucket_count_limits_repeats(self):
+        # 250,000 학생이 한 명뿐이면 250,000 x 2 는 후보가 아님
+        self.assertEqual(len(find_fee_combinations([250000], [1], 500000, 0, 2)), 0)
+        self.assertEqual(find_fee_combinations([250000], [2], 500000, 0, 2).tolist(), [[0, 0]])
+
+    def test_candidate_expands_to_student_combinations(self):
+        students = [_student(i, 250000) for i in range(1, 5)] + [_student(9, 180000)]
+        candidates = match_fee_combinations(students, lambda s: s.base_fee, 680000, tolerance=0)
+        self.assertEqual(candidates[0]['fees'], [180000, 250000, 250000])
+        self.assertEqual(candidates[0]['combinations'], 6)   # 4C2
+        combos = list(iter_student_combinations(candidates[0]))
+        self.assertEqual(len(combos), 6)
+        self.assertTrue(all(len({s.id for s in combo}) == 3 for combo in combos))
+
+
+
+# -----------------------------------------------------------------------------
+# 금액 인덱스 (core/matching.py FeeIndex)
+# -----------------------------------------------------------------------------
+class FeeIndexTests(SimpleTestCase):
+    def setUp(self):
+        # id:  1 = 수강료만, 2 = 수강료 + 교재비, 3 = 교재비가 0 인 학생 (수강료+교재비 항목 없음)
+        self.index = FeeIndex([1, 2, 3], [250000, 200000, 180000], [0, 50000, 0])
+
+    def test_registers_each_charge_once(self):
+        # 1: base / 2: base, book, base+book / 3: base
+        self.assertEqual(len(self.index), 5)
+
+    def test_lookup_many_matches_lookup(self):
+        amounts = [250000, 250500, 50000, 180000, 999000, 230000]
+        results = self.index.lookup_many(amounts, tolerance=1000)
+        self.assertEqual([r.tolist() for r in results], [self.index.lookup(a, 1000).tolist() for a in amounts])
+        # 250,000 = 1번 수강료 + 2번 수강료+교재비 -> 두 학생 모두
+        self.assertEqual(results[0].tolist(), [1, 2])
+        self.assertEqual(results[2].tolist(), [2])
+        self.assertEqual(results[4].tolist(), [])
+
+    def test_tolerance_bounds_inclusive(self):
+        self.assertEqual(self.index.lookup(181000, tolerance=1000).tolist(), [3])
+        self.assertEqual(self.index.lookup(181001, tolerance=1000).tolist(), [])
+
+    def test_random_against_linear_scan(self):
+        rng = np.random.default_rng(3)
+        ids = np.arange(1, 201)
+        base = rng.integers(10, 40, size=200) * 10000
+        book = rng.choice([0, 20000, 50000], size=200)
+        index = FeeIndex(ids, base, book)
+        amounts = rng.integers(10, 50, size=50) * 10000 + rng.choice([0, 500, 2000], size=50)
+        for amount, found in zip(amounts, index.lookup_many(amounts, tolerance=1000)):
+            expected = sorted({
+                int(i) for i, b, k in zip(ids, base, book)
+                if any(fee > 0 and abs(fee - amount) <= 1000 for fee in (b, k, b + k if k else 0))
+            })
+            self.assertEqual(found.tolist(), expected)
+
+# -----------------------------------------------------------------------------
+# 학생 명단 스냅샷 버전 (core/roster.py, core/versions.py)
+# -----------------------------------------------------------------------------
+class RosterVersionTests(TestCase):
+    def setUp(self):
+        roster._snapshot = None
+        versions.invalidate()
+
+    def test_student_save_bumps_db_version(self):
+        before = versions.current(roster.VERSION_NAME)
+        Student.objects.create(name="김철수", base_fee=250000)
+        self.assertEqual(versions.current(roster.VERSION_NAME), before + 1)
+
+    def test_change_from_other_process_is_seen(self):
+        Student.objects.create(name="김철수", base_fee=250000)
+        self.assertEqual(len(roster.get_roster()), 1)
+
+        # 다른 프로세스: 시그널 없이 저장하고 DB 버전만 올림 (이 프로세스의 메모리는 그대로)
+        Student.objects.bulk_create([Student(name="이영희", base_fee=180000)])
+        self.assertEqual(len(roster.get_roster()), 1)
+        DataVersion.objects.filter(name=roster.VERSION_NAME).update(version=F('version') + 1)
+        versions.invalidate()  # CACHE_VERSION_TTL 경과
+        self.assertEqual(len(roster.get_roster()), 2)
+
+    def test_version_read_once_per_ttl(self):
+        Student.objects.create(name="김철수", base_fee=250000)
+        roster.get_roster()
+        with self.settings(CACHE_VERSION_TTL=60), self.assertNumQueries(0):
+            for _ in range(5):
+                roster.get_roster()
+                ledger.current_version()
+
+    def test_bulk_payments_bump_ledger_once(self):
+        student = Student.objects.create(name="김철수", base_fee=250000)
+        payments = Payment.objects.bulk_create([
+            Payment(student=student, amount_paid=100000, payment_date=datetime.date(2025, month, 5), status='PAID')
+            for month in (1, 2, 3)
+        ])
+        before = versions.current(ledger.VERSION_NAME)
+        ledger.apply_payments(payments)
+        self.assertEqual(versions.current(ledger.VERSION_NAME), before + 1)
+
+    def test_unchanged_version_reuses_snapshot(self):
+        Student.objects.create(name="김철수", base_fee=250000)
+        self.assertIs(roster.get_roster(), roster.get_roster())
+
+
+# -----------------------------------------------------------------------------
+# 이름 역색인 / 가려진 이름 점수 (core/name_index.py NameGramIndex, core/services.py)
+# -----------------------------------------------------------------------------
+class NameGramIndexTests(SimpleTestCase):
+    def setUp(self):
+        from .name_index import NameGramIndex
+        self.index = NameGramIndex()
+        for student_id, name in enumerate(["박민재", "박민제", "노서연", "김철수", "박지성"], start=1):
+            self.index.add(student_id, name)
+
+    def test_ocr_typo_ranks_closest_first(self):
+        self.assertEqual(self.index.candidates("박민재")[0], 1)
+        self.assertIn(2, self.index.candidates("박민재"))
+
+    def test_masked_name_uses_positions(self):
+        # '박*재' : 가려진 글자는 건너뛰고 첫/끝 글자 위치로 맞춤
+        self.assertEqual(self.index.candidates("박*재")[0], 1)
+        self.assertEqual(self.index.candidates("노*연(중등수학)")[0], 3)
+
+    def test_allowed_and_rename(self):
+        self.assertNotIn(1, self.index.candidates("박민재", allowed={2, 3}))
+        self.index.update(1, "최민재")
+        self.assertEqual(self.index.candidates("최민재")[0], 1)
+        self.assertNotEqual(self.index.candidates("박*재")[0], 1)
+        self.index.remove(2)
+        self.assertNotIn(2, self.index.candidates("박민제"))
+
+class RankStudentsByNameTests(TestCase):
+    def setUp(self):
+        roster._snapshot = None
+        versions.invalidate()
+        ledger._cache.clear()
+        for name in ("박민재", "박민제", "노서연", "김철수"):
+            Student.objects.create(name=name, base_fee=250000)
+
+    def test_masked_name_scores_full_match(self):
+        ranked = services.rank_students_by_name("박*재")
+        self.assertEqual((ranked[0][0].name, ranked[0][1]), ("박민재", 100))
+        self.assertLess(ranked[1][1], 100)
+
+    def test_memo_in_parentheses_ignored(self):
+        self.assertEqual(services.find_student_by_name("노*연(중등수학)").name, "노서연")
+
+    def test_unrelated_name_not_matched(self):
+        self.assertIsNone(services.find_student_by_name("홍길동"))
+
+# -----------------------------------------------------------------------------
+# 미납 장부 (core/ledger.py, /api/balances/)
+# -----------------------------------------------------------------------------
+class LedgerTests(TestCase):
+    def setUp(self):
+        ledger._cache.clear()
+        versions.invalidate()
+        self.student = Student.objects.create(name="김철수", base_fee=250000)
+        self.period = ledger.current_period()
+
+    def test_payment_from_other_process_is_seen(self):
+        self.assertIn(self.student.id, ledger.outstanding_student_ids(self.period))
+
+        # 다른 프로세스가 입금을 기록: 장부와 DB 버전만 바뀌고 이 프로세스 캐시는 그대로
+        OutstandingBalance.objects.filter(student=self.student).update(amount_paid=250000)
+        versions.bump(ledger.VERSION_NAME)
+        self.assertNotIn(self.student.id, ledger.outstanding_student_ids(self.period))
+
+    def test_payment_signal_updates_outstanding(self):
+        ledger.outstanding_student_ids(self.period)
+        Payment.objects.create(
+            student=self.student, amount_paid=250000, payment_date=datetime.date.today(), status='PAID'
+        )
+        self.assertNotIn(self.student.id, ledger.outstanding_student_ids(self.period))
+
+    def test_lookup_does_not_open_period(self):
+        ledger.outstanding_student_ids('2025-01')
+        self.assertFalse(OutstandingBalance.objects.filter(billing_period='2025-01').exists())
+
+    def test_open_period_command(self):
+        call_command('open_period', '--period', '2025-01', stdout=io.StringIO())
+        self.assertIn(self.student.id, ledger.outstanding_student_ids('2025-01'))
+
+class BalanceViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.student = Student.objects.create(name="김철수", base_fee=250000)
+
+    def test_invalid_period_rejected(self):
+        response = self.client.get('/api/balances/', {'period': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/balances/open/', {'period': '2025-13'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OutstandingBalance.objects.exclude(billing_period=ledger.current_period()).exists())
+
+    def test_get_does_not_write(self):
+        response = self.client.get('/api/balances/', {'period': '2025-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(OutstandingBalance.objects.filter(billing_period='2025-01').exists())
+
+    def test_text_batch_opens_current_period(self):
+        self.client.post('/api/students/upload_text_batch/', {'student_data': "이영희 180,000"})
+        student = Student.objects.get(name="이영희")
+        self.assertTrue(OutstandingBalance.objects.filter(student=student, billing_period=ledger.current_period()).exists())
+
+    def test_post_opens_period(self):
+        response = self.client.post('/api/balances/open/', {'period': '2025-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(len(self.client.get('/api/balances/', {'period': '2025-01'}).data), 1)
+
+
+# -----------------------------------------------------------------------------
+# 이미지 분석 작업 큐 (core/jobs.py)
+# -----------------------------------------------------------------------------
+class JobQueueTests(TestCase):
+    def test_requeue_only_stale_running_jobs(self):
+        now = timezone.now()
+        live = InferenceJob.objects.create(status='RUNNING', started_at=now - datetime.timedelta(seconds=30))
+        stale = InferenceJob.objects.create(status='RUNNING', started_at=now - datetime.timedelta(hours=2))
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        live.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual(live.status, 'RUNNING')
+        self.assertEqual(stale.status, 'PENDING')
+
+    def test_prune_only_old_finished_jobs(self):
+        now = timezone.now()
+        old = now - datetime.timedelta(hours=settings.INFERENCE_JOB_RETENTION_HOURS + 1)
+        InferenceJob.objects.create(status='DONE', result=["결과"], finished_at=old)
+        InferenceJob.objects.create(status='FAILED', finished_at=old)
+        recent = InferenceJob.objects.create(status='DONE', finished_at=now)
+        pending = InferenceJob.objects.create(status='PENDING')
+
+        self.assertEqual(jobs.prune_finished_jobs(), 2)
+        self.assertEqual(set(InferenceJob.objects.values_list('id', flat=True)), {recent.id, pending.id})
+
+    def test_no_workers_without_autostart(self):
+        with self.settings(INFERENCE_JOB_WORKERS_AUTOSTART=False), mock.patch.object(jobs, 'start_workers') as start:
+            jobs.start_workers_at_boot()
+        start.assert_not_called()
+
+
+# -----------------------------------------------------------------------------
+# 입금 내역 일괄 정산 (core/reconcile.py)
+# -----------------------------------------------------------------------------
+class AssignmentTests(SimpleTestCase):
+    def test_global_assignment_with_unmatched(self):
+        # 0번이 1번 학생(0.1)을 가져가면 1번 입금이 미매칭 -> 전체 비용이 작은 0->2, 1->1
+        edges = {0: {1: 0.1, 2: 0.5}, 1: {1: 0.2}, 2: {}}
+        self.assertEqual(reconcile.solve_assignment(edges), {0: (2, 0.5), 1: (1, 0.2)})
+
+    def test_expensive_edge_left_unmatched(self):
+        edges = {0: {1: reconcile.UNMATCHED_COST + 0.1}}
+        self.assertEqual(reconcile.solve_assignment(edges), {})
+
+    def test_hungarian_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            n, m = int(rng.integers(1, 5)), int(rng.integers(5, 7))
+            cost = rng.random((n, m))
+            best = min(
+                sum(cost[row, col] for row, col in enumerate(cols))
+                for cols in itertools.permutations(range(m), n)
+            )
+            assignment = reconcile._hungarian(cost)
+            self.assertEqual(len(set(assignment.tolist())), n)
+            self.assertAlmostEqual(cost[np.arange(n), assignment].sum(), best)
+
+class ReconcileStatementTests(TestCase):
+    def setUp(self):
+        roster._snapshot = None
+        versions.invalidate()
+        ledger._cache.clear()
+        self.kim = Student.objects.create(name="김철수", base_fee=250000)
+        self.lee = Student.objects.create(name="이영희", base_fee=180000)
+
+    def _statement(self, *rows):
+        lines = ["거래일자,입금자명,입금액"] + [f"{datetime.date.today():%Y-%m-%d},{name},{amount}" for name, amount in rows]
+        return io.BytesIO("\n".join(lines).encode("utf-8"))
+
+    def test_amount_only_match_goes_to_review(self):
+        report = reconcile.reconcile_statement(self._statement(("박지성", 180000)))
+        self.assertEqual(report['results'][0]['status'], 'review')
+        self.assertEqual(report['summary']['created'], 0)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_name_and_amount_saved(self):
+        report = reconcile.reconcile_statement(self._statement(("김철수", 250000)))
+        self.assertEqual(report['results'][0]['payment_status'], 'PAID')
+        self.assertEqual(Payment.objects.get().student_id, self.kim.id)
+
+    def test_same_statement_twice_not_duplicated(self):
+        rows = (("김철수", 250000), ("이영희", 180000))
+        first = reconcile.reconcile_statement(self._statement(*rows))
+        second = reconcile.reconcile_statement(self._statement(*rows))
+        self.assertEqual(first['summary']['created'], 2)
+        self.assertEqual(second['summary']['created'], 0)
+        self.assertEqual(second['summary']['duplicate'], 2)
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_overlapping_export_not_duplicated(self):
+        # 1~15일 내역을 정산한 뒤 1~31일 내역을 올리면, 같은 입금이 다른 행 번호에 나옴
+        reconcile.reconcile_statement(self._statement(("김철수", 250000)))
+        report = reconcile.reconcile_statement(self._statement(("홍길동", 1000), ("김철수", 250000), ("이영희", 180000)))
+        self.assertEqual(report['summary']['duplicate'], 1)
+        self.assertEqual(report['summary']['created'], 1)
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_repeated_deposit_in_one_file_gets_own_key(self):
+        deposits = [
+            {'row': row, 'date': datetime.date(2025, 11, 3), 'name': "김철수", 'amount': 250000} for row in (2, 5)
+        ]
+        reconcile.assign_deposit_keys(deposits)
+        self.assertNotEqual(deposits[0]['key'], deposits[1]['key'])
+        moved = [{**deposits[0], 'row': 9, 'key': None}]
+        reconcile.assign_deposit_keys(moved)
+        self.assertEqual(moved[0]['key'], deposits[0]['key'])
+
+
+# -----------------------------------------------------------------------------
+# 마이크로 배치 (core/inference.py)
+# -----------------------------------------------------------------------------
+class _FakeBackend:
+    def __init__(self, generate):
+        self.generate = generate
+
+    def stack(self, items):
+        return items
+
+    def generate_batch(self, batch):
+        return self.generate(batch)
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(setattr, inference, '_backend', inference._backend)
+
+    def _run(self, generate, count=3):
+        inference._backend = _FakeBackend(generate)
+        batcher = inference.MicroBatcher(window_ms=50, max_size=count)
+        return batcher, batcher.submit_many(list(range(count)))
+
+    def test_short_output_wakes_every_request(self):
+        batcher, outputs = self._run(lambda batch: [{"status": "success"}])
+        self.assertEqual([o['status'] for o in outputs], ['error'] * 3)
+
+    def test_error_outputs_are_separate_objects(self):
+        def fail(batch):
+            raise RuntimeError("boom")
+        _, outputs = self._run(fail)
+        outputs[0]['message'] = 'changed'
+        self.assertEqual(outputs[1]['message'], 'boom')
+
+    def test_thread_survives_unexpected_error(self):
+        batcher, _ = self._run(lambda batch: [{"status": "success", "timing": None} for _ in batch])
+        self.assertTrue(batcher._thread.is_alive())
+        inference._backend = _FakeBackend(lambda batch: [{"status": "success"} for _ in batch])
+        self.assertEqual(batcher.submit(0)['status'], 'success')
+
+class ReceiptSplitTests(SimpleTestCase):
+    def setUp(self):
+        # 모델을 올리지 않고 기본 입력 크기 사용
+        patcher = mock.patch.object(inference, 'input_size', return_value=ingest.DEFAULT_INPUT_SIZE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reports_receipts_over_limit(self):
+        image = Image.new('RGB', (400, 300))
+        boxes = [(0, 0, 100, 100), (100, 0, 200, 100), (200, 0, 300, 100)]
+        with self.settings(INFERENCE_SPLIT_RECEIPTS=True, INFERENCE_MAX_RECEIPTS=2), \
+                mock.patch.object(receipt_split, 'find_receipt_boxes', return_value=boxes):
+            crops, skipped = receipt_split.split_receipts(image)
+        self.assertEqual(len(crops), 2)
+        self.assertEqual(skipped, 1)
+
+    def test_single_receipt_is_not_split(self):
+        image = Image.new('RGB', (400, 300))
+        with self.settings(INFERENCE_SPLIT_RECEIPTS=True), \
+                mock.patch.object(receipt_split, 'find_receipt_boxes', return_value=[]):
+            crops, skipped = receipt_split.split_receipts(image)
+        self.assertEqual(crops, [image])
+        self.assertEqual(skipped, 0)
+
+    def test_split_crops_keep_model_input_size(self):
+        # 4000x3000 사진에 영수증 두 장: 사진 전체 기준으로 줄여 디코딩하면 영수증마다 입력 크기보다 작아짐
+        photo = Image.new('RGB', (4000, 3000), (30, 30, 30))
+        draw = ImageDraw.Draw(photo)
+        draw.rectangle((100, 200, 1900, 2800), fill=(245, 245, 245))
+        draw.rectangle((2100, 200, 3900, 2800), fill=(245, 245, 245))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'photo.jpg'
+            photo.save(path, quality=90)
+            with self.settings(INFERENCE_SPLIT_RECEIPTS=True, INFERENCE_AUTO_CROP=True):
+                crops, skipped = receipt_split.split_receipts(ingest.open_receipt_image(path))
+                short_side, long_side = sorted(ingest.model_input_size())
+        self.assertEqual((len(crops), skipped), (2, 0))
+        for crop in crops:
+            self.assertGreaterEqual(min(crop.size), short_side)
+            self.assertGreaterEqual(max(crop.size), long_side)
+
+# -----------------------------------------------------------------------------
+# adaptive 디코딩 (core/torch_backend.py)
+# -----------------------------------------------------------------------------
+def _stub_generate(greedy_decodings):
+    """ greedy 는 이미지별로 주어진 (confidence, schema_valid), beam 은 항상 확신하는 가짜 _generate """
+    calls = []
+
+    def generate(use_model, pixel_values, num_beams):
+        rows = pixel_values[:, 0, 0, 0].long().tolist()
+        calls.append((num_beams, rows))
+        outputs = []
+        for row in rows:
+            confidence, valid = greedy_decodings[row] if num_beams == 1 else (0.99, True)
+            outputs.append({
+                'status': 'success',
+                'result': {'student': f'학생{row}'},
+                'decoding': {
+                    'path': 'greedy' if num_beams == 1 else 'beam',
+                    'confidence': confidence, 'fields': {}, 'schema_valid': valid,
+                },
+                'timing': {'batch_size': len(rows), 'encoder_ms': 1.0, 'decoder_ms': 2.0, 'parse_ms': 0.0, 'tokens': 5},
+            })
+        return outputs
+    return generate, calls
+
+class AdaptiveDecodingTests(SimpleTestCase):
+    def setUp(self):
+        import torch
+        from . import torch_backend
+        self.torch, self.backend = torch, torch_backend
+        for name, value in (('DECODING', 'adaptive'), ('CONFIDENCE_THRESHOLD', 0.8), ('NUM_BEAMS', 4)):
+            patcher = mock.patch.object(torch_backend, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _pixels(self, count):
+        # 첫 픽셀 값 = 이미지 번호 (가짜 _generate 가 어떤 이미지를 받았는지 확인용)
+        return self.torch.arange(count, dtype=self.torch.float32).reshape(count, 1, 1, 1).expand(count, 3, 2, 2)
+
+    def _run(self, greedy_decodings):
+        generate, calls = _stub_generate(greedy_decodings)
+        with mock.patch.object(self.backend, '_generate', side_effect=generate):
+            outputs = self.backend.generate_batch(self._pixels(len(greedy_decodings)), use_model=object())
+        return outputs, calls
+
+    def test_low_confidence_and_invalid_schema_escalate(self):
+        outputs, calls = self._run([(0.95, True), (0.5, True), (0.95, False), (None, False)])
+        self.assertEqual(calls, [(1, [0, 1, 2, 3]), (4, [1, 2, 3])])
+        self.assertEqual([o['decoding']['path'] for o in outputs], ['greedy', 'beam', 'beam', 'beam'])
+        self.assertEqual(outputs[2]['decoding']['greedy_confidence'], 0.95)
+        self.assertEqual(outputs[1]['timing']['encoder_ms'], 2.0)
+
+    def test_confident_valid_outputs_stay_greedy(self):
+        outputs, calls = self._run([(0.9, True), (0.81, True)])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([o['decoding']['path'] for o in outputs], ['greedy', 'greedy'])
+
+    def test_decoding_path_in_upload_response(self):
+        generate, _ = _stub_generate([(0.95, True), (0.3, True)])
+
+        def run_inference_batch(images):
+            with mock.patch.object(self.backend, '_generate', side_effect=generate):
+                return self.backend.generate_batch(self._pixels(len(images)), use_model=object())
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 300), 'white').save(buffer, format='PNG')
+        buffer.seek(0)
+        buffer.name = 'receipt.png'
+        crops = [Image.new('RGB', (10, 10)), Image.new('RGB', (10, 10))]
+        with mock.patch('core.pipeline.split_receipts', return_value=(crops, 0)), \
+                mock.patch('core.pipeline.run_inference_batch', side_effect=run_inference_batch), \
+                mock.patch('core.pipeline.process_text_data', return_value=[]), \
+                mock.patch.object(inference, 'input_size', return_value=ingest.DEFAULT_INPUT_SIZE):
+            response = APIClient().post('/api/matching/upload_data/', {'image_file': buffer}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([info['path'] for info in response.data['inference']], ['greedy', 'beam'])
+
+
+# -----------------------------------------------------------------------------
+# 로컬 모델 서버 (core/model_server.py)
+# -----------------------------------------------------------------------------
+class ModelServerTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = Path(tmp.name) / 'model.sock'
+        overrides = self.settings(INFERENCE_SERVER_SOCKET=self.socket_path, INFERENCE_SERVER_TIMEOUT=5)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        model_server._info = None
+        self.addCleanup(setattr, model_server, '_info', None)
+        self.fingerprint = 'model-a'
+        for name, kwargs in (
+            ('input_size', {'return_value': (1280, 960)}),
+            ('model_fingerprint', {'side_effect': lambda: self.fingerprint}),
+            ('run_inference_batch', {'side_effect': lambda images: [{'status': 'success'} for _ in images]}),
+        ):
+            patcher = mock.patch.object(inference, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _serve(self):
+        server = model_server.ModelServer(self.socket_path, max_concurrency=1)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def test_server_down_does_not_raise(self):
+        self.assertIn('error', model_server.remote_info())
+        outputs = model_server.remote_inference_batch([Image.new('RGB', (4, 4))])
+        self.assertEqual(outputs[0]['status'], 'error')
+
+    def test_handler_error_is_returned(self):
+        self._serve()
+        inference.input_size.side_effect = RuntimeError("모델 로딩 실패")
+        self.assertEqual(model_server.remote_info(), {'error': "모델 로딩 실패"})
+
+    def test_info_refetched_when_fingerprint_changes(self):
+        self._serve()
+        self.assertEqual(model_server.remote_info()['fingerprint'], 'model-a')
+
+        # 서버가 새 스냅샷으로 다시 뜸: 다음 infer 응답의 지문이 달라짐
+        self.fingerprint = 'model-b'
+        self.assertEqual(model_server.remote_info()['fingerprint'], 'model-a')  # TTL 안에서는 재사용
+        model_server.remote_inference_batch([Image.new('RGB', (4, 4))])
+        self.assertEqual(model_server.remote_info()['fingerprint'], 'model-b')
+
+
+# -----------------------------------------------------------------------------
+# 이름 오토마톤 (core/name_index.py NameAutomaton)
+# -----------------------------------------------------------------------------
+class NameAutomatonTests(SimpleTestCase):
+    def setUp(self):
+        from .name_index import NameAutomaton
+        self.automaton = NameAutomaton()
+        self.automaton.add(1, "김철수")
+        self.automaton.add(2, "이 영희")
+        self.automaton.add(3, "철수")
+
+    def test_finds_all_names_in_one_pass(self):
+        self.assertEqual(self.automaton.find_ids("입금자 김철수 / 이영희 학부모"), {1, 2, 3})
+        self.assertEqual(self.automaton.find_ids("이 영희"), {2})
+        self.assertEqual(self.automaton.find_ids("박지성"), set())
+
+    def test_rename_and_remove(self):
+        self.automaton.update(1, "김민수")
+        self.assertEqual(self.automaton.find_ids("김철수"), {3})
+        self.assertEqual(self.automaton.find_ids("김민수"), {1})
+        self.automaton.remove(3)
+        self.assertEqual(self.automaton.find_ids("김철수"), set())
+        self.assertEqual(self.automaton.names, {1: "김민수", 2: "이 영희"})
+
+    def test_same_name_shared_by_two_students(self):
+        self.automaton.add(4, "김철수")
+        self.assertEqual(self.automaton.find_ids("김철수"), {1, 3, 4})
+        self.automaton.remove(1)
+        self.assertEqual(self.automaton.find_ids("김철수"), {3, 4})
+
+    def test_names_is_a_copy(self):
+        # 스캔 중에 다른 스레드가 명단을 갱신해도 순회 중인 dict 는 바뀌지 않음
+        names = self.automaton.names
+        for student_id in range(10, 20):
+            self.automaton.add(student_id, f"학생{student_id}")
+        self.assertEqual(len(names), 3)
+
+
+
+# -----------------------------------------------------------------------------
+# 영수증 JSON 스키마 상태 기계 (core/receipt_schema.py)
+# -----------------------------------------------------------------------------
+RECEIPT_JSON = '{"receipts": [{"student": "홍길동", "amount": 250000, "date": "2025-03-05", "type": "memo"}]}'
+
+# 가짜 어휘: 토큰 id -> 문자열 (None = 특수 토큰)
+SCHEMA_PIECES = [
+    '{"receipts": [', '{"student": "', '홍길동', '", "amount": ', '250000', ', "date": "', '2025-03-05',
+    '", "type": "', 'memo', '"}', ']}', 'x', None, '"}, ', 'mem', 'o',
+]
+EOS = len(SCHEMA_PIECES)
+
+class ReceiptSchemaTests(SimpleTestCase):
+    def test_full_receipt_completes(self):
+        state = receipt_schema.feed(receipt_schema.START_STATE, RECEIPT_JSON)
+        self.assertTrue(receipt_schema.is_complete(state))
+
+    def test_schema_violations_rejected(self):
+        start = receipt_schema.START_STATE
+        self.assertIsNone(receipt_schema.feed(start, '{"items"'))
+        self.assertIsNone(receipt_schema.feed(start, RECEIPT_JSON.replace('"memo"', '"cash"')))
+        self.assertIsNone(receipt_schema.feed(start, RECEIPT_JSON.replace('250000', '0250000')))
+        self.assertIsNone(receipt_schema.feed(start, RECEIPT_JSON.replace('홍길동', '홍' * 21)))
+        self.assertIsNone(receipt_schema.feed(start, RECEIPT_JSON + 'x'))
+
+    def test_receipt_count_limit(self):
+        receipt = RECEIPT_JSON[len('{"receipts": ['):-2]
+        many = '{"receipts": [' + ", ".join([receipt] * receipt_schema.MAX_RECEIPTS) + ']}'
+        self.assertTrue(receipt_schema.is_complete(receipt_schema.feed(receipt_schema.START_STATE, many)))
+        too_many = many[:-2] + ", " + receipt + ']}'
+        self.assertIsNone(receipt_schema.feed(receipt_schema.START_STATE, too_many))
+
+    def test_salvage_keeps_closed_receipts(self):
+        receipt = RECEIPT_JSON[len('{"receipts": ['):-2]
+        truncated = '{"receipts": [' + receipt + ', {"student": "김철'
+        self.assertEqual(receipt_schema.salvage(truncated), '{"receipts": [' + receipt + ']}')
+        self.assertEqual(receipt_schema.salvage('{"receipts": [{"stu'), '{"receipts": []}')
+        self.assertEqual(receipt_schema.salvage(RECEIPT_JSON + ' 쓰레기'), RECEIPT_JSON)
+
+    def test_parse_always_returns_json(self):
+        parsed = receipt_schema.parse('  ' + RECEIPT_JSON[:40])
+        self.assertEqual(parsed, {"status": "success", "result": {"receipts": []}})
+        self.assertEqual(receipt_schema.parse(RECEIPT_JSON)['result']['receipts'][0]['amount'], 250000)
+
+    def test_allowed_tokens_follow_scores_and_schema(self):
+        state = receipt_schema.feed(receipt_schema.START_STATE, '{"receipts": [{"student": "홍길동", "amount": 250000, "date": "2025-03-05", "type": "')
+        scores = np.zeros(len(SCHEMA_PIECES) + 1)
+        scores[11] = 9.0   # 'x' : 점수는 가장 높지만 type 값이 될 수 없음
+        scores[14] = 5.0   # 'mem'
+        scores[8] = 4.0    # 'memo'
+        scores[12] = 8.0   # 특수 토큰 (생성 금지)
+        allowed = receipt_schema.allowed_tokens(scores, state, SCHEMA_PIECES, EOS, limit=2)
+        self.assertEqual([token_id for token_id, _ in allowed], [14, 8])
+
+        scores[[8, 14]] = -np.inf   # 반복 금지 등으로 막히면 EOS
+        self.assertEqual(receipt_schema.allowed_tokens(scores, state, SCHEMA_PIECES, EOS), [(EOS, state)])
+
+    def test_complete_state_only_allows_eos(self):
+        state = receipt_schema.feed(receipt_schema.START_STATE, RECEIPT_JSON)
+        scores = np.ones(len(SCHEMA_PIECES) + 1)
+        self.assertEqual(receipt_schema.allowed_tokens(scores, state, SCHEMA_PIECES, EOS), [(EOS, state)])
+
+    def test_field_confidence(self):
+        tokens = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        logprobs = [0.0, 0.0, math.log(0.5), 0.0, math.log(0.9), 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        valid, fields, overall = receipt_schema.field_confidence(tokens, logprobs, SCHEMA_PIECES)
+        self.assertTrue(valid)
+        self.assertAlmostEqual(fields['student'], 0.5)
+        self.assertAlmostEqual(fields['amount'], 0.9)
+        self.assertAlmostEqual(overall, 0.5)
+        self.assertEqual(receipt_schema.join_pieces(tokens + [12], SCHEMA_PIECES), RECEIPT_JSON)
+
+        valid, fields, overall = receipt_schema.field_confidence([0, 11], [0.0, 0.0], SCHEMA_PIECES)
+        self.assertEqual((valid, fields, overall), (False, {}, None))
+
+
+# -----------------------------------------------------------------------------
+# ONNX 백엔드 전처리 / 후처리 (core/onnx_backend.py)
+# -----------------------------------------------------------------------------
+def _export_image_config(image_processor):
+    """ ai-engine/export_onnx.py 가 export_config.json 에 쓰는 "image" 항목 """
+    return {
+        "height": image_processor.size["height"],
+        "width": image_processor.size["width"],
+        "mean": list(image_processor.image_mean),
+        "std": list(image_processor.image_std),
+        "do_align_long_axis": bool(image_processor.do_align_long_axis),
+        "do_thumbnail": bool(image_processor.do_thumbnail),
+        "do_pad": bool(image_processor.do_pad),
+    }
+
+class OnnxPreprocessTests(SimpleTestCase):
+    # 세로 / 가로 / 입력보다 작은 / 아주 긴 / 입력과 같은 크기
+    SIZES = [(100, 70), (70, 100), (30, 20), (200, 50), (48, 64)]
+
+    def _assert_same_as_donut(self, **options):
+        image_processor = DonutImageProcessor(size={"height": 64, "width": 48}, **options)
+        config = {"image": _export_image_config(image_processor)}
+        rng = np.random.default_rng(0)
+        with mock.patch.object(onnx_backend, 'export_config', config):
+            for width, height in self.SIZES:
+                image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+                expected = image_processor(image, return_tensors="np").pixel_values
+                actual = onnx_backend.preprocess(image)
+                self.assertEqual(actual.dtype, np.float32)
+                self.assertEqual(actual.shape, expected.shape)
+                np.testing.assert_allclose(actual, expected, atol=1e-5, err_msg=f"{width}x{height}")
+
+    def test_matches_donut_image_processor(self):
+        self._assert_same_as_donut(do_align_long_axis=True)
+
+    def test_matches_without_long_axis_align(self):
+        self._assert_same_as_donut(do_align_long_axis=False)
+
+class OnnxToken2JsonTests(SimpleTestCase):
+    ADDED_VOCAB = {"<yes/>"}
+    SEQUENCES = [
+        "<s_student>홍길동</s_student><s_amount>250000</s_amount>",
+        "<s_receipts><s_student>홍길동</s_student><s_amount>1</s_amount></s_receipts>",
+        "<s_items><s_name>a</s_name><sep/><s_name>b</s_name></s_items>",
+        "<s_tags>a<sep/>b<sep/><yes/></s_tags>",
+        "<s_student>홍길동<s_amount>3</s_amount>",   # 닫히지 않은 태그
+        "<S_Student>x</s_student>",
+        "<s_memo>line1\nline2</s_memo>",
+        "plain text",
+        "",
+    ]
+
+    def test_matches_donut_processor(self):
+        # DonutProcessor.token2json 은 added_vocab 을 주면 tokenizer 를 쓰지 않음
+        processor = DonutProcessor.__new__(DonutProcessor)
+        for sequence in self.SEQUENCES:
+            with self.subTest(sequence=sequence):
+                self.assertEqual(
+                    onnx_backend.token2json(sequence, added_vocab=self.ADDED_VOCAB),
+                    processor.token2json(sequence, added_vocab=self.ADDED_VOCAB),
+                )
+
+    def test_nested_and_separated_values(self):
+        self.assertEqual(
+            onnx_backend.token2json(
+                "<s_receipts><s_student>홍길동</s_student></s_receipts>"
+                "<s_tags>a<sep/><yes/></s_tags>",
+                added_vocab=self.ADDED_VOCAB,
+            ),
+            {"receipts": {"student": "홍길동"}, "tags": ["a", "yes"]},
+        )
+        self.assertEqual(onnx_backend.token2json("no tags", added_vocab=set()), {"text_sequence": "no tags"})
+
+# -----------------------------------------------------------------------------
+# 업로드 저장 / 영수증 영역 탐지 (core/ingest.py)
+# -----------------------------------------------------------------------------
+def _png_bytes(size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class SaveUploadTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / 'upload.png'
+
+    def test_saves_image(self):
+        upload = SimpleUploadedFile('receipt.png', _png_bytes())
+        self.assertEqual(ingest.save_upload(upload, self.path), self.path)
+        with Image.open(self.path) as image:
+            self.assertEqual(image.size, (40, 30))
+
+    def test_rejects_declared_size_before_writing(self):
+        upload = SimpleUploadedFile('receipt.png', _png_bytes())
+        with self.settings(INFERENCE_UPLOAD_MAX_MB=0), self.assertRaises(ingest.ImageRejected):
+            ingest.save_upload(upload, self.path)
+        self.assertFalse(self.path.exists())
+
+    def test_rejects_oversized_stream(self):
+        # 크기를 모르는 업로드 (chunked 전송): 저장하다가 넘는 순간 중단하고 파일 삭제
+        chunks = [b'\0' * (512 * 1024)] * 3
+        upload = SimpleNamespace(name='receipt.png', size=None, chunks=lambda: iter(chunks))
+        with self.settings(INFERENCE_UPLOAD_MAX_MB=1), self.assertRaises(ingest.ImageRejected):
+            ingest.save_upload(upload, self.path)
+        self.assertFalse(self.path.exists())
+
+    def test_rejects_non_image(self):
+        upload = SimpleUploadedFile('receipt.png', b'not an image')
+        with self.assertRaises(ingest.ImageRejected):
+            ingest.save_upload(upload, self.path)
+        self.assertFalse(self.path.exists())
+
+    def test_rejects_too_many_pixels(self):
+        upload = SimpleUploadedFile('receipt.png', _png_bytes((40, 30)))
+        with self.settings(INFERENCE_MAX_IMAGE_PIXELS=40 * 30 - 1), self.assertRaises(ingest.ImageRejected):
+            ingest.save_upload(upload, self.path)
+        self.assertFalse(self.path.exists())
+
+    def test_temporary_file_without_path(self):
+        path = ingest.save_upload(SimpleUploadedFile('receipt.PNG', _png_bytes()))
+        self.addCleanup(path.unlink, missing_ok=True)
+        self.assertEqual(path.suffix, '.png')
+        self.assertTrue(path.exists())
+
+class FindReceiptBoxTests(SimpleTestCase):
+    def _box(self, image, fmt='PNG'):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / f'photo.{fmt.lower()}'
+            image.save(path, format=fmt)
+            return ingest.find_receipt_box(path)
+
+    def _photo(self, receipt, size=(1200, 1600)):
+        photo = Image.new('RGB', size, (40, 40, 40))
+        draw = ImageDraw.Draw(photo)
+        draw.rectangle(receipt, fill=(240, 240, 240))
+        # 영수증 위 글자 획 (닫기 연산으로 메워져야 함)
+        for y in range(receipt[1] + 40, receipt[3] - 40, 60):
+            draw.line((receipt[0] + 40, y, receipt[2] - 40, y), fill=(20, 20, 20), width=3)
+        return photo
+
+    def test_finds_paper_with_margin(self):
+        receipt = (300, 200, 900, 1400)
+        for fmt in ('PNG', 'JPEG'):
+            with self.subTest(fmt=fmt):
+                left, top, right, bottom = self._box(self._photo(receipt), fmt)
+                # 원본 좌표로 영수증을 감싸고, 여백(CROP_MARGIN)과 미리보기 축소 오차 이상 벗어나지 않음
+                tolerance_x, tolerance_y = 1200 * ingest.CROP_MARGIN + 12, 1600 * ingest.CROP_MARGIN + 12
+                self.assertLessEqual((left, top), (receipt[0], receipt[1]))
+                self.assertGreaterEqual((right, bottom), (receipt[2], receipt[3]))
+                self.assertLessEqual(receipt[0] - left, tolerance_x)
+                self.assertLessEqual(receipt[1] - top, tolerance_y)
+                self.assertLessEqual(right - receipt[2], tolerance_x)
+                self.assertLessEqual(bottom - receipt[3], tolerance_y)
+
+    def test_no_crop_when_paper_fills_or_missing(self):
+        self.assertIsNone(self._box(self._photo((10, 10, 1190, 1590))))   # 거의 전체가 종이
+        self.assertIsNone(self._box(self._photo((580, 780, 620, 820))))   # 너무 작은 밝은 점
+        self.assertIsNone(self._box(Image.new('RGB', (800, 600), (128, 128, 128))))
+
+# -----------------------------------------------------------------------------
+# 단계별 시간 히스토그램 (core/telemetry.py)
+# -----------------------------------------------------------------------------
+class TelemetryTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(telemetry._histograms, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _lines(self, prefix):
+        return [line for line in telemetry.render_prometheus().splitlines() if line.startswith(prefix)]
+
+    def test_histogram_buckets_are_cumulative_and_inclusive(self):
+        histogram = telemetry.Histogram((1, 5))
+        for value in (0.5, 1, 3, 5, 7):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(1, 2), (5, 4), (float('inf'), 5)])
+        self.assertEqual((histogram.sum, histogram.count), (16.5, 5))
+
+    def test_render_prometheus(self):
+        telemetry.observe('stage', 0.003, stage='decode')
+        telemetry.observe('stage', 0.2, stage='decode')
+        telemetry.observe('stage', 100, stage='decode')
+
+        name = 'myacademy_inference_stage_seconds'
+        text = telemetry.render_prometheus()
+        self.assertTrue(text.endswith("\n"))
+        self.assertIn(f"# TYPE {name} histogram", text)
+        self.assertIn('# TYPE myacademy_inference_decoder_tokens histogram', text)
+
+        buckets = self._lines(f"{name}_bucket")
+        self.assertEqual(len(buckets), len(telemetry.STAGE_BUCKETS) + 1)
+        self.assertEqual(buckets[0], f'{name}_bucket{{stage="decode",le="0.005"}} 1')
+        self.assertIn(f'{name}_bucket{{stage="decode",le="0.25"}} 2', buckets)
+        self.assertEqual(buckets[-1], f'{name}_bucket{{stage="decode",le="+Inf"}} 3')
+        counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(self._lines(f"{name}_count"), [f'{name}_count{{stage="decode"}} 3'])
+        self.assertEqual(self._lines(f"{name}_sum"), [f'{name}_sum{{stage="decode"}} 100.203'])
+
+    def test_label_values_escaped(self):
+        telemetry.observe('stage', 1.0, stage='a"b\\c\nd')
+        line = self._lines('myacademy_inference_stage_seconds_count')[0]
+        self.assertEqual(line, 'myacademy_inference_stage_seconds_count{stage="a\\"b\\\\c\\nd"} 1')
+
+    def test_record_model_timing(self):
+        timing = {'batch_size': 2, 'encoder_ms': 40.0, 'decoder_ms': 500.0, 'parse_ms': None, 'tokens': 50}
+        with telemetry.trace() as spans:
+            telemetry.record_model_timing(timing)
+        self.assertEqual([span['stage'] for span in spans], ['encoder', 'decoder'])
+        self.assertEqual(spans[1]['tokens_per_sec'], 100.0)
+        self.assertEqual(self._lines('myacademy_inference_decoder_tokens_count'),
+                         ['myacademy_inference_decoder_tokens_count 1'])
+        self.assertEqual(self._lines('myacademy_inference_decoder_tokens_per_second_sum'),
+                         ['myacademy_inference_decoder_tokens_per_second_sum 100.0'])
@@ -0,0 +1,423 @@
+# web-service/core/torch_backend.py
+
+import torch
+import re
+import threading
+import time
+from pathlib import Path
+from PIL import Image
+from django.conf import settings
+from transformers import DonutProcessor, LogitsProcessor, LogitsProcessorList, VisionEncoderDecoderModel
+
+from . import receipt_schema
+from .inference import MODEL_ID
+from .model_store import (
+    has_snapshot, load_model_mmap, quantize_dynamic_int8, read_snapshot_meta
+)
+from .result_cache import files_fingerprint
+
+# -----------------------------------------------------------------------------
+# PyTorch(transformers) 추론 백엔드 (settings.INFERENCE_BACKEND = 'torch', 기본값)
+# -----------------------------------------------------------------------------
+
+# 전역 변수
+model = None
+processor = None
+model_revision = None   # 결과 캐시 무효화용 (모델 ID@리비전)
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+# CPU int8 양자화 모드 ('none' | 'decoder' | 'all'), core/model_store.py 참고
+QUANTIZE_MODE = getattr(settings, 'INFERENCE_QUANTIZE', 'none')
+
+# 영수증 JSON 스키마 제약 디코딩 (core/receipt_schema.py)
+CONSTRAINED = getattr(settings, 'INFERENCE_CONSTRAINED', False)
+
+# 생성 옵션 (manage.py benchmark_inference 로 지연 시간 / 정확도를 비교해서 정함)
+NUM_BEAMS = getattr(settings, 'INFERENCE_NUM_BEAMS', 4)
+MAX_LENGTH = getattr(settings, 'INFERENCE_MAX_LENGTH', 768)
+# 입력 해상도 'HxW' (빈 값이면 모델 저장소의 프로세서 설정 그대로, 학습은 960x720)
+IMAGE_SIZE = getattr(settings, 'INFERENCE_IMAGE_SIZE', '')
+
+# 디코딩 방식 ('beam' | 'greedy' | 'adaptive')
+# adaptive: greedy 로 먼저 생성하고, 필드 신뢰도가 CONFIDENCE_THRESHOLD 미만이거나
+#           스키마에 맞지 않는 이미지만 beam search 로 다시 생성
+DECODING = getattr(settings, 'INFERENCE_DECODING', 'beam')
+CONFIDENCE_THRESHOLD = getattr(settings, 'INFERENCE_CONFIDENCE_THRESHOLD', 0.8)
+
+_load_lock = threading.Lock()
+
+def is_loaded():
+    return model is not None
+
+def model_fingerprint():
+    """ 추론 결과에 영향을 주는 것들(모델 ID/리비전, 양자화 모드, 생성 옵션)을 묶은 문자열 """
+    height, width = input_size()
+    return (
+        f"torch:{model_revision}:{QUANTIZE_MODE}:{'constrained' if CONSTRAINED else 'free'}:{DECODING}"
+        f":beams={NUM_BEAMS}:max={MAX_LENGTH}:{height}x{width}"
+    )
+
+def input_size():
+    """ 모델 입력 이미지 크기 (height, width) """
+    size = processor.image_processor.size
+    return size["height"], size["width"]
+
+def load_model_lazy():
+    """
+    최초 요청 시 모델을 로드합니다.
+    로컬 스냅샷(settings.INFERENCE_MODEL_DIR, manage.py snapshot_model 로 생성)이 있으면
+    인터넷 없이 mmap 으로 읽고, 없으면 Hugging Face Hub에서 다운로드/로드합니다.
+    """
+    global model, processor, model_revision
+    
+    if model is not None:
+        return
+
+    with _load_lock:
+        if model is not None:
+            return
+        try:
+            loaded_model, loaded_processor, source = build_model(QUANTIZE_MODE)
+            model_revision = _revision_of(loaded_model)
+            processor = loaded_processor
+            model = loaded_model
+            print(f"✅ AI 모델 로딩 완료! (Source: {source}, 양자화: {QUANTIZE_MODE})")
+
+        except Exception as e:
+            print(f"❌ 모델 로딩 실패: {e}")
+            model = None
+            raise e
+
+def build_model(quantize='none'):
+    """
+    (모델, 프로세서, 출처) 를 새로 만듭니다. 전역 model 은 건드리지 않습니다.
+    (benchmark_inference 명령이 양자화 모드별 모델을 나란히 만들 때도 사용)
+    """
+    snapshot_dir = settings.INFERENCE_MODEL_DIR
+    if has_snapshot(snapshot_dir):
+        new_model, new_processor = load_snapshot_model(snapshot_dir)
+        source = f"로컬 스냅샷 {snapshot_dir}"
+    else:
+        new_model, new_processor = load_hub_model()
+        source = "Hugging Face Hub"
+
+    if IMAGE_SIZE:
+        height, width = (int(v) for v in IMAGE_SIZE.lower().split('x'))
+        new_processor.image_processor.size = {"height": height, "width": width}
+
+    new_model.to(device)
+    new_model.eval()
+
+    # int8 동적 양자화는 CPU 전용 (GPU 에서는 설정을 무시)
+    if device.type == 'cpu':
+        quantize_dynamic_int8(new_model, quantize)
+    return new_model, new_processor, source
+
+def _revision_of(loaded_model):
+    snapshot_dir = settings.INFERENCE_MODEL_DIR
+    if has_snapshot(snapshot_dir):
+        meta = read_snapshot_meta(snapshot_dir)
+        weights = files_fingerprint(Path(snapshot_dir).glob("*.safetensors"))
+        return f"{meta.get('model_id', MODEL_ID)}@{meta.get('revision') or weights}"
+    return f"{MODEL_ID}@{getattr(loaded_model.config, '_commit_hash', None) or 'main'}"
+
+def load_hub_model(model_id=MODEL_ID):
+    """ Hugging Face Hub 에서 (모델, 프로세서) 를 받아옵니다. (snapshot_model 명령도 사용) """
+    print(f"💤 Hugging Face Hub에서 모델을 찾아오는 중... (ID: {model_id})")
+
+    # ---------------------------------------------------------
+    # Hugging Face Hub 자동 로드 (인터넷 연결 필수)
+    # ---------------------------------------------------------
+    # 만약 비공개(Private) 모델이라면, 터미널에서 'huggingface-cli login'을 했거나
+    # token="hf_..." 인자를 추가해야 합니다.
+    
+    # 1. 프로세서 로드
+    try:
+        hub_processor = DonutProcessor.from_pretrained(model_id)
+    except OSError:
+        # 혹시나 설정 파일이 꼬였을 경우를 대비한 안전장치
+        print("⚠️ 모델 저장소에 프로세서 설정이 없어 기본값(donut-base)을 사용합니다.")
+        hub_processor = DonutProcessor.from_pretrained("naver-clova-ix/donut-base")
+        hub_processor.tokenizer.add_tokens(["<s_receipt>", "</s_receipt>"])
+
+    # 2. 모델 로드
+    hub_model = VisionEncoderDecoderModel.from_pretrained(model_id)
+    
+    # 토큰 크기 맞춤
+    hub_model.decoder.resize_token_embeddings(len(hub_processor.tokenizer))
+    return hub_model, hub_processor
+
+def load_snapshot_model(path):
+    """
+    로컬 스냅샷에서 (모델, 프로세서) 를 읽습니다.
+    CPU 에서는 safetensors 를 mmap 으로 열어, gunicorn 워커들이 같은 가중치 페이지를 공유합니다.
+    """
+    snapshot_processor = DonutProcessor.from_pretrained(path)
+    if device.type == 'cpu':
+        snapshot_model = load_model_mmap(path)
+    else:
+        snapshot_model = VisionEncoderDecoderModel.from_pretrained(path)
+
+    # 스냅샷은 토큰 크기를 맞춘 뒤 저장하므로 보통은 그대로 일치
+    if snapshot_model.decoder.get_input_embeddings().num_embeddings != len(snapshot_processor.tokenizer):
+        snapshot_model.decoder.resize_token_embeddings(len(snapshot_processor.tokenizer))
+    return snapshot_model, snapshot_processor
+
+def warm_up():
+    """ 빈 이미지로 짧게 generate 해서 커널/메모리 할당을 미리 끝내둡니다. """
+    size = processor.image_processor.size
+    blank = Image.new("RGB", (size.get("width", 720), size.get("height", 960)), "white")
+    pixel_values = processor(blank, return_tensors="pt").pixel_values.to(device)
+    decoder_input_ids = processor.tokenizer(
+        "<s_receipt>", add_special_tokens=False, return_tensors="pt"
+    ).input_ids.to(device)
+    with torch.no_grad():
+        model.generate(
+            pixel_values,
+            decoder_input_ids=decoder_input_ids,
+            max_length=decoder_input_ids.size(1) + 4,
+            pad_token_id=processor.tokenizer.pad_token_id,
+            eos_token_id=processor.tokenizer.eos_token_id,
+        )
+
+def preprocess(image):
+    """ PIL 이미지 -> (1, 3, H, W) pixel_values """
+    return processor(image, return_tensors="pt").pixel_values
+
+def stack(batch):
+    return torch.cat(batch)
+
+def generate_batch(pixel_values, use_model=None):
+    """
+    (B, C, H, W) 이미지 묶음을 한 번에 생성하고, 이미지별 결과 dict 목록을 반환
+    use_model 을 주면 전역 model 대신 그 모델로 생성합니다. (벤치마크용)
+    결과에는 디코딩 경로와 필드별 신뢰도('decoding')가 함께 들어갑니다.
+    """
+    use_model = use_model or model
+    pixel_values = pixel_values.to(device)
+
+    if DECODING != 'adaptive':
+        return _generate(use_model, pixel_values, 1 if DECODING == 'greedy' else NUM_BEAMS)
+
+    # greedy 로 먼저 -> 자신 없는 이미지만 beam 으로 재시도
+    outputs = _generate(use_model, pixel_values, 1)
+    hard = [i for i, output in enumerate(outputs) if needs_beam(output['decoding'])]
+    if hard:
+        retried = _generate(use_model, pixel_values[hard], NUM_BEAMS)
+        for i, output in zip(hard, retried):
+            output['decoding']['greedy_confidence'] = outputs[i]['decoding']['confidence']
+            # 단계 시간은 greedy + beam 을 합쳐서 (토큰 수는 최종 beam 결과 기준)
+            for key in ('encoder_ms', 'decoder_ms'):
+                output['timing'][key] = round(output['timing'][key] + outputs[i]['timing'][key], 1)
+            outputs[i] = output
+    return outputs
+
+def needs_beam(decoding):
+    """ greedy 결과를 beam 으로 다시 생성할지: 스키마에 맞지 않거나 필드 신뢰도가 기준 미만 """
+    confidence = decoding['confidence']
+    return not decoding['schema_valid'] or confidence is None or confidence < CONFIDENCE_THRESHOLD
+
+def _generate(use_model, pixel_values, num_beams):
+    # 3. 프롬프트 준비 (배치 크기만큼 복제)
+    task_prompt = "<s_receipt>"
+    decoder_input_ids = processor.tokenizer(
+        task_prompt, add_special_tokens=False, return_tensors="pt"
+    ).input_ids.repeat(pixel_values.size(0), 1).to(device)
+    prompt_length = decoder_input_ids.size(1)
+
+    # 4. 생성 (Inference) - 품질 옵션 적용
+    pieces = _token_pieces()
+    recorder = _TokenLogprobRecorder(prompt_length)
+    logits_processor = LogitsProcessorList([recorder])
+    if CONSTRAINED:
+        logits_processor.append(_SchemaLogitsProcessor(prompt_length, pieces, num_beams))
+
+    started = time.perf_counter()
+    with torch.no_grad(), _EncoderTimer(use_model.encoder) as encoder_timer:
+        outputs = use_model.generate(
+            pixel_values,
+            decoder_input_ids=decoder_input_ids,
+            max_length=MAX_LENGTH,
+            early_stopping=num_beams > 1,
+            pad_token_id=processor.tokenizer.pad_token_id,
+            eos_token_id=processor.tokenizer.eos_token_id,
+            use_cache=True,
+            # 앵무새 방지 옵션
+            num_beams=num_beams,
+            repetition_penalty=1.2,
+            no_repeat_ngram_size=3,
+            
+            bad_words_ids=[[processor.tokenizer.unk_token_id]],
+            logits_processor=logits_processor,
+            return_dict_in_generate=True,
+        )
+    _synchronize()
+    generate_ms = (time.perf_counter() - started) * 1000
+    encoder_ms = encoder_timer.elapsed * 1000
+
+    # 5. 후처리 (이미지별로)
+    results = []
+    pad_id = processor.tokenizer.pad_token_id
+    for sequence in outputs.sequences.tolist():
+        generated = sequence[prompt_length:]
+        while generated and generated[-1] == pad_id:
+            generated.pop()
+        parse_started = time.perf_counter()
+        if CONSTRAINED:
+            result = _parse_constrained(generated)
+        else:
+            result = _parse_sequence(processor.decode(sequence))
+        parse_ms = (time.perf_counter() - parse_started) * 1000
+
+        valid, fields, confidence = receipt_schema.field_confidence(
+            generated, recorder.logprobs_of(tuple(generated)), pieces
+        )
+        result['decoding'] = {
+            'path': 'greedy' if num_beams == 1 else 'beam',
+            'confidence': confidence,
+            'fields': fields,
+            'schema_valid': valid,
+        }
+        # 단계별 시간 (core/telemetry.py). encoder / decoder 는 배치 전체 시간
+        result['timing'] = {
+            'batch_size': pixel_values.size(0),
+            'encoder_ms': round(encoder_ms, 1),
+            'decoder_ms': round(generate_ms - encoder_ms, 1),
+            'parse_ms': round(parse_ms, 1),
+            'tokens': len(generated),
+        }
+        results.append(result)
+    return results
+
+def _synchronize():
+    """ GPU 는 연산이 비동기라 시간을 재기 전에 끝날 때까지 기다림 """
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+class _EncoderTimer:
+    """ generate 안에서 인코더 forward 에 걸린 시간만 따로 잽니다. (forward hook) """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.elapsed = 0.0
+        self._started = None
+        self._handles = []
+
+    def __enter__(self):
+        self._handles = [
+            self.encoder.register_forward_pre_hook(self._start),
+            self.encoder.register_forward_hook(self._stop),
+        ]
+        return self
+
+    def __exit__(self, *exc_info):
+        for handle in self._handles:
+            handle.remove()
+        return False
+
+    def _start(self, module, args):
+        _synchronize()
+        self._started = time.perf_counter()
+
+    def _stop(self, module, args, output):
+        _synchronize()
+        self.elapsed += time.perf_counter() - self._started
+
+class _TokenLogprobRecorder(LogitsProcessor):
+    """
+    고른 토큰의 log 확률을 기록합니다. (점수를 바꾸지 않음)
+    직전 스텝의 분포만 들고 있다가, 다음 스텝 입력에서 실제로 고른 토큰을 보고 확률을 꺼냅니다.
+    (output_scores 처럼 어휘 전체 점수를 매 스텝 쌓아두지 않음. beam 이 갈라져도 접두사로 찾음)
+    """
+
+    def __init__(self, prompt_length):
+        self.prompt_length = prompt_length
+        self.eos_id = processor.tokenizer.eos_token_id
+        self.token_logprob = {}   # 생성된 토큰(접두사) -> 마지막 토큰의 log 확률
+        self._previous = {}       # 직전 스텝: 생성된 토큰 -> 어휘 전체 log 확률
+
+    def __call__(self, input_ids, scores):
+        logprobs = torch.log_softmax(scores.float(), dim=-1)
+        current = {}
+        for row, ids in enumerate(input_ids.tolist()):
+            generated = tuple(ids[self.prompt_length:])
+            self._record(generated)
+            current[generated] = logprobs[row]
+            # 이 스텝에서 EOS 로 끝나는 beam 은 다음 스텝 입력에 다시 나오지 않으므로 미리 기록
+            self.token_logprob[generated + (self.eos_id,)] = logprobs[row, self.eos_id].item()
+        self._previous = current
+        return scores
+
+    def _record(self, generated):
+        parent = generated[:-1]
+        if generated and generated not in self.token_logprob and parent in self._previous:
+            self.token_logprob[generated] = self._previous[parent][generated[-1]].item()
+
+    def logprobs_of(self, generated):
+        """ 최종 시퀀스(패딩 제외)의 토큰별 log 확률 """
+        self._record(generated)
+        prefixes = (generated[:k] for k in range(1, len(generated) + 1))
+        return [self.token_logprob.get(prefix) for prefix in prefixes]
+
+# -----------------------------------------------------------------------------
+# 스키마 제약 디코딩 (beam 마다 스키마를 지키는 상위 토큰만 남김)
+# -----------------------------------------------------------------------------
+_pieces_cache = {}   # 토크나이저 -> 토큰 id 별 문자열
+
+def _token_pieces():
+    tokenizer = processor.tokenizer
+    key = id(tokenizer)
+    if key not in _pieces_cache:
+        _pieces_cache[key] = receipt_schema.token_pieces(
+            tokenizer.convert_ids_to_tokens, len(tokenizer), set(tokenizer.all_special_ids)
+        )
+    return _pieces_cache[key]
+
+class _SchemaLogitsProcessor(LogitsProcessor):
+    def __init__(self, prompt_length, pieces, num_beams):
+        self.prompt_length = prompt_length
+        self.pieces = pieces
+        self.num_beams = num_beams
+        self.eos_id = processor.tokenizer.eos_token_id
+        self.states = {(): receipt_schema.START_STATE}   # 생성된 토큰 -> 상태 (beam 이 갈라져도 재사용)
+
+    def _state(self, generated):
+        state = self.states.get(generated)
+        if state is None:
+            state = self._state(generated[:-1])
+            piece = self.pieces[generated[-1]] if generated[-1] < len(self.pieces) else None
+            if piece is not None:
+                state = receipt_schema.feed(state, piece) or state
+            self.states[generated] = state
+        return state
+
+    def __call__(self, input_ids, scores):
+        masked = torch.full_like(scores, float('-inf'))
+        for row, ids in enumerate(input_ids.tolist()):
+            state = self._state(tuple(ids[self.prompt_length:]))
+            allowed = receipt_schema.allowed_tokens(
+                scores[row].float().cpu().numpy(), state, self.pieces, self.eos_id, limit=self.num_beams
+            )
+            token_ids = [token_id for token_id, _ in allowed]
+            masked[row, token_ids] = scores[row, token_ids]
+            if token_ids == [self.eos_id]:
+                masked[row, self.eos_id] = 0  # 점수가 막혀 있어도 EOS 로 끝낼 수 있게
+        return masked
+
+def _parse_constrained(token_ids):
+    sequence = receipt_schema.join_pieces(token_ids, _token_pieces())
+    print(f"🤖 AI 분석 결과(Raw): {sequence}")
+    return receipt_schema.parse(sequence)
+
+def _parse_sequence(sequence):
+    sequence = sequence.replace(processor.tokenizer.eos_token, "").replace(processor.tokenizer.pad_token, "")
+    sequence = re.sub(r"<.*?>", "", sequence, count=1).strip()
+    
+    print(f"🤖 AI 분석 결과(Raw): {sequence}")
+
+    # 6. JSON 파싱
+    try:
+        json_output = processor.token2json(sequence)
+        return {"status": "success", "result": json_output}
+    except Exception as json_err:
+        return {"status": "partial_success", "result": {"text_content": sequence}}
@@ -8,9 +8,13 @@ from . import views
 router = DefaultRouter()
 router.register(r'students', views.StudentViewSet)      # /api/students/
 router.register(r'payments', views.PaymentViewSet)      # /api/payments/
+router.register(r'balances', views.OutstandingBalanceViewSet, basename='balances') # /api/balances/
 router.register(r'matching', views.MatchingViewSet, basename='matching') # /api/matching/
 
 urlpatterns = [
     # 라우터가 생성한 URL 패턴 포함
     path('', include(router.urls)),
+
+    # 추론 단계별 지표 (Prometheus scrape 용, 로컬 전용)
+    path('metrics/', views.prometheus_metrics, name='metrics'),     # /api/metrics/
 ]
\ No newline at end of file
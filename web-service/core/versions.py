@@ -0,0 +1,49 @@
+# web-service/core/versions.py
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import DataVersion
+
+# -----------------------------------------------------------------
+# DB 에 저장하는 캐시 버전 번호
+#
+# 프로세스 전역 카운터는 값을 올린 프로세스만 알기 때문에, 다른 gunicorn 워커 / 작업 워커는
+# 옛 캐시를 계속 씁니다. 버전을 DB 행(DataVersion)에 두고 다른 프로세스의 변경을 확인합니다.
+# - 읽기: 모든 버전 행을 쿼리 한 번으로 읽어 CACHE_VERSION_TTL 초 동안 재사용 (매칭 호출마다 DB 를 읽지 않음)
+#         이 프로세스에서 올린 버전은 바로 보이고, 다른 프로세스의 변경은 TTL 안에 보입니다.
+# - 쓰기: 데이터를 바꾼 트랜잭션 안에서 UPDATE 한 번 (커밋되는 순간 데이터와 버전이 같이 보임)
+#         여러 건을 한꺼번에 바꾸는 곳(ledger.apply_payments 등)은 마지막에 한 번만 올립니다.
+# -----------------------------------------------------------------
+_cache = None           # {name: version}
+_cache_expires = 0.0
+_cache_lock = threading.Lock()
+
+def bump(name):
+    """ name 버전을 1 올립니다. (행이 없으면 만들고 올림) """
+    if not DataVersion.objects.filter(name=name).update(version=F('version') + 1):
+        DataVersion.objects.get_or_create(name=name)
+        DataVersion.objects.filter(name=name).update(version=F('version') + 1)
+    # 이 프로세스는 바로 새 버전을 보도록 (커밋 뒤에도 한 번 더: 그 사이 다른 스레드가 옛 값을 읽어 둔 경우)
+    invalidate()
+    transaction.on_commit(invalidate)
+
+def current(name):
+    """ name 의 현재 버전 (한 번도 올린 적 없으면 0). CACHE_VERSION_TTL 초 동안은 메모리 값 """
+    global _cache, _cache_expires
+    with _cache_lock:
+        now = time.monotonic()
+        if _cache is None or now >= _cache_expires:
+            _cache = dict(DataVersion.objects.values_list('name', 'version'))
+            _cache_expires = now + settings.CACHE_VERSION_TTL
+        return _cache.get(name, 0)
+
+def invalidate():
+    """ 다음 current() 호출 때 DB 에서 다시 읽도록 """
+    global _cache
+    with _cache_lock:
+        _cache = None
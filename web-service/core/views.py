@@ -2,26 +2,29 @@
 
 import re
 import json
-import io
-from PIL import Image
+import time
+import uuid
 
+from django.conf import settings
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseForbidden
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import Student, Payment
-from .serializers import StudentSerializer, PaymentSerializer
-
-# 로컬 AI 엔진 가져오기
-from .inference import run_inference
-
-# 기존 서비스 로직 (DB 매칭용)
-from .services import (
-    find_student_by_amount, 
-    scan_text_for_students,
-    find_payment_matches
+from .models import Student, Payment, OutstandingBalance, InferenceJob
+from .serializers import (
+    StudentSerializer, PaymentSerializer, OutstandingBalanceSerializer, InferenceJobSerializer
 )
 
+# 이미지/텍스트 분석 파이프라인 (AI 추론 + DB 매칭)
+from .pipeline import process_image, process_text_data
+from .inference import get_batch_metrics
+from .reconcile import reconcile_statement
+from .jobs import submit_image_job, queue_position, JobQueueFull
+from .ingest import save_upload, open_receipt_image, ImageRejected
+from . import ledger, roster, telemetry
+
 # -----------------------------------------------------------------
 # 1. 학생 관리 ViewSet
 # -----------------------------------------------------------------
@@ -56,6 +59,9 @@ class StudentViewSet(viewsets.ModelViewSet):
                 ))
 
             Student.objects.bulk_create(students_to_create)
+            # bulk_create 는 post_save 시그널이 없으므로 명단 버전을 직접 올리고 이번 달 장부 행을 만듦
+            roster.bump_version()
+            ledger.open_period(ledger.current_period())
             return Response({"status": "success", "count": len(students_to_create)}, status=status.HTTP_201_CREATED)
 
         except Exception as e:
@@ -69,7 +75,41 @@ class PaymentViewSet(viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
 
 # -----------------------------------------------------------------
-# 3. AI 정산 매칭 ViewSet (핵심 기능)
+# 3. 미납 잔액 장부 ViewSet (조회 전용 + 기간 열기)
+# -----------------------------------------------------------------
+class OutstandingBalanceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ?period=2025-11 (기본: 이번 달), ?unpaid=true 이면 잔액이 남은 학생만
+    조회는 장부에 쓰지 않습니다. 새 기간의 행은 POST /api/balances/open/ 으로 만듭니다.
+    """
+    serializer_class = OutstandingBalanceSerializer
+
+    def list(self, request, *args, **kwargs):
+        period = request.query_params.get('period')
+        if period and not ledger.is_valid_period(period):
+            return Response({"error": "period 는 YYYY-MM 형식이어야 합니다."}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], url_path='open')
+    def open_period(self, request):
+        """ 해당 기간(기본: 이번 달) 장부에 아직 없는 학생 행을 만듭니다. (여러 번 불러도 안전) """
+        period = request.data.get('period') or ledger.current_period()
+        if not ledger.is_valid_period(period):
+            return Response({"error": "period 는 YYYY-MM 형식이어야 합니다."}, status=status.HTTP_400_BAD_REQUEST)
+        created = ledger.open_period(period)
+        return Response({"status": "success", "period": period, "created": created})
+
+    def get_queryset(self):
+        period = self.request.query_params.get('period') or ledger.current_period()
+        if not ledger.is_valid_period(period):
+            return OutstandingBalance.objects.none()
+        queryset = OutstandingBalance.objects.filter(billing_period=period).select_related('student')
+        if str(self.request.query_params.get('unpaid', '')).lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(amount_paid__lt=F('amount_due'))
+        return queryset.order_by('student__name')
+
+# -----------------------------------------------------------------
+# 4. AI 정산 매칭 ViewSet (핵심 기능)
 # -----------------------------------------------------------------
 class MatchingViewSet(viewsets.ViewSet):
     
@@ -82,121 +122,148 @@ class MatchingViewSet(viewsets.ViewSet):
             return Response({"error": "텍스트 또는 이미지를 입력해주세요."}, status=status.HTTP_400_BAD_REQUEST)
         
         matched_results = []
+        inference_info = []
+        split_info = {}
+        started = time.perf_counter()
         
-        # 1. 텍스트 직접 입력 처리
-        if text_data:
-            results = self._process_text_data(text_data)
-            matched_results.extend(results)
+        # 단계별 처리 시간 기록 (core/telemetry.py). debug=1 이면 응답에도 포함
+        with telemetry.trace() as spans:
+            # 1. 텍스트 직접 입력 처리
+            if text_data:
+                results = self._process_text_data(text_data)
+                matched_results.extend(results)
 
-        # 2. 이미지 파일 처리 (AI 모델 추론)
-        if image_file:
-            image_results = self._process_image_data(image_file)
-            matched_results.extend(image_results)
+            # 2. 이미지 파일 처리 (AI 모델 추론)
+            if image_file:
+                try:
+                    image_results = self._process_image_data(image_file, inference_info, split_info)
+                except ImageRejected as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                matched_results.extend(image_results)
             
-        return Response({
+        response = {
             "message": "분석 완료",
             "results": matched_results 
+        }
+        if image_file:
+            response["inference"] = inference_info  # 영수증별 디코딩 경로(greedy/beam) + 필드 신뢰도
+            response["skipped_receipts"] = split_info.get('skipped', 0)  # 최대 장수를 넘어 분석하지 않은 영수증 수
+        if settings.INFERENCE_DEBUG_TIMINGS and _wants_debug(request):
+            response["debug"] = {
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                "stages": spans,
+            }
+        return Response(response)
+
+    @action(detail=False, methods=['post'])
+    def reconcile(self, request):
+        """
+        은행 입금 내역(CSV/TSV) 일괄 정산
+        - statement_file: 내보낸 입금 내역 파일 (헤더에 입금자명/입금액 열 필요)
+        - dry_run: true 이면 Payment 를 저장하지 않고 결과만 반환
+        - encoding: 파일 인코딩 (기본 utf-8-sig, 국내 은행 파일은 cp949 인 경우가 많음)
+        """
+        statement_file = request.FILES.get('statement_file')
+        if not statement_file:
+            return Response({"error": "입금 내역 파일을 업로드해주세요."}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        encoding = request.data.get('encoding') or 'utf-8-sig'
+
+        try:
+            report = reconcile_statement(statement_file, dry_run=dry_run, encoding=encoding)
+        except (ValueError, UnicodeDecodeError, LookupError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "message": "정산 완료",
+            **report
         })
 
-    def _process_image_data(self, image_file):
-        """ 이미지를 AI 모델에 넣어 JSON 결과를 받고, 텍스트로 변환하여 분석 """
+    @action(detail=False, methods=['post'], url_path='jobs')
+    def submit_job(self, request):
+        """
+        이미지 분석 작업 등록 (비동기)
+        - 추론을 기다리지 않고 job_id 를 바로 반환합니다. (202 Accepted)
+        - 결과는 GET /api/matching/jobs/<job_id>/ 로 조회합니다.
+        """
+        image_file = request.FILES.get('image_file')
+        if not image_file:
+            return Response({"error": "이미지를 업로드해주세요."}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            # 1. 이미지 변환 (Django UploadFile -> PIL)
-            image_bytes = image_file.read()
-            pil_image = Image.open(io.BytesIO(image_bytes))
-
-            # 2. AI 추론 실행
-            ai_output = run_inference(pil_image)
-
-            if ai_output['status'] != 'success':
-                # 부분 성공으로 텍스트만 왔을 경우도 처리 가능하지만, 여기선 에러 처리
-                if ai_output.get('status') == 'partial_success':
-                     return self._process_text_data(ai_output['result'].get('text_content', ''))
-                return [f"❌ AI 분석 실패: {ai_output.get('message')}"]
-
-            # 3. JSON 데이터 추출
-            data = ai_output['result']
-            print(f"🔍 AI 추출 JSON 데이터: {data}")
-
-            # 4. [중요] JSON 데이터를 기존 텍스트 분석 로직이 이해할 수 있는 '문자열'로 변환
-            # 예: {'total_price': '50,000', 'student': '홍길동'} -> "학생: 홍길동\n금액: 50,000"
-            converted_lines = []
-            
-            # (1) 학생 이름 추출
-            if 'student' in data:
-                converted_lines.append(f"학생명: {data['student']}")
-            
-            # (2) 총 금액 추출 (total_price 또는 amount 키)
-            if 'total_price' in data:
-                converted_lines.append(f"총계 {data['total_price']}")
-            elif 'amount' in data:
-                converted_lines.append(f"금액 {data['amount']}")
-            
-            # (3) 품목 내역 추출 (items 리스트)
-            if 'items' in data and isinstance(data['items'], list):
-                for item in data['items']:
-                    # item이 dict인 경우 desc와 price 추출
-                    if isinstance(item, dict):
-                        desc = item.get('desc', item.get('item', ''))
-                        price = item.get('price', item.get('amount', ''))
-                        converted_lines.append(f"{desc} {price}")
-                    elif isinstance(item, str):
-                        converted_lines.append(item)
-
-            full_text_from_ai = "\n".join(converted_lines)
-            print(f"📝 변환된 분석 텍스트:\n{full_text_from_ai}")
-
-            # 5. 변환된 텍스트로 매칭 로직 실행
-            return self._process_text_data(full_text_from_ai)
+            job = submit_image_job(image_file)
+        except ImageRejected as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except JobQueueFull as e:
+            # 대기열이 가득 차면 바로 거절 (클라이언트는 잠시 후 다시 시도)
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "10"},
+            )
+
+        return Response({
+            "message": "분석 작업이 등록되었습니다.",
+            "job_id": str(job.id),
+            "status": job.status,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]+)')
+    def job_status(self, request, job_id=None):
+        """ 이미지 분석 작업 상태/결과 조회 (PENDING -> RUNNING -> DONE | FAILED) """
+        try:
+            job = InferenceJob.objects.filter(id=uuid.UUID(job_id)).first()
+        except ValueError:
+            job = None
+        if job is None:
+            return Response({"error": "작업을 찾을 수 없습니다."}, status=status.HTTP_404_NOT_FOUND)
+
+        data = InferenceJobSerializer(job).data
+        if job.status == 'PENDING':
+            data['queue_position'] = queue_position(job)
+        return Response(data)
 
+    @action(detail=False, methods=['get'], url_path='inference-metrics')
+    def inference_metrics(self, request):
+        """ AI 추론 마이크로 배치 지표 (요청 지연 시간 p50/p95, 배치 크기 분포) """
+        return Response(get_batch_metrics())
+
+    def _process_image_data(self, image_file, inference_info=None, split_info=None):
+        """
+        업로드 이미지를 임시 파일로 받아 축소 디코딩 + 영수증 영역만 잘라서(core/ingest.py)
+        분석 파이프라인(core/pipeline.py)에 넘김. 용량/해상도 제한을 넘으면 ImageRejected
+        """
+        with telemetry.span('upload'):
+            image_path = save_upload(image_file)
+        try:
+            with telemetry.span('decode'):
+                pil_image = open_receipt_image(image_path)
         except Exception as e:
             print(f"Image Processing Error: {e}")
             return [f"서버 에러: 이미지 처리 중 문제가 발생했습니다. {str(e)}"]
+        finally:
+            image_path.unlink(missing_ok=True)
+
+        return process_image(pil_image, inference_info, split_info)
 
     def _process_text_data(self, text):
         """ 텍스트에서 학생 이름과 금액을 찾아 DB와 매칭 """
-        results = []
-        
-        # 1. 이름 기반 검색
-        found_students = scan_text_for_students(text)
-        if found_students:
-            for student in found_students:
-                results.append(f"✅ 이름 매칭: '{student.name}' 학생 (DB 수강료: {student.base_fee:,}원)")
-
-        # 2. 금액 기반 검색
-        lines = text.splitlines()
-        for line in lines:
-            # 숫자만 추출 (콤마 제거)
-            numbers = re.findall(r'\d+', line.replace(',', ''))
-            
-            for num_str in numbers:
-                amount = int(num_str)
-                
-                # 금액 노이즈 필터링
-                if amount < 1000 or amount > 10000000:
-                    continue
-
-                # 이미 찾은 학생의 수강료와 같다면 중복 출력 방지
-                is_already_found = False
-                for s in found_students:
-                    if s.base_fee == amount or s.book_fee == amount:
-                        is_already_found = True
-                        break
-                if is_already_found:
-                    continue
-
-                # 금액 매칭 시도
-                student = find_student_by_amount(amount)
-                if student:
-                    results.append(f"💰 금액 매칭: {amount:,}원 → {student.name}")
-                else:
-                    # 합산 매칭 시도
-                    matches = find_payment_matches(amount)
-                    if matches['type'] == 'N:1':
-                        names = ", ".join([s.name for s in matches['students']])
-                        results.append(f"💡 합산 의심: {amount:,}원 → {names} 합산액과 일치")
-
-        if not results:
-            results.append("❌ 매칭 실패: 텍스트에서 유의미한 정보를 찾지 못했습니다.")
-
-        return results
\ No newline at end of file
+        with telemetry.span('matching'):
+            return process_text_data(text)
+
+def _wants_debug(request):
+    value = request.query_params.get('debug') or request.data.get('debug', '')
+    return str(value).lower() in ('1', 'true', 'yes')
+
+# -----------------------------------------------------------------
+# 5. 추론 단계별 지표 (Prometheus 텍스트 형식, GET /api/metrics/)
+# -----------------------------------------------------------------
+def prometheus_metrics(request):
+    """
+    단계별 처리 시간 / 디코더 토큰 수 / 초당 토큰 수 히스토그램 (core/telemetry.py)
+    INFERENCE_METRICS_ALLOWED_IPS 에 있는 주소(기본: 로컬)에서만 조회할 수 있습니다.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.INFERENCE_METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden("metrics 는 로컬에서만 조회할 수 있습니다.\n")
+    return HttpResponse(telemetry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -138,4 +138,81 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CLOVA_API_URL = os.getenv("CLOVA_API_URL")
-CLOVA_SECRET_KEY = os.getenv("CLOVA_SECRET_KEY")
\ No newline at end of file
+CLOVA_SECRET_KEY = os.getenv("CLOVA_SECRET_KEY")
+
+# 학생 명단 스냅샷 / 미납 장부 메모리 캐시의 버전 확인 (core/versions.py)
+CACHE_VERSION_TTL = float(os.getenv("CACHE_VERSION_TTL", "1.0")) # 다른 프로세스의 명단/장부 변경을 DB 에서 확인하는 간격(초)
+
+# 이미지 분석 비동기 작업 큐 (core/jobs.py)
+INFERENCE_JOB_DIR = Path(os.getenv("INFERENCE_JOB_DIR", BASE_DIR / 'inference_jobs')) # 업로드 이미지 임시 보관
+INFERENCE_JOB_WORKERS = int(os.getenv("INFERENCE_JOB_WORKERS", "1")) # CPU 추론은 1~2개가 적당
+INFERENCE_JOB_QUEUE_SIZE = int(os.getenv("INFERENCE_JOB_QUEUE_SIZE", "16")) # 대기+실행 작업이 이보다 많으면 새 작업 거절
+INFERENCE_JOB_TIMEOUT = int(os.getenv("INFERENCE_JOB_TIMEOUT", "600")) # 이 시간(초) 넘게 RUNNING 이면 멈춘 작업으로 보고 다시 대기열로
+INFERENCE_JOB_WORKERS_AUTOSTART = os.getenv("INFERENCE_JOB_WORKERS_AUTOSTART", "1").lower() in ("1", "true", "yes") # WSGI/ASGI 서버(runserver 포함)가 뜰 때 워커 시작 (끄면 첫 작업 등록 때 시작)
+INFERENCE_JOB_RETENTION_HOURS = int(os.getenv("INFERENCE_JOB_RETENTION_HOURS", "72")) # 끝난 작업(DONE/FAILED)과 결과를 보관하는 시간
+
+# 업로드 영수증 이미지 제한 / 전처리 (core/ingest.py)
+INFERENCE_UPLOAD_MAX_MB = int(os.getenv("INFERENCE_UPLOAD_MAX_MB", "20")) # 업로드 파일 최대 용량
+INFERENCE_MAX_IMAGE_PIXELS = int(os.getenv("INFERENCE_MAX_IMAGE_PIXELS", "60000000")) # 가로x세로 최대 픽셀 수 (디코딩 전 확인)
+INFERENCE_AUTO_CROP = os.getenv("INFERENCE_AUTO_CROP", "1").lower() in ("1", "true", "yes") # 영수증(밝은 종이) 영역만 잘라서 분석
+INFERENCE_SPLIT_RECEIPTS = os.getenv("INFERENCE_SPLIT_RECEIPTS", "1").lower() in ("1", "true", "yes") # 여러 장 찍힌 사진은 영수증별로 나눠 배치 추론 (core/receipt_split.py, opencv 필요)
+INFERENCE_MAX_RECEIPTS = int(os.getenv("INFERENCE_MAX_RECEIPTS", "10")) # 한 사진에서 나눌 최대 영수증 수
+
+# 추론 마이크로 배치 (core/inference.py)
+INFERENCE_BATCH_WINDOW_MS = int(os.getenv("INFERENCE_BATCH_WINDOW_MS", "20")) # 첫 요청 후 더 모으는 시간
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "4")) # 한 번에 generate 할 최대 이미지 수
+
+# 추론 단계별 시간 지표 (core/telemetry.py)
+# - GET /api/metrics/ : Prometheus 텍스트 형식 히스토그램 (아래 주소에서만 조회 가능, 쉼표로 구분)
+# - INFERENCE_DEBUG_TIMINGS=1 이면 upload_data 요청에 debug=1 을 붙였을 때 응답에 단계별 시간을 포함
+INFERENCE_METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.getenv("INFERENCE_METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip.strip()
+]
+INFERENCE_DEBUG_TIMINGS = os.getenv("INFERENCE_DEBUG_TIMINGS", "1" if DEBUG else "0").lower() in ("1", "true", "yes")
+
+# 로컬 모델 서버 (core/model_server.py)
+# INFERENCE_SERVER_SOCKET 을 지정하면 Django 워커는 모델을 올리지 않고, manage.py run_model_server 로 띄운
+# 서버 프로세스 하나에 Unix 소켓으로 이미지를 보냄 (워커 수만큼 모델 메모리 / 스레드가 늘지 않음)
+INFERENCE_SERVER_SOCKET = os.getenv("INFERENCE_SERVER_SOCKET", "") # 예: /run/myacademy/model.sock
+INFERENCE_SERVER_CONCURRENCY = int(os.getenv("INFERENCE_SERVER_CONCURRENCY", "8")) # 서버가 동시에 받는 요청 수
+INFERENCE_SERVER_TIMEOUT = float(os.getenv("INFERENCE_SERVER_TIMEOUT", "120")) # 요청 하나의 최대 대기 시간(초)
+INFERENCE_NUM_THREADS = int(os.getenv("INFERENCE_NUM_THREADS", "0")) # 연산당 스레드 수 (0: 코어 수)
+INFERENCE_INTEROP_THREADS = int(os.getenv("INFERENCE_INTEROP_THREADS", "1")) # 연산 간 병렬 스레드 수
+
+# AI 모델 로딩 (core/inference.py, core/model_store.py)
+# - INFERENCE_MODEL_DIR 에 스냅샷(manage.py snapshot_model)이 있으면 Hub 대신 이 폴더를 mmap 으로 읽음
+# - INFERENCE_PRELOAD=1 이면 서버 시작 시(CoreConfig.ready) 모델 로딩 + 워밍업까지 마침
+#   (gunicorn 은 --preload 와 함께 쓰면 마스터에서 한 번만 로딩하고 워커들이 가중치 페이지를 공유)
+INFERENCE_MODEL_DIR = Path(os.getenv("INFERENCE_MODEL_DIR", BASE_DIR / 'model_snapshot'))
+INFERENCE_PRELOAD = os.getenv("INFERENCE_PRELOAD", "0").lower() in ("1", "true", "yes")
+# CPU int8 동적 양자화: none(fp32) | decoder(디코더 Linear 만) | all(인코더까지)
+# 어떤 모드를 쓸지는 manage.py benchmark_inference 결과(지연 시간/필드 정확도)를 보고 결정
+INFERENCE_QUANTIZE = os.getenv("INFERENCE_QUANTIZE", "none").lower()
+
+# 영수증 JSON 스키마 제약 디코딩 (core/receipt_schema.py)
+# student / amount / date / type 형태를 벗어나는 토큰은 고르지 않고, JSON 이 닫히면 바로 멈춤
+INFERENCE_CONSTRAINED = os.getenv("INFERENCE_CONSTRAINED", "0").lower() in ("1", "true", "yes")
+
+# 디코딩 방식 (torch 백엔드): beam(기본, num_beams=4) | greedy | adaptive
+# adaptive 는 greedy 로 먼저 돌리고, 필드 신뢰도가 임계값 미만이거나 스키마에 맞지 않는 영수증만 beam 으로 재시도
+INFERENCE_DECODING = os.getenv("INFERENCE_DECODING", "beam").lower()
+INFERENCE_CONFIDENCE_THRESHOLD = float(os.getenv("INFERENCE_CONFIDENCE_THRESHOLD", "0.8"))
+
+# 생성 옵션 / 입력 해상도 (어떤 값이 나은지는 manage.py benchmark_inference 결과를 보고 결정)
+INFERENCE_NUM_BEAMS = int(os.getenv("INFERENCE_NUM_BEAMS", "4")) # beam / adaptive 의 beam 수
+INFERENCE_MAX_LENGTH = int(os.getenv("INFERENCE_MAX_LENGTH", "768")) # 생성 최대 토큰 수 (프롬프트 포함)
+INFERENCE_IMAGE_SIZE = os.getenv("INFERENCE_IMAGE_SIZE", "") # 입력 해상도 'HxW' (예: 960x720 = 학습 해상도). 빈 값이면 모델 설정 그대로
+
+# 추론 백엔드: torch(기본, transformers generate) | onnx(ONNX Runtime) | torchscript
+# onnx / torchscript 는 ai-engine/export_onnx.py 로 INFERENCE_EXPORT_DIR 에 내보낸 모델을 사용 (transformers 불필요)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+INFERENCE_EXPORT_DIR = Path(os.getenv("INFERENCE_EXPORT_DIR", BASE_DIR / 'model_export'))
+
+# 추론 결과 캐시 (core/result_cache.py): 같은 영수증 이미지는 모델을 다시 돌리지 않음
+# - 모델 ID / 리비전 / 백엔드 / 양자화 모드마다 따로 저장 (다른 모델의 결과는 쓰지 않음)
+# - 다른 모델의 캐시 폴더는 INFERENCE_CACHE_STALE_DAYS 일 동안 아무도 쓰지 않았을 때만 삭제
+INFERENCE_CACHE_ENABLED = os.getenv("INFERENCE_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+INFERENCE_CACHE_DIR = Path(os.getenv("INFERENCE_CACHE_DIR", BASE_DIR / 'inference_cache'))
+INFERENCE_CACHE_MAX_MB = int(os.getenv("INFERENCE_CACHE_MAX_MB", "50")) # 디스크 캐시 최대 용량
+INFERENCE_CACHE_MEMORY_ITEMS = int(os.getenv("INFERENCE_CACHE_MEMORY_ITEMS", "256")) # 메모리 LRU 항목 수
+INFERENCE_CACHE_STALE_DAYS = int(os.getenv("INFERENCE_CACHE_STALE_DAYS", "30"))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myacademy.settings')
 
 application = get_wsgi_application()
+
+# 이미지 분석 작업 워커 시작 (core/jobs.py, INFERENCE_JOB_WORKERS_AUTOSTART)
+from core.jobs import start_workers_at_boot  # noqa: E402
+
+start_workers_at_boot()